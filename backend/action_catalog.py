@@ -0,0 +1,414 @@
+"""
+Compiled, memory-mapped RPA action catalog.
+
+The detailed action JSON files are compiled once into a compact binary file
+that is opened with mmap, so looking actions up by id costs no parsing at
+startup and only touches the pages that are actually read.
+
+File layout (all integers little-endian uint32):
+
+    header      MAGIC, version, n_strings, n_actions, n_params,
+                strings_off, blob_off, actions_off, params_off, index_off, names_off
+    strings     n_strings + 1 offsets into the blob (string i = blob[o[i]:o[i+1]])
+    blob        UTF-8 bytes of every distinct string, stored once
+    actions     n_actions rows of (id, tool, category, description, param_start, param_count)
+    params      n_params rows of (kind, argument, type, description)
+    index       n_actions row numbers sorted by (category, action id) in UTF-8 bytes
+    names       n_actions row numbers sorted by action id, then source order
+
+An action is identified by its category (the package, for Automation Anywhere)
+and its name: names such as "Open" repeat across packages. get() takes the
+category to pick one; without it, the first action of that name in source
+order is returned, and get_all() returns every one.
+
+Usage:
+    python -m backend.action_catalog build [--tool power_automate]
+    python -m backend.action_catalog get power_automate "Create group"
+    python -m backend.action_catalog get automation_anywhere Open --category "Excel advanced package"
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"FPCAT\x00\x00\x01"
+VERSION = 2
+NONE = 0xFFFFFFFF
+
+_HEADER = struct.Struct("<8s10I")
+_ACTION_WIDTH = 6
+_PARAM_WIDTH = 4
+
+PARAM_KINDS = ("Input parameters", "Variables produced", "Exceptions")
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Source JSON and display name for each tool collection
+TOOL_SOURCES = {
+    "power_automate": ("power_automate_actions_detailed.json", "Power Automate"),
+    "automation_anywhere": ("automation_anywhere_actions_detailed.json", "Automation Anywhere"),
+}
+
+
+def catalog_path(tool: str) -> str:
+    return os.path.join(DATA_DIR, f"{tool}_actions.fpcat")
+
+
+def _normalize_actions(data: List[Dict], tool_name: str) -> List[Dict]:
+    """Flatten either source JSON shape into action dicts with parameter sections."""
+    if data and "actions" in data[0] and "package" in data[0]:
+        return [
+            {
+                "tool": tool_name,
+                "category": package.get("package", ""),
+                "action": action.get("name", "Unknown Action"),
+                "description": action.get("description", ""),
+            }
+            for package in data
+            for action in package.get("actions", [])
+        ]
+    return data
+
+
+def compile_catalog(actions: List[Dict], out_path: str) -> int:
+    """
+    Compile action dicts into a catalog file.
+
+    Args:
+        actions: Action dicts in the detailed JSON shape.
+        out_path: Destination file; written atomically.
+
+    Returns:
+        The number of actions written. An action listed again with the same
+        category, name and fields (the source repeats some packages) is written once.
+
+    Raises:
+        ValueError: Two different actions share a category and name.
+    """
+    strings: Dict[str, int] = {}
+    blob = bytearray()
+    offsets = [0]
+
+    def intern(value: Optional[str]) -> int:
+        if value is None:
+            return NONE
+        sid = strings.get(value)
+        if sid is None:
+            sid = strings[value] = len(offsets) - 1
+            blob.extend(value.encode("utf-8"))
+            offsets.append(len(blob))
+        return sid
+
+    action_rows: List[int] = []
+    param_rows: List[int] = []
+    keys: Dict[Tuple[bytes, bytes], int] = {}
+    firsts: Dict[Tuple[bytes, bytes], Dict] = {}
+    for action in actions:
+        action_id = action.get("action", "Unknown Action")
+        key = ((action.get("category") or "").encode("utf-8"), action_id.encode("utf-8"))
+        if key in keys:
+            if action != firsts[key]:
+                raise ValueError(f"Two different actions named {action_id!r} in category {action.get('category')!r}")
+            continue
+        keys[key] = len(keys)
+        firsts[key] = action
+        param_start = len(param_rows) // _PARAM_WIDTH
+        for kind, section in enumerate(PARAM_KINDS):
+            for param in action.get(section) or []:
+                name = param.get("Exception") if kind == 2 else param.get("Argument")
+                param_rows.extend((kind, intern(name), intern(param.get("Type")), intern(param.get("Description"))))
+        param_count = len(param_rows) // _PARAM_WIDTH - param_start
+        action_rows.extend((
+            intern(action_id),
+            intern(action.get("tool")),
+            intern(action.get("category")),
+            intern(action.get("description")),
+            param_start,
+            param_count,
+        ))
+
+    index = [row for _, row in sorted(keys.items())]
+    names = [row for (_, name), row in sorted(keys.items(), key=lambda item: (item[0][1], item[1]))]
+    blob.extend(b"\x00" * (-len(blob) % 4))
+
+    n_strings = len(offsets) - 1
+    strings_off = _HEADER.size
+    blob_off = strings_off + 4 * len(offsets)
+    actions_off = blob_off + len(blob)
+    params_off = actions_off + 4 * len(action_rows)
+    index_off = params_off + 4 * len(param_rows)
+    names_off = index_off + 4 * len(index)
+
+    # Workers may rebuild a stale catalog at the same time; each writes its own temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(
+                MAGIC, VERSION, n_strings, len(keys), len(param_rows) // _PARAM_WIDTH,
+                strings_off, blob_off, actions_off, params_off, index_off, names_off,
+            ))
+            for values in (offsets, None, action_rows, param_rows, index, names):
+                if values is None:
+                    f.write(blob)
+                else:
+                    f.write(struct.pack(f"<{len(values)}I", *values))
+        # mkstemp creates the file private to its owner
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(keys)
+
+
+def build_catalog(tool: str, out_path: Optional[str] = None) -> str:
+    """Compile the detailed JSON for a tool collection into its catalog file."""
+    source, tool_name = TOOL_SOURCES[tool]
+    with open(os.path.join(DATA_DIR, source), "r") as f:
+        actions = _normalize_actions(json.load(f), tool_name)
+    out_path = out_path or catalog_path(tool)
+    compile_catalog(actions, out_path)
+    return out_path
+
+
+class ParamRecord:
+    """A read-only view of one parameter row."""
+
+    __slots__ = ("_catalog", "_row")
+
+    def __init__(self, catalog: "Catalog", row: int):
+        self._catalog = catalog
+        self._row = row
+
+    def _field(self, col: int) -> Optional[str]:
+        return self._catalog._string(self._catalog._params[self._row * _PARAM_WIDTH + col])
+
+    @property
+    def section(self) -> str:
+        return PARAM_KINDS[self._catalog._params[self._row * _PARAM_WIDTH]]
+
+    @property
+    def argument(self) -> Optional[str]:
+        return self._field(1)
+
+    @property
+    def type(self) -> Optional[str]:
+        return self._field(2)
+
+    @property
+    def description(self) -> Optional[str]:
+        return self._field(3)
+
+    def to_dict(self) -> Dict[str, str]:
+        key = "Exception" if self.section == "Exceptions" else "Argument"
+        item = {key: self.argument, "Type": self.type, "Description": self.description}
+        return {k: v for k, v in item.items() if v is not None}
+
+
+class ActionRecord:
+    """A read-only view of one action; fields are decoded from the mmap on access."""
+
+    __slots__ = ("_catalog", "_row")
+
+    def __init__(self, catalog: "Catalog", row: int):
+        self._catalog = catalog
+        self._row = row
+
+    def _field(self, col: int) -> Optional[str]:
+        return self._catalog._string(self._catalog._actions[self._row * _ACTION_WIDTH + col])
+
+    @property
+    def action_id(self) -> str:
+        return self._field(0)
+
+    @property
+    def tool(self) -> Optional[str]:
+        return self._field(1)
+
+    @property
+    def category(self) -> Optional[str]:
+        return self._field(2)
+
+    @property
+    def description(self) -> Optional[str]:
+        return self._field(3)
+
+    @property
+    def parameters(self) -> List[ParamRecord]:
+        base = self._row * _ACTION_WIDTH
+        start, count = self._catalog._actions[base + 4], self._catalog._actions[base + 5]
+        return [ParamRecord(self._catalog, row) for row in range(start, start + count)]
+
+    def to_dict(self) -> Dict:
+        """The action in the detailed JSON shape."""
+        item = {
+            "tool": self.tool,
+            "category": self.category,
+            "action": self.action_id,
+            "description": self.description,
+        }
+        item = {k: v for k, v in item.items() if v is not None}
+        params = self.parameters
+        if params:
+            for section in PARAM_KINDS:
+                item[section] = [p.to_dict() for p in params if p.section == section]
+        return item
+
+    def __repr__(self) -> str:
+        return f"ActionRecord({self.action_id!r})"
+
+
+class Catalog:
+    """A compiled action catalog opened read-only via mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, n_strings, n_actions, n_params,
+         strings_off, blob_off, actions_off, params_off, index_off, names_off) = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} action catalog")
+        view = memoryview(self._mmap)
+        self._offsets = view[strings_off:blob_off].cast("I")
+        self._blob = view[blob_off:actions_off]
+        self._actions = view[actions_off:params_off].cast("I")
+        self._params = view[params_off:index_off].cast("I")
+        self._index = view[index_off:names_off].cast("I")
+        self._names = view[names_off:names_off + 4 * n_actions].cast("I")
+        self._n_actions = n_actions
+
+    def _string(self, sid: int) -> Optional[str]:
+        if sid == NONE:
+            return None
+        return str(self._blob[self._offsets[sid]:self._offsets[sid + 1]], "utf-8")
+
+    def _string_bytes(self, sid: int) -> bytes:
+        if sid == NONE:
+            return b""
+        return self._blob[self._offsets[sid]:self._offsets[sid + 1]].tobytes()
+
+    def _id_bytes(self, row: int) -> bytes:
+        return self._string_bytes(self._actions[row * _ACTION_WIDTH])
+
+    def _key_bytes(self, row: int) -> Tuple[bytes, bytes]:
+        return self._string_bytes(self._actions[row * _ACTION_WIDTH + 2]), self._id_bytes(row)
+
+    def _first_named(self, key: bytes) -> int:
+        """Position in the name index of the first action named key (or where it would be)."""
+        lo, hi = 0, self._n_actions
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_bytes(self._names[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, action_id: str, category: Optional[str] = None) -> Optional[ActionRecord]:
+        """
+        Look up an action by its exact id (binary search over a sorted index).
+
+        Args:
+            action_id: The action name.
+            category: The action's category; when omitted, the first action with
+                that name in source order.
+        """
+        if category is None:
+            records = self.get_all(action_id)
+            return records[0] if records else None
+        key = (category.encode("utf-8"), action_id.encode("utf-8"))
+        lo, hi = 0, self._n_actions
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_bytes(self._index[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n_actions:
+            row = self._index[lo]
+            if self._key_bytes(row) == key:
+                return ActionRecord(self, row)
+        return None
+
+    def get_all(self, action_id: str) -> List[ActionRecord]:
+        """Every action with a name, in source order (one per category that has it)."""
+        key = action_id.encode("utf-8")
+        records = []
+        position = self._first_named(key)
+        while position < self._n_actions and self._id_bytes(self._names[position]) == key:
+            records.append(ActionRecord(self, self._names[position]))
+            position += 1
+        return records
+
+    def __contains__(self, action_id: str) -> bool:
+        return self.get(action_id) is not None
+
+    def __len__(self) -> int:
+        return self._n_actions
+
+    def __iter__(self) -> Iterator[ActionRecord]:
+        """Actions in their original source order."""
+        return (ActionRecord(self, row) for row in range(self._n_actions))
+
+    def ids(self) -> List[str]:
+        """Action names in source order; a name shared by several categories appears once per category."""
+        return [self._string(self._actions[row * _ACTION_WIDTH]) for row in range(self._n_actions)]
+
+
+@lru_cache(maxsize=None)
+def load_catalog(tool: str) -> Catalog:
+    """
+    Open the compiled catalog for a tool collection.
+
+    The catalog is (re)compiled from the detailed JSON when it is missing, older
+    than its source or in an older format, so a fresh checkout works without a
+    build step.
+    """
+    path = catalog_path(tool)
+    source = os.path.join(DATA_DIR, TOOL_SOURCES[tool][0])
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+        build_catalog(tool, path)
+    try:
+        return Catalog(path)
+    except ValueError:
+        # Written by an older version of this module
+        build_catalog(tool, path)
+        return Catalog(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or query compiled RPA action catalogs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Compile the detailed JSON into catalog files")
+    build.add_argument("--tool", choices=sorted(TOOL_SOURCES), help="Only build this tool (default: all)")
+    get = sub.add_parser("get", help="Print one action as JSON")
+    get.add_argument("tool", choices=sorted(TOOL_SOURCES))
+    get.add_argument("action_id")
+    get.add_argument("--category", help="The action's category (package); default: every action with the name")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for tool in [args.tool] if args.tool else sorted(TOOL_SOURCES):
+            path = build_catalog(tool)
+            print(f"Built {len(Catalog(path))} actions into {path} ({os.path.getsize(path)} bytes)")
+    else:
+        catalog = load_catalog(args.tool)
+        if args.category is not None:
+            record = catalog.get(args.action_id, args.category)
+            records = [record] if record is not None else []
+        else:
+            records = catalog.get_all(args.action_id)
+        if not records:
+            sys.exit(f"Action '{args.action_id}' not found in {args.tool}")
+        for record in records:
+            print(json.dumps(record.to_dict(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+In-memory index of real action names used to post-check Tool Mapper output.
+
+Lookups run in three stages, cheapest first:
+
+    exact   normalized label -> action name (hash lookup)
+    prefix  longest action name that prefixes the label, word by word (trie),
+            e.g. "Send email to manager" -> "Send email"
+    fuzzy   trigram candidates ranked by Dice overlap, rescored by edit similarity,
+            e.g. "Launch Excell" -> "Launch Excel"
+
+A prefix hit is rescored by edit similarity too and only wins when no fuzzy
+candidate is closer, so "Send email via Outlook" maps to "Send email through
+Outlook" rather than to its prefix "Send email".
+
+No LLM call is involved, so every node label can be checked in microseconds.
+"""
+import copy
+import difflib
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from backend.action_catalog import load_catalog
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+TOOL_PREFIXES = ("power automate:", "automation anywhere:")
+
+# Flow terminals the mapper adds that are not catalog actions
+NON_ACTION_LABELS = frozenset({"start", "end", "stop", "begin", "finish"})
+
+# Fuzzy matches below this edit similarity are reported instead of snapped
+FUZZY_THRESHOLD = 0.75
+# A prefix match must cover at least this share of the label's words
+PREFIX_MIN_COVERAGE = 0.5
+
+
+def normalize_label(label: str) -> str:
+    """Lower-case, drop tool prefixes and collapse punctuation/whitespace."""
+    text = (label or "").replace("<br/>", " ").lower().strip()
+    for prefix in TOOL_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+    return _NON_ALNUM_RE.sub(" ", text).strip()
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Match(NamedTuple):
+    action: str
+    score: float
+    method: str  # "exact", "prefix" or "fuzzy"
+
+
+class ActionIndex:
+    """Exact, prefix and fuzzy lookup over the action names of one tool."""
+
+    def __init__(self, names: List[str]):
+        self._exact: Dict[str, str] = {}
+        self._trie: Dict = {}
+        self._grams: Dict[str, List[int]] = defaultdict(list)
+        self._keys: List[str] = []
+        self._names: List[str] = []
+        self._gram_counts: List[int] = []
+
+        for name in names:
+            key = normalize_label(name)
+            if not key or key in self._exact:
+                continue
+            self._exact[key] = name
+            node = self._trie
+            for word in key.split():
+                node = node.setdefault(word, {})
+            node[None] = name
+            row = len(self._keys)
+            self._keys.append(key)
+            self._names.append(name)
+            grams = _trigrams(key)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._grams[gram].append(row)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _prefix(self, key: str) -> Optional[Match]:
+        words = key.split()
+        node, best, depth = self._trie, None, 0
+        for i, word in enumerate(words, 1):
+            node = node.get(word)
+            if node is None:
+                break
+            if None in node:
+                best, depth = node[None], i
+        if best is not None and depth / len(words) >= PREFIX_MIN_COVERAGE:
+            return Match(best, depth / len(words), "prefix")
+        return None
+
+    def _fuzzy(self, key: str, limit: int = 8) -> Optional[Match]:
+        grams = _trigrams(key)
+        counts: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for row in self._grams.get(gram, ()):
+                counts[row] += 1
+        if not counts:
+            return None
+        # Dice coefficient on trigram sets narrows to a handful of candidates
+        n = len(grams)
+        candidates = sorted(
+            counts,
+            key=lambda row: 2 * counts[row] / (n + self._gram_counts[row]),
+            reverse=True,
+        )[:limit]
+        best_row, best_score = None, 0.0
+        for row in candidates:
+            score = difflib.SequenceMatcher(None, key, self._keys[row]).ratio()
+            if score > best_score:
+                best_row, best_score = row, score
+        return Match(self._names[best_row], best_score, "fuzzy")
+
+    def lookup(self, label: str) -> Optional[Match]:
+        """
+        Find the closest real action for a label.
+
+        Returns:
+            The best Match, or None when the label shares nothing with any action.
+            A prefix match is returned only when no fuzzy candidate is closer by
+            edit similarity. Fuzzy matches are returned regardless of score;
+            callers compare against FUZZY_THRESHOLD before snapping.
+        """
+        key = normalize_label(label)
+        if not key:
+            return None
+        name = self._exact.get(key)
+        if name is not None:
+            return Match(name, 1.0, "exact")
+        prefix, fuzzy = self._prefix(key), self._fuzzy(key)
+        if prefix is None:
+            return fuzzy
+        # A longer action that matches more of the label beats a short prefix of it
+        similarity = difflib.SequenceMatcher(None, key, normalize_label(prefix.action)).ratio()
+        if fuzzy is not None and fuzzy.action != prefix.action and fuzzy.score > similarity:
+            return fuzzy
+        return prefix
+
+
+@lru_cache(maxsize=None)
+def get_action_index(tool: str) -> ActionIndex:
+    """The action index for a tool collection, built once from its catalog."""
+    return ActionIndex(load_catalog(tool).ids())
+
+
+def validate_flow_nodes(nodes: List[Dict], tool: str) -> Tuple[List[Dict], Dict]:
+    """
+    Check every action node label against the real actions of a tool.
+
+    Exact matches are normalized to the canonical name, near-misses are snapped
+    to the closest action (the original label is kept in data.original_label),
+    and anything else is reported as unmatched. Decision nodes and start/end
+    terminals are skipped.
+
+    Args:
+        nodes: Mapping output nodes ({"id", "data": {"label"}, "shape"}).
+        tool: Tool collection name, e.g. "power_automate".
+
+    Returns:
+        A tuple of (validated copy of the nodes, report dict).
+    """
+    index = get_action_index(tool)
+    validated = copy.deepcopy(nodes)
+    report = {"checked": 0, "exact": 0, "snapped": [], "unmatched": []}
+
+    for node in validated:
+        data = node.get("data") or {}
+        label = data.get("label", "")
+        if node.get("shape") == "diamond" or normalize_label(label) in NON_ACTION_LABELS:
+            continue
+        report["checked"] += 1
+        match = index.lookup(label)
+        if match and (match.method != "fuzzy" or match.score >= FUZZY_THRESHOLD):
+            if match.method == "exact":
+                report["exact"] += 1
+            if match.action != label:
+                data["original_label"] = label
+                data["label"] = match.action
+                if match.method != "exact":
+                    report["snapped"].append({
+                        "id": node.get("id"),
+                        "label": label,
+                        "action": match.action,
+                        "method": match.method,
+                        "score": round(match.score, 3),
+                    })
+        else:
+            report["unmatched"].append({
+                "id": node.get("id"),
+                "label": label,
+                "closest": match.action if match else None,
+                "score": round(match.score, 3) if match else 0.0,
+            })
+    return validated, report
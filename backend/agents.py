@@ -5,7 +5,8 @@ def is_valid_mermaid_syntax(syntax: str) -> bool:
     """
     if not syntax:
         return False
-    lines = syntax.strip().splitlines()
+    # Directives such as the %%{init: ...}%% of generated diagrams may precede the graph
+    lines = [line for line in syntax.strip().splitlines() if not line.strip().startswith("%%")]
     if not lines or not lines[0].strip().startswith("graph TD"):
         return False
     # Check for at least one node or edge definition
@@ -17,13 +18,29 @@ from crewai import Agent, Task, Crew
 from crewai.tools import tool
 from crewai_tools import ScrapeWebsiteTool
 from backend.mermaid_syntax_search import search_mermaid_syntax
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_openai import ChatOpenAI
 from backend.services import search_rpa_actions
-from backend.diagram_generator import generate_mermaid_diagram # Added import
+from backend.diagram_generator import flow_mermaid
+from backend.flow_models import FlowGraph
+from backend.action_index import validate_flow_nodes
+from backend.intent_cache import get_intent_cache, format_retrieved_actions
+from backend.services import SEARCH_MODE, embed_query, embed_texts
+from backend.refinement import (FLOW_EDITS_FORMAT, STEP_EDITS_FORMAT, apply_flow_edits, apply_step_edits, compact_flow,
+                                describe_step_changes, number_steps, parse_edits)
+from backend.structured_steps import split_structured_steps
+from backend.parallel_mapping import map_steps_parallel
+from backend.structured_mapping import map_flow_structured
+from backend.tracing import CACHE_REQUESTS, TOOL_CALLS, CrewTimeline, count, count_token_usage, record_token_usage, span
+from backend.jobs import report_progress
+from backend.json_extract import MalformedOutput, extract_json_object, parse_flow
 
 import json
 
 import os
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+import time
 import logging
 from dotenv import load_dotenv
 
@@ -43,28 +60,65 @@ logger = logging.getLogger(__name__)
 # Add this line to check if the API key is loaded
 logger.info(f"OPENAI_API_KEY loaded: {bool(os.getenv('OPENAI_API_KEY'))}")
 
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    Counts the tokens of every LLM call against the crew task that made it.
+
+    crewAI only reports token usage for a whole crew. Counting each call
+    while a CrewTimeline is active lets the sequential crew report usage per
+    task (structuring, mapping, Mermaid validation).
+    """
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        usage = (response.llm_output or {}).get("token_usage")
+        if not usage:
+            # Newer langchain-openai reports usage on each message instead
+            usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    usage["prompt_tokens"] += metadata.get("input_tokens", 0)
+                    usage["completion_tokens"] += metadata.get("output_tokens", 0)
+                    usage["total_tokens"] += metadata.get("total_tokens", 0)
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            if usage.get(key):
+                count(f"llm.{key}", usage[key])
+
 # Initialize the LLM model with OpenAI
 llm = ChatOpenAI(
     model="gpt-5-nano-2025-08-07",
-    temperature=1
+    temperature=1,
+    callbacks=[TokenUsageHandler()]
 )
 
 # Add this line to check the llm object
 logger.info(f"LLM object initialized: {llm is not None}")
 logger.info(f"LLM model: {llm.model_name}")
 
-@tool("rpa_actions_search")
-def search_rpa_actions_tool(query: str) -> str:
-    """Search for RPA actions in the vector database."""
-    try:
-        result = search_rpa_actions(query)
-        if not result:
-            logger.error(f"RPA actions search returned empty for query: {query}")
-            return "ERROR: No RPA actions found for the query."
-        return result
-    except Exception as e:
-        logger.error(f"RPA actions search tool failed: {e}")
-        return f"ERROR: RPA actions search tool failed: {e}"
+def _count_tool_call(tool_name: str, outcome: str) -> None:
+    """Counts a tool call globally and against the running task."""
+    TOOL_CALLS.inc(tool=tool_name, outcome=outcome)
+    count(f"tool_calls.{tool_name}")
+
+def build_rpa_actions_search_tool(tool_choice: str):
+    """The `rpa_actions_search` tool, searching the collection of one toolset."""
+    @tool("rpa_actions_search")
+    def search_rpa_actions_tool(query: str) -> str:
+        """Search for RPA actions of the workflow's toolset in the vector database."""
+        with span("tool.rpa_actions_search", collection=tool_choice):
+            try:
+                result = search_rpa_actions(query, collection_name=tool_choice)
+                if not result:
+                    logger.error(f"RPA actions search returned empty for query: {query}")
+                    _count_tool_call("rpa_actions_search", "empty")
+                    return "ERROR: No RPA actions found for the query."
+                _count_tool_call("rpa_actions_search", "ok")
+                return result
+            except Exception as e:
+                logger.error(f"RPA actions search tool failed: {e}")
+                _count_tool_call("rpa_actions_search", "error")
+                return f"ERROR: RPA actions search tool failed: {e}"
+    return search_rpa_actions_tool
 
 # New tool for generating Mermaid syntax
 @tool("generate_mermaid_diagram_tool")
@@ -77,9 +131,15 @@ def generate_mermaid_diagram_tool(nodes_json: str, edges_json: str) -> str:
     Returns:
         A string containing the Mermaid.js syntax.
     """
-    nodes = json.loads(nodes_json)
-    edges = json.loads(edges_json)
-    return generate_mermaid_diagram(nodes, edges)
+    with span("tool.generate_mermaid_diagram"):
+        try:
+            graph = FlowGraph.from_dict({"nodes": json.loads(nodes_json), "edges": json.loads(edges_json)})
+            mermaid_syntax = flow_mermaid(graph)
+        except Exception:
+            _count_tool_call("generate_mermaid_diagram_tool", "error")
+            raise
+    _count_tool_call("generate_mermaid_diagram_tool", "ok")
+    return mermaid_syntax
 
 # Define the Requirement Structuring Agent
 requirement_structuring_agent = Agent(
@@ -95,17 +155,37 @@ requirement_structuring_agent = Agent(
 )
 
 # Define the Tool Mapper Agent
-tool_mapper_agent = Agent(
-    role="Tool Mapper",
-    goal="Translate high-level steps into a structured JSON format representing the workflow graph, specifically utilizing actions from the designated RPA toolset.",
-    backstory=(
-        "You are an expert in RPA tools and workflow design, with deep knowledge of specific platforms. You take a list of tasks and, using your expertise and access to the relevant toolset's actions, create a structured JSON representation of the workflow."
-    ),
-    llm=llm,
-    tools=[search_rpa_actions_tool],
-    allow_delegation=False,
-    verbose=True
-)
+def build_tool_mapper_agent(tool_choice: Optional[str] = None) -> Agent:
+    """
+    Creates a Tool Mapper agent.
+
+    Args:
+        tool_choice: Give the agent the `rpa_actions_search` tool over this toolset's
+            collection. Without it the candidate actions must be supplied in the task
+            description.
+
+    Returns:
+        A new agent; parallel mapping uses one per chunk so no agent state is shared.
+    """
+    return Agent(
+        role="Tool Mapper",
+        goal="Translate high-level steps into a structured JSON format representing the workflow graph, specifically utilizing actions from the designated RPA toolset.",
+        backstory=(
+            "You are an expert in RPA tools and workflow design, with deep knowledge of specific platforms. You take a list of tasks and, using your expertise and access to the relevant toolset's actions, create a structured JSON representation of the workflow."
+        ),
+        llm=llm,
+        tools=[build_rpa_actions_search_tool(tool_choice)] if tool_choice else [],
+        allow_delegation=False,
+        verbose=True
+    )
+
+@lru_cache(maxsize=None)
+def tool_mapper_agent(tool_choice: str) -> Agent:
+    """The sequential Tool Mapper of a toolset, whose searches stay within that toolset's actions."""
+    return build_tool_mapper_agent(tool_choice)
+
+# Tool Mapper variant for cached intents: the candidate actions are already in the prompt
+cached_tool_mapper_agent = build_tool_mapper_agent()
 
 # Instantiate the ScrapeWebsiteTool
 scrape_tool = ScrapeWebsiteTool()
@@ -113,15 +193,19 @@ scrape_tool = ScrapeWebsiteTool()
 @tool("mermaid_syntax_search_tool")
 def mermaid_syntax_search_tool(query: str) -> str:
     """Search for Mermaid.js syntax in the vector database collection."""
-    try:
-        results = search_mermaid_syntax(query)
-        if not results:
-            logger.error(f"Mermaid syntax search returned empty for query: {query}")
-            return "ERROR: No Mermaid syntax found for the query."
-        return results[0]
-    except Exception as e:
-        logger.error(f"Mermaid syntax search tool failed: {e}")
-        return f"ERROR: Mermaid syntax search tool failed: {e}"
+    with span("tool.mermaid_syntax_search"):
+        try:
+            results = search_mermaid_syntax(query)
+            if not results:
+                logger.error(f"Mermaid syntax search returned empty for query: {query}")
+                _count_tool_call("mermaid_syntax_search_tool", "empty")
+                return "ERROR: No Mermaid syntax found for the query."
+            _count_tool_call("mermaid_syntax_search_tool", "ok")
+            return results[0]
+        except Exception as e:
+            logger.error(f"Mermaid syntax search tool failed: {e}")
+            _count_tool_call("mermaid_syntax_search_tool", "error")
+            return f"ERROR: Mermaid syntax search tool failed: {e}"
 
 # Define the Mermaid Syntax Expert Agent
 mermaid_syntax_expert = Agent(
@@ -138,34 +222,11 @@ mermaid_syntax_expert = Agent(
     verbose=True
 )
 
-def run_crew(query: str, tool_choice: str):
-    """
-    Runs the Crew to process a user query.
-
-    Args:
-        query: The user's query.
-
-    Returns:
-        The result of the crew execution.
-    """
-    # Define the tasks
-    structuring_task = Task(
-        description=f"Analyze the following user query and break it down into a list of simple, clear, and actionable steps. Query: {query}",
-        agent=requirement_structuring_agent,
-        expected_output="A numbered list of clear, step-by-step tasks for an RPA workflow."
-    )
-
-    mapping_task_description = f"""Take the structured list of tasks and create a flowchart structure in a JSON format using the '{tool_choice}' toolset.
-        **IMPORTANT**: Use the `rpa_actions_search` tool to find relevant actions for the '{tool_choice}' toolset.
-        The JSON should have 'nodes' and 'edges' keys.
+MAPPING_JSON_FORMAT = """The JSON should have 'nodes' and 'edges' keys.
         Each node should have an 'id', 'data' with a 'label' (which should be the exact action name), and a 'shape' ('rectangle' for actions, 'diamond' for decisions).
         Each edge should have an 'id', 'source', and 'target', and an optional 'label' for conditional branches ('True' or 'False')."""
 
-    mapping_task = Task(
-        description=mapping_task_description,
-        agent=tool_mapper_agent,
-        context=[structuring_task],
-        expected_output="""A JSON object with 'nodes' and 'edges' that represents the workflow diagram.
+MAPPING_EXPECTED_OUTPUT = """A JSON object with 'nodes' and 'edges' that represents the workflow diagram.
     Example:
     {
         "nodes": [
@@ -176,7 +237,232 @@ def run_crew(query: str, tool_choice: str):
             { "id": "e1-2", "source": "1", "target": "2", "label": "" }
         ]
     }"""
+
+# Mapping mode: "sequential" maps all steps in one conversation, "parallel" maps chunks concurrently,
+# "structured" maps all steps in one JSON-schema-constrained completion (backend/structured_mapping.py)
+MAPPING_MODES = ("sequential", "parallel", "structured")
+MAPPING_MODE = os.getenv("MAPPING_MODE", "sequential")
+# Run the Mermaid expert after the sequential crew's mapping; otherwise the diagram is generated from the nodes
+MERMAID_VALIDATION = os.getenv("MERMAID_VALIDATION", "true").lower() in ("1", "true", "yes")
+PARALLEL_CHUNK_SIZE = int(os.getenv("PARALLEL_CHUNK_SIZE", "2"))
+PARALLEL_MAX_WORKERS = int(os.getenv("PARALLEL_MAX_WORKERS", "8"))
+# Times a mapping task is sent back to fix output that is not a valid flow
+FLOW_OUTPUT_RETRIES = int(os.getenv("FLOW_OUTPUT_RETRIES", "1"))
+
+def _task_callback(timeline: CrewTimeline, stage: str, next_stage: str, output_key: str = None):
+    """A Task callback that records the task's span and reports its output to the running job."""
+    record = timeline.callback(stage)
+    def on_task_done(output) -> None:
+        record(output)
+        report_progress(next_stage, **({output_key: output.raw} if output_key else {}))
+    return on_task_done
+
+def _structuring_task(query: str, callback=None) -> Task:
+    return Task(
+        description=f"Analyze the following user query and break it down into a list of simple, clear, and actionable steps. Query: {query}",
+        agent=requirement_structuring_agent,
+        expected_output="A numbered list of clear, step-by-step tasks for an RPA workflow.",
+        callback=callback
+    )
+
+def run_structuring(query: str) -> str:
+    """
+    Runs only the Requirement Analyst on a query.
+
+    Args:
+        query: The user's query.
+
+    Returns:
+        The structured list of steps.
+    """
+    with span("crew.structuring") as crew_span:
+        timeline = CrewTimeline()
+        structuring_task = _structuring_task(query, callback=timeline.callback("structuring"))
+        with timeline.active():
+            result = Crew(agents=[requirement_structuring_agent], tasks=[structuring_task], verbose=True).kickoff()
+        record_token_usage("structuring", getattr(result, "token_usage", None), crew_span)
+    return structuring_task.output.raw
+
+def _lookup_cached_intent(query: str, tool_choice: str):
+    """Returns the precomputed intent for a query, or None on a miss or when no cache is built."""
+    intent_cache = get_intent_cache()
+    if intent_cache is None:
+        return None
+    with span("intent_cache.lookup", tool_choice=tool_choice) as lookup_span:
+        started = time.perf_counter()
+        entry = None
+        try:
+            entry = intent_cache.lookup(embed_query(query), tool_choice)
+        except Exception as e:
+            logger.error(f"Intent cache lookup failed: {e}")
+        intent_cache.record(entry, time.perf_counter() - started)
+        lookup_span.set_attribute("hit", entry is not None)
+    CACHE_REQUESTS.inc(cache="intent", result="hit" if entry is not None else "miss")
+    if entry is not None:
+        logger.info(f"Intent cache hit: intent {entry['intent_id']} (similarity {entry['similarity']:.3f})")
+    return entry
+
+def _parse_flow_json(flow_diagram_json_str: str) -> dict:
+    """Parses mapping output into a flow dict; output without a JSON object yields an empty flow."""
+    if not flow_diagram_json_str:
+        return {}
+    try:
+        return parse_flow(flow_diagram_json_str)
+    except MalformedOutput as e:
+        error = e
+    try:
+        # Keep an object that breaks the schema; the diagram tools cope with what they can
+        flow_diagram_json = extract_json_object(flow_diagram_json_str)
+    except MalformedOutput:
+        logger.error(f"Error processing flow diagram: {error}")
+        return {}
+    logger.warning(f"Flow diagram does not match the schema: {error}")
+    return flow_diagram_json
+
+def _flow_output_guardrail():
+    """
+    A mapping task guardrail: valid flows are passed on as plain JSON; invalid ones go
+    back to the agent with the problem, up to FLOW_OUTPUT_RETRIES times.
+    """
+    attempts = 0
+    def check_flow_output(output) -> Tuple[bool, Any]:
+        nonlocal attempts
+        attempts += 1
+        try:
+            return True, json.dumps(parse_flow(output.raw))
+        except MalformedOutput as e:
+            count("flow_output.invalid")
+            if attempts > FLOW_OUTPUT_RETRIES:
+                # Out of retries: let the pipeline salvage what it can rather than fail the run
+                logger.error(f"Mapping output still invalid after {FLOW_OUTPUT_RETRIES} retries: {e}")
+                return True, output.raw
+            logger.warning(f"Mapping output invalid, asking for a fix: {e}")
+            return False, f"{e}. Return only the JSON object with 'nodes' and 'edges', without any other text."
+    return check_flow_output
+
+def _map_chunk(chunk, first_step: int, total_steps: int, query: str, tool_choice: str, cached_intent) -> dict:
+    """Maps one chunk of steps with its own Tool Mapper agent and retrieval."""
+    last_step = first_step + len(chunk) - 1
+    steps = "\n".join(f"        {first_step + i}. {step}" for i, step in enumerate(chunk))
+    terminals = []
+    if first_step > 1:
+        terminals.append("Do not add a Start node.")
+    if last_step < total_steps:
+        terminals.append("Do not add an End node; a decision may have a single branch when the other continues with the following steps.")
+
+    if cached_intent is not None:
+        chunk_actions = {**cached_intent, "retrieved_actions": [
+            item for item in cached_intent["retrieved_actions"] if item["step"] in chunk
+        ]}
+        retrieval = f"Relevant '{tool_choice}' actions for these steps (choose node labels from these):\n        {format_retrieved_actions(chunk_actions)}"
+        agent = build_tool_mapper_agent()
+    else:
+        retrieval = f"**IMPORTANT**: Use the `rpa_actions_search` tool to find relevant actions for the '{tool_choice}' toolset."
+        agent = build_tool_mapper_agent(tool_choice)
+
+    timeline = CrewTimeline()
+    mapping_task = Task(
+        description=f"""Create a flowchart structure in a JSON format using the '{tool_choice}' toolset for ONLY steps {first_step}-{last_step} of a {total_steps}-step workflow. The other steps are mapped separately and joined afterwards.
+        User query: {query}
+        Steps to map:
+{steps}
+        {" ".join(terminals)}
+        {retrieval}
+        {MAPPING_JSON_FORMAT}""",
+        agent=agent,
+        expected_output=MAPPING_EXPECTED_OUTPUT,
+        guardrail=_flow_output_guardrail(),
+        guardrail_max_retries=FLOW_OUTPUT_RETRIES,
+        callback=timeline.callback("mapping")
     )
+    with span("crew.map_chunk", first_step=first_step, steps=len(chunk)) as crew_span:
+        with timeline.active():
+            result = Crew(agents=[agent], tasks=[mapping_task], verbose=True).kickoff()
+        record_token_usage("mapping", getattr(result, "token_usage", None), crew_span)
+    return _parse_flow_json(mapping_task.output.raw)
+
+def _run_parallel_mapping(query: str, tool_choice: str, cached_intent):
+    """Structures the query, then maps its steps in concurrent chunks and stitches the flow."""
+    if cached_intent is not None:
+        structured_requirements = cached_intent["structured_requirements"]
+    else:
+        structured_requirements = run_structuring(query)
+    report_progress("mapping", structured_requirements=structured_requirements)
+    steps = split_structured_steps(structured_requirements)
+    logger.info(f"Mapping {len(steps)} steps in parallel chunks of {PARALLEL_CHUNK_SIZE}.")
+    flow = map_steps_parallel(
+        steps,
+        lambda chunk, first_step, total_steps: _map_chunk(chunk, first_step, total_steps, query, tool_choice, cached_intent),
+        chunk_size=PARALLEL_CHUNK_SIZE,
+        max_workers=PARALLEL_MAX_WORKERS,
+    )
+    return structured_requirements, json.dumps(flow)
+
+def _run_structured_mapping(query: str, tool_choice: str, cached_intent):
+    """Structures the query, retrieves actions for every step up front, then maps them in one schema-constrained call."""
+    if cached_intent is not None:
+        structured_requirements = cached_intent["structured_requirements"]
+        retrieved = cached_intent["retrieved_actions"]
+    else:
+        structured_requirements = run_structuring(query)
+        report_progress("mapping", structured_requirements=structured_requirements)
+        retrieved, _ = _retrieve_for_steps(split_structured_steps(structured_requirements), tool_choice, {})
+    prompt = f"""Map this workflow using the '{tool_choice}' toolset.
+User query: {query}
+
+Structured tasks:
+{structured_requirements}
+
+Relevant '{tool_choice}' actions for each step (choose node labels from these):
+{format_retrieved_actions({"retrieved_actions": retrieved})}"""
+    with span("llm.structured_mapping", steps=len(retrieved)) as llm_span:
+        try:
+            flow, usage = map_flow_structured(prompt, llm.model_name, llm.temperature)
+        except MalformedOutput as e:
+            logger.error(f"Structured mapping failed: {e}")
+            return structured_requirements, ""
+        record_token_usage("mapping", usage, llm_span)
+    return structured_requirements, json.dumps(flow)
+
+def _run_sequential_crew(query: str, tool_choice: str, cached_intent):
+    """Runs structuring (unless cached), mapping and Mermaid validation in one sequential crew."""
+    timeline = CrewTimeline()
+
+    # Define the tasks
+    if cached_intent is not None:
+        # Structuring and retrieval were precomputed for this intent
+        structuring_task = None
+        mapping_task = Task(
+            description=f"""Take the following structured list of tasks and create a flowchart structure in a JSON format using the '{tool_choice}' toolset.
+        User query: {query}
+        Structured tasks:
+        {cached_intent["structured_requirements"]}
+
+        Relevant '{tool_choice}' actions for each step (choose node labels from these):
+        {format_retrieved_actions(cached_intent)}
+
+        {MAPPING_JSON_FORMAT}""",
+            agent=cached_tool_mapper_agent,
+            expected_output=MAPPING_EXPECTED_OUTPUT,
+            guardrail=_flow_output_guardrail(),
+            guardrail_max_retries=FLOW_OUTPUT_RETRIES,
+            callback=_task_callback(timeline, "mapping", "mermaid_validation", "flow_diagram_json")
+        )
+    else:
+        structuring_task = _structuring_task(
+            query, callback=_task_callback(timeline, "structuring", "mapping", "structured_requirements")
+        )
+        mapping_task = Task(
+            description=f"""Take the structured list of tasks and create a flowchart structure in a JSON format using the '{tool_choice}' toolset.
+        **IMPORTANT**: Use the `rpa_actions_search` tool to find relevant actions for the '{tool_choice}' toolset.
+        {MAPPING_JSON_FORMAT}""",
+            agent=tool_mapper_agent(tool_choice),
+            context=[structuring_task],
+            expected_output=MAPPING_EXPECTED_OUTPUT,
+            guardrail=_flow_output_guardrail(),
+            guardrail_max_retries=FLOW_OUTPUT_RETRIES,
+            callback=_task_callback(timeline, "mapping", "mermaid_validation", "flow_diagram_json")
+        )
 
     mermaid_validation_task = Task(
         description="""
@@ -190,52 +476,218 @@ def run_crew(query: str, tool_choice: str):
         """,
         agent=mermaid_syntax_expert,
         context=[mapping_task],
-        expected_output="A valid Mermaid.js syntax string."
+        expected_output="A valid Mermaid.js syntax string.",
+        callback=timeline.callback("mermaid_validation")
     )
 
-    # Create a crew for the first two tasks
+    tasks = [mapping_task, mermaid_validation_task] if MERMAID_VALIDATION else [mapping_task]
+    if structuring_task is not None:
+        tasks.insert(0, structuring_task)
     crew = Crew(
-        agents=[requirement_structuring_agent, tool_mapper_agent, mermaid_syntax_expert],
-        tasks=[structuring_task, mapping_task, mermaid_validation_task],
+        agents=[task.agent for task in tasks],
+        tasks=tasks,
         verbose=True
     )
 
-    result = crew.kickoff()
+    with span("crew.sequential", tasks=len(tasks)) as crew_span:
+        with timeline.active():
+            result = crew.kickoff()
+        if timeline.token_usage:
+            # Counted per task by TokenUsageHandler; the crew span keeps the crew's total
+            for stage, usage in timeline.token_usage.items():
+                count_token_usage(stage, usage)
+            record_token_usage(None, getattr(result, "token_usage", None), crew_span)
+        else:
+            # An LLM that reports no usage per call: only the crew's total is known
+            record_token_usage("sequential", getattr(result, "token_usage", None), crew_span)
 
     # Extract the outputs from the tasks
-    structured_requirements = structuring_task.output.raw
-    mapped_actions = ""
+    if structuring_task is None:
+        structured_requirements = cached_intent["structured_requirements"]
+    else:
+        structured_requirements = structuring_task.output.raw
     flow_diagram_json_str = mapping_task.output.raw
-    mermaid_syntax = mermaid_validation_task.output.raw
+    mermaid_syntax = mermaid_validation_task.output.raw if MERMAID_VALIDATION else ""
+    return structured_requirements, flow_diagram_json_str, mermaid_syntax
+
+def run_crew(query: str, tool_choice: str, mapping_mode: str = MAPPING_MODE):
+    """
+    Runs the Crew to process a user query.
+
+    Args:
+        query: The user's query.
+        tool_choice: The RPA tool collection to map actions from.
+        mapping_mode: "sequential", "parallel" or "structured".
+
+    Returns:
+        The result of the crew execution.
+    """
+    if mapping_mode not in MAPPING_MODES:
+        raise ValueError(f"Unknown mapping mode: {mapping_mode}")
+    with span("run_crew", tool_choice=tool_choice, mapping_mode=mapping_mode):
+        return _run_crew(query, tool_choice, mapping_mode)
+
+def _run_crew(query: str, tool_choice: str, mapping_mode: str):
+    report_progress("structuring")
+    cached_intent = _lookup_cached_intent(query, tool_choice)
+    if cached_intent is not None:
+        report_progress("mapping", structured_requirements=cached_intent["structured_requirements"])
 
+    if mapping_mode == "parallel":
+        structured_requirements, flow_diagram_json_str = _run_parallel_mapping(query, tool_choice, cached_intent)
+        # Stitched flows skip the Mermaid expert; the diagram is generated from the nodes below
+        mermaid_syntax = ""
+    elif mapping_mode == "structured":
+        structured_requirements, flow_diagram_json_str = _run_structured_mapping(query, tool_choice, cached_intent)
+        mermaid_syntax = ""
+    else:
+        structured_requirements, flow_diagram_json_str, mermaid_syntax = _run_sequential_crew(query, tool_choice, cached_intent)
+
+    report_progress("finalizing", flow_diagram_json=flow_diagram_json_str)
+    result = _finalize_flow(flow_diagram_json_str, mermaid_syntax, tool_choice)
+    return {
+        "structured_requirements": structured_requirements,
+        **result,
+        "intent_cache": {"intent_id": cached_intent["intent_id"], "similarity": cached_intent["similarity"]} if cached_intent else None,
+    }
+
+def _finalize_flow(flow_diagram_json_str: str, mermaid_syntax: str, tool_choice: str) -> dict:
+    """Snaps mapped labels to the toolset's actions and makes sure the flow has valid Mermaid syntax."""
+    flow_diagram_json = _parse_flow_json(flow_diagram_json_str)
+    nodes = flow_diagram_json.get("nodes", [])
+    edges = flow_diagram_json.get("edges", [])
+
+    # Check node labels against the real actions of the toolset and snap near-misses
+    action_validation = None
     try:
-        if flow_diagram_json_str:
-            flow_diagram_json = json.loads(flow_diagram_json_str)
-            nodes = flow_diagram_json.get("nodes", [])
-            edges = flow_diagram_json.get("edges", [])
-        else:
-            flow_diagram_json = {}
-            nodes = []
-            edges = []
-    except (json.JSONDecodeError, AttributeError) as e:
-        logger.error(f"Error processing flow diagram: {e}")
-        flow_diagram_json = {}
-        nodes = []
-        edges = []
+        with span("validate_actions", nodes=len(nodes)):
+            nodes, action_validation = validate_flow_nodes(nodes, tool_choice)
+    except Exception as e:
+        logger.error(f"Error validating mapped actions: {e}")
+    if action_validation:
+        if action_validation["unmatched"]:
+            logger.warning(f"Unmatched action labels: {[n['label'] for n in action_validation['unmatched']]}")
+        if action_validation["snapped"]:
+            logger.info(f"Snapped {len(action_validation['snapped'])} action labels to catalog names.")
+            # The Mermaid expert saw the unsnapped labels; regenerate from the corrected nodes
+            mermaid_syntax = ""
+
+    # One snapshot of the flow serves the Mermaid fallback and the flow returned to the API
+    graph = FlowGraph.from_dict({"nodes": nodes, "edges": edges})
+    if not mermaid_syntax:
+        with span("generate_mermaid_diagram", nodes=len(graph)):
+            mermaid_syntax = flow_mermaid(graph)
 
     # Validate Mermaid syntax and fallback if needed
     if not is_valid_mermaid_syntax(mermaid_syntax):
         logger.warning("Invalid Mermaid syntax detected. Falling back to internal generation.")
+        with span("generate_mermaid_diagram", nodes=len(graph), fallback=True):
+            mermaid_syntax = flow_mermaid(graph)
+        if not is_valid_mermaid_syntax(mermaid_syntax):
+            logger.error("Fallback Mermaid syntax is also invalid.")
+
+    return {
+        "flow_diagram_json": graph.to_dict(),
+        "mermaid_syntax": mermaid_syntax,
+        "action_validation": action_validation,
+    }
+
+def _retrieve_for_steps(steps, tool_choice: str, retrieval_cache: dict):
+    """Retrieved actions for each step, searching only for steps the session has not seen; returns (items, reused)."""
+    missing = [step for step in dict.fromkeys(steps) if step not in retrieval_cache]
+    if missing:
+        with span("retrieve_steps", steps=len(missing)):
+            # One embedding request for all new steps
+            embeddings = embed_texts(missing) if SEARCH_MODE != "keyword" else [None] * len(missing)
+            for step, embedding in zip(missing, embeddings):
+                results = search_rpa_actions(step, collection_name=tool_choice, query_embedding=embedding)
+                retrieval_cache[step] = {"step": step, "ids": results["ids"][0], "documents": results["documents"][0]}
+    CACHE_REQUESTS.inc(len(steps) - len(missing), cache="retrieval", result="hit")
+    CACHE_REQUESTS.inc(len(missing), cache="retrieval", result="miss")
+    return [retrieval_cache[step] for step in steps], len(steps) - len(missing)
+
+def run_refinement(query: str, tool_choice: str, previous: dict, retrieval_cache: dict):
+    """
+    Applies a follow-up message to the previous turn's steps and flow with two delta tasks.
+
+    See backend/refinement.py. Falls back to run_crew on the previous prompts and the
+    message when the model's edits cannot be applied.
+
+    Args:
+        query: The follow-up message.
+        tool_choice: The RPA tool collection to map actions from.
+        previous: The previous turn's "query" (all prompts so far), "structured_requirements"
+            and "flow" ({"nodes", "edges"}).
+        retrieval_cache: Retrieved actions by step text, kept across the turns of a session;
+            new retrievals are added to it.
+
+    Returns:
+        A result shaped like run_crew's, with "refinement" counts of edited steps and
+        retrieved and reused actions.
+    """
+    with span("run_refinement", tool_choice=tool_choice):
         try:
-            from backend.diagram_generator import generate_mermaid_diagram
-            mermaid_syntax = generate_mermaid_diagram(nodes, edges)
-            if not is_valid_mermaid_syntax(mermaid_syntax):
-                logger.error("Fallback Mermaid syntax is also invalid.")
-        except Exception as e:
-            logger.error(f"Error in fallback Mermaid generation: {e}")
+            return _run_refinement(query, tool_choice, previous, retrieval_cache)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Delta refinement failed, rerunning the full pipeline: {e}")
+    return run_crew(f"{previous['query']}\n{query}", tool_choice)
+
+def _run_refinement(query: str, tool_choice: str, previous: dict, retrieval_cache: dict):
+    report_progress("structuring")
+    steps = split_structured_steps(previous["structured_requirements"])
+    timeline = CrewTimeline()
+    structuring_task = Task(
+        description=f"""The user's automation request was already broken down into these steps:
+        {number_steps(steps)}
+
+        The user now asks for a change: {query}
 
+        {STEP_EDITS_FORMAT}""",
+        agent=requirement_structuring_agent,
+        expected_output='A JSON object {"edits": [...]} with only the changed steps.',
+        callback=timeline.callback("structuring")
+    )
+    with span("crew.refine_steps") as crew_span:
+        with timeline.active():
+            result = Crew(agents=[requirement_structuring_agent], tasks=[structuring_task], verbose=True).kickoff()
+        record_token_usage("refine_steps", getattr(result, "token_usage", None), crew_span)
+    new_steps, changes = apply_step_edits(steps, parse_edits(structuring_task.output.raw).get("edits") or [])
+    structured_requirements = number_steps(new_steps)
+    report_progress("mapping", structured_requirements=structured_requirements)
+
+    flow = {"nodes": previous["flow"]["nodes"], "edges": previous["flow"]["edges"]}
+    retrieved, reused = [], 0
+    if changes:
+        retrieved, reused = _retrieve_for_steps([c["text"] for c in changes if "text" in c], tool_choice, retrieval_cache)
+        mapping_task = Task(
+            description=f"""The following workflow is already mapped to a flowchart of '{tool_choice}' actions.
+        Current flow (nodes as "id [shape] label", then edges as "source -> target (label)"):
+        {compact_flow(flow)}
+
+        The user asked: {query}
+        These steps changed:
+        {describe_step_changes(changes)}
+
+        Relevant '{tool_choice}' actions for the new and changed steps (choose node labels from these):
+        {format_retrieved_actions({"retrieved_actions": retrieved}) or "(none)"}
+
+        Update only the nodes and edges of the changed steps. {FLOW_EDITS_FORMAT}""",
+            agent=cached_tool_mapper_agent,
+            expected_output="A JSON object with only the added, updated and removed nodes and edges.",
+            callback=timeline.callback("mapping")
+        )
+        with span("crew.refine_flow", changes=len(changes)) as crew_span:
+            with timeline.active():
+                result = Crew(agents=[cached_tool_mapper_agent], tasks=[mapping_task], verbose=True).kickoff()
+            record_token_usage("refine_flow", getattr(result, "token_usage", None), crew_span)
+        flow = apply_flow_edits(flow, parse_edits(mapping_task.output.raw))
+
+    flow_diagram_json_str = json.dumps(flow)
+    report_progress("finalizing", flow_diagram_json=flow_diagram_json_str)
     return {
         "structured_requirements": structured_requirements,
-        "flow_diagram_json": flow_diagram_json_str,
-        "mermaid_syntax": mermaid_syntax,
-    }
\ No newline at end of file
+        # Delta turns skip the Mermaid expert; the diagram is generated from the nodes
+        **_finalize_flow(flow_diagram_json_str, "", tool_choice),
+        "intent_cache": None,
+        "refinement": {"step_changes": len(changes), "retrieved": len(retrieved) - reused, "reused": reused},
+    }
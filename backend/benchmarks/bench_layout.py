@@ -0,0 +1,133 @@
+"""
+Layout time, edge crossings and drawing size of the flow layout engines on synthetic DAGs.
+
+    * rank: the original layout_graph, BFS ranks with each rank ordered by id;
+    * layered: the Sugiyama layout of backend/layered_layout.py.
+
+The synthetic flows look like generated workflows. Each step continues from
+one of the few steps before it. A fraction of steps are decisions with a
+second branch that jumps a few steps ahead, and a few edges loop back, like
+retry paths. Labels are random action-like phrases, so node widths vary as
+they do in real flows.
+
+Crossings are counted the same way for both engines: straight segments
+between node centres (bottom of the source to top of the target) that
+cross between two rows.
+
+Usage:
+    python -m backend.benchmarks.bench_layout [--sizes 20,100,500,2000,5000] [--engines rank,layered]
+        [--repeat 3] [--json out.json]
+"""
+import argparse
+import bisect
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from backend import diagram_generator
+from backend.diagram_generator import layout_graph
+
+WORDS = ("open", "read", "write", "excel", "worksheet", "row", "send", "email", "invoice", "file", "folder",
+         "download", "upload", "sftp", "browser", "click", "element", "extract", "table", "set", "variable",
+         "approve", "check", "status", "wait", "close", "database", "query", "record", "report")
+
+
+def synthetic_flow(size: int, rng: random.Random, decision_rate: float = 0.15, loop_rate: float = 0.02) -> Dict:
+    nodes, edges = [], []
+    for i in range(size):
+        decision = i > 0 and rng.random() < decision_rate
+        label = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).capitalize()
+        nodes.append({"id": str(i), "data": {"label": label + ("?" if decision else "")},
+                      "shape": "diamond" if decision else "rectangle"})
+        if i:
+            edges.append({"source": str(rng.randint(max(0, i - 3), i - 1)), "target": str(i)})
+    for node in nodes:
+        i = int(node["id"])
+        if node["shape"] == "diamond" and i + 2 < size:
+            edges.append({"source": node["id"], "target": str(rng.randint(i + 2, min(size - 1, i + 6))), "label": "No"})
+        if i > 4 and rng.random() < loop_rate:
+            edges.append({"source": node["id"], "target": str(rng.randint(max(0, i - 6), i - 2)), "label": "Retry"})
+    return {"nodes": nodes, "edges": edges}
+
+
+def straight_line_crossings(nodes: List[Dict], edges: List[Dict]) -> int:
+    """Crossings of straight edge segments, counted as inversions in every band between two rows."""
+    by_id = {node["id"]: node["position"] for node in nodes}
+    rows = sorted({pos["y"] for pos in by_id.values()})
+    bands: Dict[int, List[Tuple[float, float]]] = {}
+    for edge in edges:
+        s, t = by_id.get(edge["source"]), by_id.get(edge["target"])
+        if s is None or t is None or s["y"] == t["y"]:
+            continue
+        if s["y"] > t["y"]:
+            s, t = t, s
+        # From the bottom centre of the upper node to the top centre of the lower one
+        x1, y1 = s["x"] + s["width"] / 2, s["y"] + s["height"]
+        x2, y2 = t["x"] + t["width"] / 2, t["y"]
+        if y2 <= y1:
+            continue
+        for band in range(bisect.bisect_right(rows, s["y"]) - 1, bisect.bisect_left(rows, t["y"])):
+            top, bottom = max(rows[band], y1), min(rows[band + 1], y2)
+            bands.setdefault(band, []).append((x1 + (x2 - x1) * (top - y1) / (y2 - y1),
+                                               x1 + (x2 - x1) * (bottom - y1) / (y2 - y1)))
+    crossings = 0
+    for entries in bands.values():
+        entries.sort()
+        seen: List[float] = []
+        for _, value in entries:
+            position = bisect.bisect_right(seen, value)
+            crossings += len(seen) - position
+            seen.insert(position, value)
+    return crossings
+
+
+def run(flow: Dict, engine: str, repeat: int) -> Dict:
+    diagram_generator.LAYOUT_ENGINE = engine
+    timings = []
+    for _ in range(repeat):
+        nodes = [dict(node, data=dict(node["data"])) for node in flow["nodes"]]
+        started = time.perf_counter()
+        nodes, height = layout_graph(nodes, flow["edges"])
+        timings.append((time.perf_counter() - started) * 1000)
+    width = max(node["position"]["x"] + node["position"]["width"] for node in nodes) - min(node["position"]["x"] for node in nodes)
+    return {
+        "engine": engine,
+        "nodes": len(nodes),
+        "edges": len(flow["edges"]),
+        "ms": round(min(timings), 2),
+        "crossings": straight_line_crossings(nodes, flow["edges"]),
+        "rows": len({node["position"]["y"] for node in nodes}),
+        "width": round(width),
+        "height": round(height),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="20,100,500,2000,5000")
+    parser.add_argument("--engines", default="rank,layered")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        flow = synthetic_flow(size, random.Random(args.seed + size))
+        for engine in (e.strip() for e in args.engines.split(",") if e.strip()):
+            print(f"Laying out {size} nodes with {engine}...", file=sys.stderr)
+            rows.append(run(flow, engine, args.repeat))
+
+    print(f"{'engine':<8} {'nodes':>6} {'edges':>6} {'ms':>9} {'crossings':>10} {'rows':>6} {'width':>9} {'height':>9}")
+    for row in rows:
+        print(f"{row['engine']:<8} {row['nodes']:>6} {row['edges']:>6} {row['ms']:>9.2f} {row['crossings']:>10} "
+              f"{row['rows']:>6} {row['width']:>9} {row['height']:>9}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
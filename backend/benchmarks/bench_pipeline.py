@@ -0,0 +1,302 @@
+"""
+End-to-end benchmarks for the request pipeline, run offline against mock upstreams.
+
+Starts the mock OpenAI server (backend/benchmarks/mock_openai.py) with the
+configured latencies and points the OpenAI and langchain clients at it. It
+then builds a small vector store in a temporary directory and measures:
+
+    * generate_mermaid_diagram on a synthetic flow;
+    * search_rpa_actions (embedding plus Chroma query);
+    * build_vector_db into a fresh index directory each iteration;
+    * run_crew end to end with the canned agent responses.
+
+For each benchmark it reports p50/p95/p99 latency over sequential calls,
+throughput with N concurrent clients, and the tracemalloc peak of one call.
+Results are saved as JSON so that two commits can be compared.
+
+Usage:
+    python -m backend.benchmarks.bench_pipeline run [--benchmarks search_rpa_actions,run_crew]
+        [--iterations 20] [--clients 4] [--chat-latency 0.2] [--embedding-latency 0.02] [--json out.json]
+    python -m backend.benchmarks.bench_pipeline compare base.json head.json [--threshold 0.1] [--fail-on-regression]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from backend.benchmarks.mock_openai import start_mock_server
+
+BENCHMARKS = ("generate_mermaid_diagram", "search_rpa_actions", "build_vector_db", "run_crew")
+
+QUERIES = [
+    "Read invoices from an Excel file and email the ones above the approval limit to my manager",
+    "Download attachments from new Outlook emails and save them to a SharePoint folder",
+    "Extract tables from PDF reports and append them to a CSV file",
+    "Open a website, log in, and download the monthly statement",
+    "Rename all files in a folder by their creation date",
+]
+
+# Lower is better for these; throughput is the only higher-is-better metric
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "mean_ms", "peak_memory_mb")
+HIGHER_IS_BETTER = ("throughput_per_s",)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def measure(fn: Callable[[int], object], iterations: int, clients: int, warmup: int = 1) -> Dict:
+    """
+    Measures latency, concurrent throughput and memory peak of fn.
+
+    Args:
+        fn: Called with the call number, so inputs can rotate.
+        iterations: Sequential calls for the latency percentiles; also the number of
+            calls per client in the throughput run.
+        clients: Concurrent callers in the throughput run.
+        warmup: Untimed calls made first.
+
+    Returns:
+        The benchmark's metrics.
+    """
+    for i in range(warmup):
+        fn(i)
+
+    latencies = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    calls = iterations * clients
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(fn, range(calls)))
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        fn(0)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "clients": clients,
+        "throughput_per_s": round(calls / elapsed, 3),
+        "peak_memory_mb": round(peak / 2**20, 3),
+    }
+
+
+def synthetic_flow(n_nodes: int):
+    """A linear flow with a decision every fifth node, shaped like mapping output."""
+    nodes = [{"id": "1", "data": {"label": "Start"}, "shape": "rectangle"}]
+    edges = []
+    for i in range(2, n_nodes + 1):
+        decision = i % 5 == 0 and i < n_nodes
+        label = "End" if i == n_nodes else (f"Check condition {i}" if decision else f"Run action number {i} on the data")
+        nodes.append({"id": str(i), "data": {"label": label}, "shape": "diamond" if decision else "rectangle"})
+        branch = "True" if (i - 1) % 5 == 0 and i > 2 else ""
+        edges.append({"id": f"e{i - 1}-{i}", "source": str(i - 1), "target": str(i), "label": branch})
+        if (i - 1) % 5 == 0 and i > 2:
+            edges.append({"id": f"e{i - 1}-{n_nodes}", "source": str(i - 1), "target": str(n_nodes), "label": "False"})
+    return nodes, edges
+
+
+def configure_environment(base_url: str, workdir: str) -> None:
+    """Points every client at the mock server and all state at a scratch directory."""
+    os.environ["OPENAI_API_KEY"] = "sk-mock"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_BASE"] = base_url
+    os.environ["VECTOR_STORE_PATH"] = os.path.join(workdir, "vector_store")
+    os.environ["VECTOR_INDEX_PATH"] = os.path.join(workdir, "vector_index")
+    os.environ["INTENT_CACHE_DIR"] = os.path.join(workdir, "intent_cache")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> Dict:
+    selected = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    server = start_mock_server(
+        chat_latency=args.chat_latency,
+        embedding_latency=args.embedding_latency,
+        jitter=args.jitter,
+    )
+    workdir = tempfile.mkdtemp(prefix="flowpilot-bench-")
+    configure_environment(server.base_url, workdir)
+    results: Dict[str, Dict] = {}
+    try:
+        # Imported after configure_environment: these modules read the environment at import time
+        from backend.build_vector_db import build_vector_db
+
+        build_vector_db(limit=args.build_limit)
+
+        for name in selected:
+            print(f"Running {name}...", file=sys.stderr)
+            before = dict(server.requests)
+            try:
+                results[name] = _run_benchmark(name, args, workdir)
+            except Exception as e:
+                results[name] = {"error": repr(e)}
+            results[name]["upstream_requests"] = {k: server.requests[k] - before[k] for k in before}
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "config": {
+                "iterations": args.iterations,
+                "clients": args.clients,
+                "chat_latency": args.chat_latency,
+                "embedding_latency": args.embedding_latency,
+                "jitter": args.jitter,
+                "build_limit": args.build_limit,
+                "nodes": args.nodes,
+                "mapping_mode": args.mapping_mode,
+            },
+        },
+        "results": results,
+    }
+
+
+def _run_benchmark(name: str, args, workdir: str) -> Dict:
+    if name == "generate_mermaid_diagram":
+        from backend.diagram_generator import generate_mermaid_diagram
+
+        nodes, edges = synthetic_flow(args.nodes)
+        return measure(lambda i: generate_mermaid_diagram(nodes, edges), args.iterations, args.clients)
+
+    if name == "search_rpa_actions":
+        from backend.services import search_rpa_actions
+
+        return measure(lambda i: search_rpa_actions(QUERIES[i % len(QUERIES)]), args.iterations, args.clients)
+
+    if name == "build_vector_db":
+        from backend.build_vector_db import build_vector_db
+
+        def build(i: int) -> int:
+            path = tempfile.mkdtemp(prefix="store-", dir=workdir)
+            try:
+                return build_vector_db(limit=args.build_limit, index_root=path, publish=False)
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+
+        # Each build is heavy and writes a whole store; keep the run short and single-client
+        return measure(build, max(1, args.iterations // 5), 1, warmup=0)
+
+    if name == "run_crew":
+        from backend.agents import run_crew
+
+        return measure(
+            lambda i: run_crew(QUERIES[i % len(QUERIES)], "power_automate", args.mapping_mode),
+            max(1, args.iterations // 4),
+            args.clients,
+        )
+    raise ValueError(name)
+
+
+def compare(base: Dict, head: Dict, threshold: float) -> List[str]:
+    """
+    Prints a metric-by-metric comparison of two result files.
+
+    Returns:
+        Descriptions of the metrics that regressed by more than threshold.
+    """
+    regressions = []
+    print(f"base {base['meta'].get('commit')}  ->  head {head['meta'].get('commit')}")
+    print(f"{'benchmark':<26} {'metric':<18} {'base':>12} {'head':>12} {'change':>9}")
+    for name in sorted(set(base["results"]) & set(head["results"])):
+        before, after = base["results"][name], head["results"][name]
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in before or metric not in after:
+                continue
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"{name:<26} {metric:<18} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}")
+            if worse:
+                regressions.append(f"{name}.{metric} {change:+.1%}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run the benchmarks against mock upstreams")
+    run_parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="Comma-separated benchmark names")
+    run_parser.add_argument("--iterations", type=int, default=20)
+    run_parser.add_argument("--clients", type=int, default=4, help="Concurrent clients for the throughput run")
+    run_parser.add_argument("--chat-latency", type=float, default=0.2, help="Mock seconds per chat completion")
+    run_parser.add_argument("--embedding-latency", type=float, default=0.02, help="Mock seconds per embeddings request")
+    run_parser.add_argument("--jitter", type=float, default=0.0)
+    run_parser.add_argument("--build-limit", type=int, default=50, help="Actions embedded per tool by build_vector_db")
+    run_parser.add_argument("--nodes", type=int, default=40, help="Nodes in the synthetic Mermaid flow")
+    run_parser.add_argument("--mapping-mode", default="sequential", choices=("sequential", "parallel"))
+    run_parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+
+    compare_parser = sub.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    compare_parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.head) as f:
+            head = json.load(f)
+        regressions = compare(base, head, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        return
+
+    report = run(args)
+    for name, metrics in report["results"].items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f"  {metric:<20} {value}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
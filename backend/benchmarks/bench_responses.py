@@ -0,0 +1,112 @@
+"""
+Size and encoding time of /process-query responses, before and after orjson, structured flows and compression.
+
+    * before: the result as it used to be returned. flow_diagram_json is a JSON
+      string inside the JSON, every Mermaid node carries its inline style, and
+      the response goes through jsonable_encoder and json.dumps;
+    * after: the flow as a JSON object, the style set once in a Mermaid init
+      directive, and FastJSONResponse (orjson) encoding;
+    * gzip / br: the "after" body compressed as CompressionMiddleware would
+      (br only when the brotli package is installed).
+
+Flows are the synthetic, laid-out flows of bench_layout.
+
+Usage:
+    python -m backend.benchmarks.bench_responses [--sizes 20,100,500,2000] [--repeat 5] [--json out.json]
+"""
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+from typing import Callable, Dict
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from backend.benchmarks.bench_layout import synthetic_flow
+from backend.diagram_generator import MERMAID_NODE_CSS, generate_mermaid_diagram, layout_graph
+from backend.responses import BROTLI_QUALITY, GZIP_LEVEL, FastJSONResponse, brotli
+
+
+def inline_style_mermaid(mermaid: str) -> str:
+    """The Mermaid text as it was generated before the init directive: the style repeated on every node."""
+    lines = mermaid.splitlines(keepends=True)[1:]
+    styled = []
+    for line in lines:
+        for opener, closer in (('["', '"]'), ('{"', '"}')):
+            start = line.find(opener)
+            if start >= 0 and line.rstrip().endswith(closer):
+                end = line.rstrip().rfind(closer)
+                label = line[start + 2:end]
+                line = f'{line[:start + 2]}<div style="{MERMAID_NODE_CSS}">{label}</div>{line[end:]}'
+                break
+        styled.append(line)
+    return "".join(styled)
+
+
+def best_ms(fn: Callable[[], bytes], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def run(size: int, seed: int, repeat: int) -> Dict:
+    flow = synthetic_flow(size, random.Random(seed + size))
+    nodes, _ = layout_graph(flow["nodes"], flow["edges"])
+    flow = {"nodes": nodes, "edges": flow["edges"]}
+    mermaid = generate_mermaid_diagram(flow["nodes"], flow["edges"])
+    steps = "\n".join(f"{i}. {node['data']['label']}" for i, node in enumerate(flow["nodes"], 1))
+    before = {"structured_requirements": steps, "flow_diagram_json": json.dumps(flow),
+              "mermaid_syntax": inline_style_mermaid(mermaid), "action_validation": None, "intent_cache": None}
+    after = dict(before, flow_diagram_json=flow, mermaid_syntax=mermaid)
+
+    before_body = JSONResponse(jsonable_encoder(before)).body
+    after_body = FastJSONResponse(after).body
+    row = {
+        "nodes": size,
+        "before_bytes": len(before_body),
+        "after_bytes": len(after_body),
+        "before_ms": round(best_ms(lambda: JSONResponse(jsonable_encoder(before)).body, repeat), 2),
+        "after_ms": round(best_ms(lambda: FastJSONResponse(after).body, repeat), 2),
+        "gzip_bytes": len(gzip.compress(after_body, GZIP_LEVEL)),
+        "gzip_ms": round(best_ms(lambda: gzip.compress(after_body, GZIP_LEVEL), repeat), 2),
+        "br_bytes": None,
+        "br_ms": None,
+    }
+    if brotli is not None:
+        row["br_bytes"] = len(brotli.compress(after_body, quality=BROTLI_QUALITY))
+        row["br_ms"] = round(best_ms(lambda: brotli.compress(after_body, quality=BROTLI_QUALITY), repeat), 2)
+    return row
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="20,100,500,2000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Encoding a {size}-node result...", file=sys.stderr)
+        rows.append(run(size, args.seed, args.repeat))
+
+    print(f"{'nodes':>6} {'before B':>10} {'after B':>10} {'gzip B':>9} {'br B':>9} "
+          f"{'before ms':>10} {'after ms':>9} {'gzip ms':>8} {'br ms':>7}")
+    for row in rows:
+        print(f"{row['nodes']:>6} {row['before_bytes']:>10} {row['after_bytes']:>10} {row['gzip_bytes']:>9} "
+              f"{row['br_bytes'] if row['br_bytes'] is not None else '-':>9} {row['before_ms']:>10.2f} "
+              f"{row['after_ms']:>9.2f} {row['gzip_ms']:>8.2f} {row['br_ms'] if row['br_ms'] is not None else '-':>7}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
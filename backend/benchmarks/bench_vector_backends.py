@@ -0,0 +1,167 @@
+"""
+Query latency and recall of the vector search backends (backend/vector_backends.py).
+
+For each catalog size it writes a synthetic collection into a Chroma store:
+clustered unit vectors, shaped like action embeddings. The store is exported
+to a memory-mapped index version with the same code build_vector_db uses.
+The benchmark then times single queries on each backend:
+
+    * chroma: collection.query on the persistent client;
+    * numpy: exact matrix-vector search over the memory-mapped matrix;
+    * hnsw: hnswlib graph search (skipped when hnswlib is not installed).
+
+Queries are perturbed copies of stored vectors. Recall@k is measured against
+the exact numpy results.
+
+Usage:
+    python -m backend.benchmarks.bench_vector_backends [--sizes 800,20000] [--dimensions 1536]
+        [--queries 500] [--k 10] [--json out.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import chromadb
+import numpy as np
+
+from backend.benchmarks.bench_pipeline import percentile
+from backend.vector_backends import HNSW_EF_SEARCH, HnswBackend, hnswlib
+from backend.vector_index import CHROMA_DIR, VectorIndex, create_staging, export_collections, finalize_staging
+
+COLLECTION = "power_automate"
+# Chroma rejects larger add() batches
+CHROMA_BATCH = 5000
+
+
+def synthetic_vectors(count: int, dimensions: int, rng: np.random.Generator, clusters: int = 40) -> np.ndarray:
+    """Unit vectors scattered around a few cluster centres, like embeddings of related actions."""
+    centres = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_index(vectors: np.ndarray, index_root: str) -> Dict:
+    """Writes vectors to a Chroma store in a new version and exports it; returns the paths and load time."""
+    version, staging = create_staging(index_root)
+    chroma_path = os.path.join(staging, CHROMA_DIR)
+    collection = chromadb.PersistentClient(path=chroma_path).get_or_create_collection(name=COLLECTION)
+    for start in range(0, len(vectors), CHROMA_BATCH):
+        rows = range(start, min(start + CHROMA_BATCH, len(vectors)))
+        collection.add(
+            embeddings=vectors[rows.start:rows.stop].tolist(),
+            documents=[f"Action {i}" for i in rows],
+            metadatas=[{"tool": "Power Automate"} for _ in rows],
+            ids=[f"action-{i}" for i in rows],
+        )
+    manifest = export_collections(chroma_path, staging, version)
+    path = finalize_staging(version, index_root)
+
+    started = time.perf_counter()
+    index = VectorIndex.load(path, manifest["collections"][COLLECTION], version)
+    index.vectors.sum()
+    load_seconds = time.perf_counter() - started
+    return {"index": index, "chroma_path": os.path.join(path, CHROMA_DIR), "load_seconds": load_seconds}
+
+
+def time_queries(fn: Callable[[np.ndarray], List[str]], queries: np.ndarray) -> Dict:
+    """Per-query latency percentiles in microseconds, plus the returned ids."""
+    fn(queries[0])
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        ids = fn(query)
+        latencies.append((time.perf_counter() - started) * 1e6)
+        results.append(ids)
+    latencies.sort()
+    return {
+        "p50_us": round(percentile(latencies, 50), 1),
+        "p95_us": round(percentile(latencies, 95), 1),
+        "p99_us": round(percentile(latencies, 99), 1),
+        "mean_us": round(sum(latencies) / len(latencies), 1),
+        "ids": results,
+    }
+
+
+def recall(results: List[List[str]], exact: List[List[str]]) -> float:
+    hits = sum(len(set(found) & set(truth)) for found, truth in zip(results, exact))
+    return round(hits / sum(len(truth) for truth in exact), 4)
+
+
+def bench_size(size: int, args, workdir: str) -> Dict:
+    rng = np.random.default_rng(args.seed)
+    vectors = synthetic_vectors(size, args.dimensions, rng)
+    picks = rng.integers(0, size, args.queries)
+    queries = vectors[picks] + 0.3 * rng.standard_normal((args.queries, args.dimensions)).astype(np.float32) / np.sqrt(args.dimensions)
+
+    built = build_index(vectors, workdir)
+    index: VectorIndex = built["index"]
+    collection = chromadb.PersistentClient(path=built["chroma_path"]).get_collection(name=COLLECTION)
+    k = args.k
+
+    runs = {
+        "numpy": time_queries(lambda q: index.query(q, k)["ids"][0], queries),
+        "chroma": time_queries(
+            lambda q: collection.query(query_embeddings=[q.tolist()], n_results=k, include=["metadatas", "documents", "distances"])["ids"][0],
+            queries,
+        ),
+    }
+    results: Dict = {"index_load_seconds": round(built["load_seconds"], 4)}
+    if hnswlib is not None:
+        backend = HnswBackend(ef_search=max(args.ef_search, k))
+        started = time.perf_counter()
+        graph = backend.graph(index)
+        results["hnsw_build_seconds"] = round(time.perf_counter() - started, 3)
+
+        def hnsw_query(q):
+            rows, distances = graph.knn_query(q, k=k, num_threads=1)
+            return index.result(rows[0], distances[0])["ids"][0]
+
+        runs["hnsw"] = time_queries(hnsw_query, queries)
+
+    exact = runs["numpy"]["ids"]
+    for name, run in runs.items():
+        run["recall_at_k"] = recall(run.pop("ids"), exact)
+        results[name] = run
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="800,20000", help="Comma-separated catalog sizes")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, default=HNSW_EF_SEARCH)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+    if hnswlib is None:
+        print("hnswlib is not installed; skipping the hnsw backend.", file=sys.stderr)
+
+    report = {"config": vars(args), "results": {}}
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Benchmarking {size} vectors...", file=sys.stderr)
+        workdir = tempfile.mkdtemp(prefix="flowpilot-vectors-")
+        try:
+            report["results"][size] = bench_size(size, args, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'size':>7} {'backend':<8} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'recall@k':>9}")
+    for size, results in report["results"].items():
+        for name in ("chroma", "numpy", "hnsw"):
+            if name in results:
+                r = results[name]
+                print(f"{size:>7} {name:<8} {r['p50_us']:>9.1f} {r['p95_us']:>9.1f} {r['p99_us']:>9.1f} {r['recall_at_k']:>9.4f}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
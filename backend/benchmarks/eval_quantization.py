@@ -0,0 +1,155 @@
+"""
+Recall@k of quantized vector search against full precision, on held-out queries.
+
+The catalog vectors come from the published index version (one collection)
+or from a synthetic generator shaped like ada embeddings: a dominant shared
+direction and a decaying spectrum. A random held-out fraction of the rows is
+removed from the catalog and used as queries, so no query is its own nearest
+neighbour. `--queries` adds real query texts, embedded with the configured
+OpenAI client.
+
+The int8 and PCA representations are fitted on the remaining rows, exactly as
+export_collections does. For every representation and rescore factor the
+script reports how much smaller the per-row arrays are than float32, the
+fixed size of PCA components and int8 scales, recall@k against exact
+search, and per-query latency.
+
+Usage:
+    python -m backend.benchmarks.eval_quantization [--source index|synthetic] [--collection power_automate]
+        [--holdout 0.1] [--k 10] [--pca-dimensions 128,256,384] [--rescore-factors 1,2,5,10]
+        [--queries queries.txt] [--max-recall-loss 0.01] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from backend.benchmarks.bench_pipeline import percentile
+from backend.quantization import PCA_DIMENSIONS, VECTOR_RESCORE_FACTOR, fit_pca, quantize_int8, quantized_query, scanned_arrays
+from backend.vector_index import VectorIndex, current_version, read_manifest, version_path
+
+
+def embedding_like_vectors(count: int, dimensions: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors with a shared offset and a power-law spectrum, like text embeddings."""
+    rank = min(dimensions, 384)
+    basis = np.linalg.qr(rng.standard_normal((dimensions, rank)))[0].T.astype(np.float32)
+    spectrum = (np.arange(1, rank + 1) ** -0.8).astype(np.float32)
+    latent = rng.standard_normal((count, rank)).astype(np.float32) * spectrum
+    offset = rng.standard_normal(dimensions).astype(np.float32)
+    vectors = 0.05 * offset / np.linalg.norm(offset) + latent @ basis / np.sqrt(spectrum @ spectrum)
+    vectors += 0.002 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def published_vectors(collection: str) -> np.ndarray:
+    version = current_version()
+    manifest = read_manifest(version)
+    if manifest is None or collection not in manifest["collections"]:
+        raise SystemExit(f"No published index version contains '{collection}'; build one or use --source synthetic")
+    entry = manifest["collections"][collection]
+    return np.load(os.path.join(version_path(version), entry["vectors"]))
+
+
+def in_memory_index(vectors: np.ndarray, quantized: Dict) -> VectorIndex:
+    ids = [str(i) for i in range(len(vectors))]
+    records = {"ids": ids, "documents": ids, "metadatas": [{} for _ in ids]}
+    return VectorIndex(vectors, (vectors * vectors).sum(axis=1), records, "eval", quantized)
+
+
+def evaluate(index: VectorIndex, kind: str, queries: np.ndarray, k: int, rescore_factor: int, exact: List[List[str]]) -> Dict:
+    latencies, hits = [], 0
+    for query, truth in zip(queries, exact):
+        started = time.perf_counter()
+        found = quantized_query(index, kind, query, k, rescore_factor)["ids"][0]
+        latencies.append((time.perf_counter() - started) * 1e6)
+        hits += len(set(found) & set(truth))
+    latencies.sort()
+    return {
+        "recall_at_k": round(hits / sum(len(truth) for truth in exact), 4),
+        "p50_us": round(percentile(latencies, 50), 1),
+        "p95_us": round(percentile(latencies, 95), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--source", choices=("index", "synthetic"), default="index")
+    parser.add_argument("--collection", default="power_automate")
+    parser.add_argument("--size", type=int, default=4000, help="Catalog rows for --source synthetic")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Dimensions for --source synthetic")
+    parser.add_argument("--holdout", type=float, default=0.1, help="Fraction of rows held out as queries")
+    parser.add_argument("--queries", help="File of query texts (one per line) embedded and added to the held-out set")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pca-dimensions", default=f"128,{PCA_DIMENSIONS},384")
+    parser.add_argument("--rescore-factors", default=f"1,2,{VECTOR_RESCORE_FACTOR},10")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--max-recall-loss", type=float,
+                        help="Exit with status 1 if int8 or PCA at the configured defaults loses more recall than this")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.source == "index":
+        vectors = published_vectors(args.collection)
+    else:
+        vectors = embedding_like_vectors(args.size, args.dimensions, rng)
+    held_out = rng.random(len(vectors)) < args.holdout
+    catalog, queries = np.ascontiguousarray(vectors[~held_out]), vectors[held_out]
+    if args.queries:
+        from backend.services import embed_texts
+
+        with open(args.queries, "r") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        queries = np.vstack([queries, np.asarray(embed_texts(texts), dtype=np.float32)])
+    if not len(queries):
+        raise SystemExit("The held-out query set is empty; raise --holdout or pass --queries")
+    print(f"{len(catalog)} catalog rows, {len(queries)} held-out queries, {catalog.shape[1]} dimensions", file=sys.stderr)
+
+    representations = {"int8": ("int8", quantize_int8(catalog))}
+    for dims in (int(d) for d in args.pca_dimensions.split(",") if d.strip()):
+        representations[f"pca-{dims}"] = ("pca", fit_pca(catalog, dims))
+    exact_index = in_memory_index(catalog, {})
+    exact = [exact_index.query(query, args.k)["ids"][0] for query in queries]
+    full_bytes = catalog.nbytes + exact_index.norms.nbytes
+
+    rows = []
+    for label, (kind, arrays) in representations.items():
+        index = in_memory_index(catalog, {kind: arrays})
+        # Per-row arrays grow with the catalog; PCA components and int8 scales are a fixed cost
+        per_row = sum(array.nbytes for array in scanned_arrays(arrays) if len(array) == len(catalog) and array.ndim <= 2)
+        fixed = sum(array.nbytes for array in scanned_arrays(arrays)) - per_row
+        for factor in (int(f) for f in args.rescore_factors.split(",") if f.strip()):
+            result = evaluate(index, kind, queries, args.k, factor, exact)
+            rows.append({"representation": label, "rescore_factor": factor, "compression": round(full_bytes / per_row, 2),
+                         "fixed_kb": round(fixed / 1024, 1),
+                         "explained_variance": round(float(arrays.get("explained_variance", 1.0)), 4), **result})
+
+    started = time.perf_counter()
+    for query in queries:
+        exact_index.query(query, args.k)
+    exact_us = (time.perf_counter() - started) / len(queries) * 1e6
+
+    print(f"exact float32 search: {exact_us:.1f} us/query")
+    print(f"{'representation':<15} {'rescore':>7} {'smaller':>8} {'fixed KB':>9} {'recall@k':>9} {'loss':>7} {'p50 us':>8} {'p95 us':>8}")
+    for row in rows:
+        print(f"{row['representation']:<15} {row['rescore_factor']:>6}x {row['compression']:>7.2f}x {row['fixed_kb']:>9.1f} "
+              f"{row['recall_at_k']:>9.4f} {1 - row['recall_at_k']:>7.2%} {row['p50_us']:>8.1f} {row['p95_us']:>8.1f}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "exact_us": round(exact_us, 1), "results": rows}, f, indent=2)
+
+    if args.max_recall_loss is not None:
+        defaults = [row for row in rows if row["rescore_factor"] == VECTOR_RESCORE_FACTOR
+                    and row["representation"] in ("int8", f"pca-{PCA_DIMENSIONS}")]
+        failing = [row for row in defaults if 1 - row["recall_at_k"] > args.max_recall_loss]
+        if failing:
+            print(f"Recall loss above {args.max_recall_loss:.2%}: {', '.join(row['representation'] for row in failing)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
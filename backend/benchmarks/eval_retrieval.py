@@ -0,0 +1,236 @@
+"""
+Retrieval quality and latency of search_rpa_actions for each mode and n_results.
+
+The labeled set is derived from the action catalog. Each action's description
+is turned into an imperative step ("Creates a group in the Active
+Directory." -> "Create a group in the Active Directory"), the way the
+Structuring Agent phrases steps. The expected answer is that action, plus any
+other action with the same description. Derived queries share words with the
+indexed documents, so absolute scores are optimistic. Use them to compare
+modes and k, and add hand-labeled steps with --labels (JSON lines with
+"query" and "expected" action ids) for absolute numbers.
+
+Modes:
+    vector   search_rpa_actions(mode="vector") on the configured backend
+    keyword  BM25 (no embedding request)
+    hybrid   reciprocal rank fusion of vector and keyword
+    int8/pca vector search on the quantized copies, rescored exactly
+
+For every mode and k it reports recall@k, hit rate@k, MRR, per-query search
+latency (embedding excluded), and the approximate prompt tokens the results
+add to the Tool Mapper. It then recommends the smallest k, and the cheapest
+mode at that k, whose recall is within --tolerance of the best.
+
+Usage:
+    python -m backend.benchmarks.eval_retrieval [--tool power_automate] [--ks 1,3,5,10,20]
+        [--modes vector,keyword,hybrid,int8,pca] [--labels extra.jsonl] [--write-labels labels.jsonl]
+        [--tolerance 0.01] [--json out.json] [--mock]
+
+Without --mock it searches the published index with the configured OpenAI
+client. With --mock it builds a throwaway index against the mock embeddings
+server (backend/benchmarks/mock_openai.py) to exercise the harness offline;
+those numbers say nothing about real embeddings.
+"""
+import argparse
+import json
+import re
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from backend.action_catalog import load_catalog
+from backend.benchmarks.bench_pipeline import configure_environment, percentile
+
+MODES = ("vector", "keyword", "hybrid", "int8", "pca")
+# Modes that need the query embedded first
+EMBEDDING_MODES = ("vector", "hybrid", "int8", "pca")
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def imperative(description: str) -> str:
+    """The first sentence of a description as an imperative step."""
+    sentence = _SENTENCE_END_RE.split(description.strip(), maxsplit=1)[0].rstrip(".!? ")
+    words = sentence.split(" ", 1)
+    verb = words[0]
+    if verb.endswith("ies") and len(verb) > 4:
+        verb = verb[:-3] + "y"
+    elif verb.endswith(("sses", "shes", "ches", "xes", "zes")):
+        verb = verb[:-2]
+    elif verb.endswith("s") and not verb.endswith("ss"):
+        verb = verb[:-1]
+    return " ".join([verb] + words[1:])
+
+
+def derive_labels(tool: str) -> List[Dict]:
+    """One labeled query per distinct action description in a tool's catalog."""
+    by_description: Dict[str, List[str]] = {}
+    for record in load_catalog(tool):
+        description = (record.description or "").strip()
+        if description:
+            by_description.setdefault(imperative(description).lower(), []).append(record.action_id)
+    labels = []
+    for record in load_catalog(tool):
+        description = (record.description or "").strip()
+        if not description:
+            continue
+        expected = by_description.pop(imperative(description).lower(), None)
+        if expected:
+            labels.append({"query": imperative(description), "expected": expected, "source": "description"})
+    return labels
+
+
+def load_labels(path: str) -> List[Dict]:
+    with open(path, "r") as f:
+        return [dict(json.loads(line), source=path) for line in f if line.strip()]
+
+
+def embed_all(texts: List[str], batch_size: int = 100) -> List[List[float]]:
+    from backend.services import embed_texts
+
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embed_texts(texts[start:start + batch_size]))
+    return vectors
+
+
+def retrieve(mode: str, query: str, embedding: Optional[List[float]], k: int, collection: str) -> Optional[Dict]:
+    """The top-k result of one mode, or None when the mode is unavailable for the published index."""
+    from backend.quantization import quantized_query
+    from backend.services import search_rpa_actions
+    from backend.vector_index import get_vector_index
+
+    if mode in ("int8", "pca"):
+        index = get_vector_index(collection)
+        if index is None or mode not in index.quantized:
+            return None
+        return quantized_query(index, mode, embedding, k)
+    return search_rpa_actions(query, n_results=k, collection_name=collection, query_embedding=embedding, mode=mode)
+
+
+def score(ranked: List[List[str]], labels: List[Dict], k: int) -> Dict:
+    recall = hits = reciprocal = 0.0
+    for ids, label in zip(ranked, labels):
+        expected = set(label["expected"])
+        top = ids[:k]
+        found = expected.intersection(top)
+        recall += len(found) / len(expected)
+        hits += bool(found)
+        reciprocal += next((1.0 / rank for rank, id_ in enumerate(top, start=1) if id_ in expected), 0.0)
+    n = len(labels)
+    return {"recall": round(recall / n, 4), "hit_rate": round(hits / n, 4), "mrr": round(reciprocal / n, 4)}
+
+
+def prompt_tokens(result: Dict, k: int) -> float:
+    """Rough token count (4 characters per token) of a result truncated to k, as the tool returns it."""
+    truncated = {key: [values[0][:k]] for key, values in result.items() if values and isinstance(values[0], list)}
+    return len(str(truncated)) / 4
+
+
+def recommend(rows: List[Dict], tolerance: float) -> Optional[Dict]:
+    """The smallest k, then the cheapest mode, whose recall is within tolerance of the best recall."""
+    if not rows:
+        return None
+    target = max(row["recall"] for row in rows) - tolerance
+    eligible = [row for row in rows if row["recall"] >= target]
+    return min(eligible, key=lambda row: (row["k"], row["mode"] in EMBEDDING_MODES, row["p50_us"]))
+
+
+def evaluate(labels: List[Dict], modes: List[str], ks: List[int], collection: str) -> List[Dict]:
+    queries = [label["query"] for label in labels]
+    embeddings = embed_all(queries) if any(mode in EMBEDDING_MODES for mode in modes) else [None] * len(queries)
+    depth = max(ks)
+    rows = []
+    for mode in modes:
+        ranked, latencies, results = [], [], []
+        for query, embedding in zip(queries, embeddings):
+            started = time.perf_counter()
+            result = retrieve(mode, query, embedding, depth, collection)
+            latencies.append((time.perf_counter() - started) * 1e6)
+            if result is None:
+                break
+            ranked.append(result["ids"][0])
+            results.append(result)
+        if len(ranked) < len(queries):
+            print(f"Skipping {mode}: not available for the published index", file=sys.stderr)
+            continue
+        latencies.sort()
+        for k in ks:
+            rows.append({
+                "mode": mode,
+                "k": k,
+                **score(ranked, labels, k),
+                "p50_us": round(percentile(latencies, 50), 1),
+                "p95_us": round(percentile(latencies, 95), 1),
+                "prompt_tokens": round(sum(prompt_tokens(result, k) for result in results) / len(results)),
+            })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tool", default="power_automate", help="Tool collection to evaluate")
+    parser.add_argument("--ks", default="1,3,5,10,20", help="Comma-separated n_results values")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--labels", help="Extra hand-labeled queries (JSON lines with query and expected)")
+    parser.add_argument("--no-derived", action="store_true", help="Use only the --labels queries")
+    parser.add_argument("--write-labels", help="Write the labeled set to this JSON lines file")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Recall loss accepted by the recommendation")
+    parser.add_argument("--mock", action="store_true", help="Build a throwaway index against mock embeddings")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        raise SystemExit(f"Unknown modes: {', '.join(sorted(unknown))}")
+    ks = sorted(int(k) for k in args.ks.split(",") if k.strip())
+
+    labels = [] if args.no_derived else derive_labels(args.tool)
+    if args.labels:
+        labels += load_labels(args.labels)
+    if not labels:
+        raise SystemExit("No labeled queries")
+    if args.write_labels:
+        with open(args.write_labels, "w") as f:
+            for label in labels:
+                f.write(json.dumps(label) + "\n")
+
+    server = workdir = None
+    if args.mock:
+        from backend.benchmarks.mock_openai import start_mock_server
+
+        server = start_mock_server()
+        workdir = tempfile.mkdtemp(prefix="flowpilot-eval-")
+        configure_environment(server.base_url, workdir)
+        # Imported after configure_environment: it reads the environment at import time
+        from backend.build_vector_db import build_vector_db
+
+        build_vector_db()
+    try:
+        print(f"Evaluating {len(labels)} labeled queries on '{args.tool}'...", file=sys.stderr)
+        rows = evaluate(labels, modes, ks, args.tool)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'mode':<8} {'k':>3} {'recall':>7} {'hit':>7} {'MRR':>7} {'p50 us':>8} {'p95 us':>8} {'tokens':>7}")
+    for row in rows:
+        print(f"{row['mode']:<8} {row['k']:>3} {row['recall']:>7.4f} {row['hit_rate']:>7.4f} {row['mrr']:>7.4f} "
+              f"{row['p50_us']:>8.1f} {row['p95_us']:>8.1f} {row['prompt_tokens']:>7}")
+    best = recommend(rows, args.tolerance)
+    if best:
+        setting = f"SEARCH_MODE=vector VECTOR_QUANTIZATION={best['mode']}" if best["mode"] in ("int8", "pca") else f"SEARCH_MODE={best['mode']}"
+        print(f"\nRecommended: {setting} SEARCH_N_RESULTS={best['k']} "
+              f"(recall {best['recall']:.4f}, ~{best['prompt_tokens']} prompt tokens per search)")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "queries": len(labels), "results": rows, "recommended": best}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Load-test driver for the FastAPI endpoints, sweeping concurrency levels.
+
+Starts the mock OpenAI server and a local uvicorn instance of backend.main:app
+wired to it (or targets an already running instance with --url), then drives
+/search and /process-query with httpx from asyncio:
+
+    * closed loop: N workers each send their next request as soon as the
+      previous one returns. The sweep is over N.
+    * open loop: requests arrive at a fixed rate whether or not earlier ones
+      finished. Latency counts from the scheduled send time, so queueing delay
+      is not hidden (no coordinated omission). The sweep is over the rate.
+
+Each level reports throughput, error rate and p50/p95/p99 latency. The
+saturation point is the last level that still raised throughput by at least
+--saturation-gain (closed loop), or the last rate that was sustained within
+10% with under 1% errors (open loop). Results are written as CSV plus an HTML
+report with throughput and latency curves.
+
+Usage:
+    python -m backend.benchmarks.load_test [--mode closed] [--levels 1,2,4,8,16,32]
+        [--endpoints search,process-query] [--duration 10] [--report-dir load_report]
+    python -m backend.benchmarks.load_test --mode open --levels 5,10,20,40 --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import csv
+import html
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from backend.benchmarks.bench_pipeline import QUERIES, configure_environment, percentile
+from backend.benchmarks.mock_openai import start_mock_server
+
+ENDPOINTS = {
+    "search": lambda i: ("/search", {"query": QUERIES[i % len(QUERIES)]}),
+    "process-query": lambda i: ("/process-query", {"query": QUERIES[i % len(QUERIES)], "tool_choice": "power_automate"}),
+}
+
+# One sample per request: (latency seconds, succeeded)
+Sample = Tuple[float, bool]
+
+
+async def _send(client: httpx.AsyncClient, endpoint: str, i: int, scheduled: float, samples: List[Sample]) -> None:
+    path, params = ENDPOINTS[endpoint](i)
+    try:
+        response = await client.get(path, params=params)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    samples.append((time.perf_counter() - scheduled, ok))
+
+
+async def closed_loop(client: httpx.AsyncClient, endpoint: str, concurrency: int, duration: float) -> Tuple[List[Sample], float]:
+    """Runs concurrency workers back to back for duration seconds."""
+    samples: List[Sample] = []
+    started = time.perf_counter()
+    deadline = started + duration
+    counter = iter(range(sys.maxsize))
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            await _send(client, endpoint, next(counter), time.perf_counter(), samples)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+async def open_loop(client: httpx.AsyncClient, endpoint: str, rate: float, duration: float) -> Tuple[List[Sample], float]:
+    """Sends requests at a fixed arrival rate for duration seconds, then waits for stragglers."""
+    samples: List[Sample] = []
+    tasks = []
+    started = time.perf_counter()
+    interval = 1.0 / rate
+    for i in range(max(1, int(rate * duration))):
+        scheduled = started + i * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(_send(client, endpoint, i, scheduled, samples)))
+    await asyncio.gather(*tasks)
+    return samples, time.perf_counter() - started
+
+
+def summarize(endpoint: str, mode: str, level: float, samples: List[Sample], elapsed: float) -> Dict:
+    """One report row for a sweep level."""
+    latencies = sorted(latency * 1000 for latency, ok in samples if ok)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "endpoint": endpoint,
+        "mode": mode,
+        "level": level,
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_per_s": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def find_saturation(rows: Sequence[Dict], mode: str, min_gain: float) -> Optional[float]:
+    """
+    The highest level the endpoint still handled well.
+
+    Closed loop: the last level whose throughput rose by at least min_gain over
+    the previous level. Open loop: the last rate achieved within 10% with an
+    error rate below 1%.
+    """
+    saturation = None
+    for i, row in enumerate(rows):
+        if mode == "open":
+            if row["throughput_per_s"] >= 0.9 * row["level"] and row["error_rate"] < 0.01:
+                saturation = row["level"]
+            else:
+                break
+        elif i == 0:
+            saturation = row["level"]
+        elif row["throughput_per_s"] >= rows[i - 1]["throughput_per_s"] * (1 + min_gain):
+            saturation = row["level"]
+        else:
+            break
+    return saturation
+
+
+async def sweep(base_url: str, endpoint: str, mode: str, levels: Sequence[float], duration: float, timeout: float) -> List[Dict]:
+    rows = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=int(max(levels)))
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for level in levels:
+            if mode == "open":
+                samples, elapsed = await open_loop(client, endpoint, level, duration)
+            else:
+                samples, elapsed = await closed_loop(client, endpoint, int(level), duration)
+            row = summarize(endpoint, mode, level, samples, elapsed)
+            print(f"{endpoint:<14} {mode} {level:>6g}: {row['throughput_per_s']:>9.2f}/s  "
+                  f"p50 {row['p50_ms']:>9.1f} ms  p95 {row['p95_ms']:>9.1f} ms  errors {row['errors']}", file=sys.stderr)
+            rows.append(row)
+    return rows
+
+
+def write_csv(rows: Sequence[Dict], path: str) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _svg_chart(title: str, xs: Sequence[float], series: Dict[str, Sequence[float]], x_label: str, y_label: str) -> str:
+    """A small dependency-free SVG line chart."""
+    width, height, pad = 520, 300, 50
+    colors = ["#2563eb", "#dc2626", "#16a34a", "#9333ea"]
+    x_max = max(xs) or 1
+    y_max = max((max(values) for values in series.values() if values), default=0) or 1
+
+    def point(x: float, y: float) -> str:
+        return f"{pad + (width - 2 * pad) * x / x_max:.1f},{height - pad - (height - 2 * pad) * y / y_max:.1f}"
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" font-size="11">',
+        f'<text x="{width / 2}" y="18" text-anchor="middle" font-size="13">{html.escape(title)}</text>',
+        f'<line x1="{pad}" y1="{height - pad}" x2="{width - pad}" y2="{height - pad}" stroke="#333"/>',
+        f'<line x1="{pad}" y1="{pad}" x2="{pad}" y2="{height - pad}" stroke="#333"/>',
+        f'<text x="{width / 2}" y="{height - 12}" text-anchor="middle">{html.escape(x_label)}</text>',
+        f'<text x="14" y="{height / 2}" text-anchor="middle" transform="rotate(-90 14 {height / 2})">{html.escape(y_label)}</text>',
+        f'<text x="{pad - 4}" y="{pad + 4}" text-anchor="end">{y_max:g}</text>',
+    ]
+    for x in xs:
+        x_pos = point(x, 0).split(",")[0]
+        parts.append(f'<text x="{x_pos}" y="{height - pad + 14}" text-anchor="middle">{x:g}</text>')
+    for i, (name, values) in enumerate(series.items()):
+        color = colors[i % len(colors)]
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="2" points="{" ".join(point(x, y) for x, y in zip(xs, values))}"/>')
+        parts.append(f'<text x="{width - pad + 4}" y="{pad + 14 * i}" fill="{color}">{html.escape(name)}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def write_html(rows: Sequence[Dict], saturation: Dict[str, Optional[float]], path: str) -> None:
+    sections = []
+    for endpoint in dict.fromkeys(row["endpoint"] for row in rows):
+        endpoint_rows = [row for row in rows if row["endpoint"] == endpoint]
+        mode = endpoint_rows[0]["mode"]
+        x_label = "offered requests/s" if mode == "open" else "concurrent clients"
+        xs = [row["level"] for row in endpoint_rows]
+        throughput = _svg_chart(f"{endpoint} throughput", xs, {"requests/s": [r["throughput_per_s"] for r in endpoint_rows]},
+                                x_label, "requests/s")
+        latency = _svg_chart(f"{endpoint} latency", xs, {q: [r[f"{q}_ms"] for r in endpoint_rows] for q in ("p50", "p95", "p99")},
+                             x_label, "ms")
+        header = "".join(f"<th>{html.escape(key)}</th>" for key in endpoint_rows[0])
+        body = "".join("<tr>" + "".join(f"<td>{html.escape(str(v))}</td>" for v in row.values()) + "</tr>" for row in endpoint_rows)
+        sections.append(
+            f"<h2>/{html.escape(endpoint)}</h2>"
+            f"<p>Saturation point: <b>{saturation[endpoint] if saturation[endpoint] is not None else 'not reached'}</b> ({x_label})</p>"
+            f"{throughput}{latency}<table><tr>{header}</tr>{body}</table>"
+        )
+    with open(path, "w") as f:
+        f.write(
+            "<!DOCTYPE html><html><head><meta charset='utf-8'><title>FlowPilot load test</title>"
+            "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}"
+            "td,th{border:1px solid #ccc;padding:3px 8px;text-align:right}</style></head><body>"
+            f"<h1>FlowPilot load test</h1><p>{time.strftime('%Y-%m-%d %H:%M:%S')}</p>{''.join(sections)}</body></html>"
+        )
+
+
+def start_app_server(port: int, env: Dict[str, str], workers: int = 1) -> subprocess.Popen:
+    """Launches uvicorn serving backend.main:app and waits until it answers."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="Concurrency levels (closed) or requests/s (open)")
+    parser.add_argument("--endpoints", default="search,process-query", help="Comma-separated: " + ",".join(ENDPOINTS))
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--saturation-gain", type=float, default=0.1, help="Minimum relative throughput gain per level")
+    parser.add_argument("--url", help="Target a running instance instead of starting one")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local instance")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="Mock seconds per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Mock seconds per embeddings request")
+    parser.add_argument("--build-limit", type=int, default=50, help="Actions embedded per tool in the local vector store")
+    parser.add_argument("--report-dir", default="load_report")
+    args = parser.parse_args()
+
+    levels = [float(level) for level in args.levels.split(",")]
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    server = app_process = workdir = None
+    base_url = args.url
+    try:
+        if base_url is None:
+            server = start_mock_server(chat_latency=args.chat_latency, embedding_latency=args.embedding_latency)
+            workdir = tempfile.mkdtemp(prefix="flowpilot-load-")
+            configure_environment(server.base_url, workdir)
+            from backend.build_vector_db import build_vector_db
+
+            build_vector_db(limit=args.build_limit)
+            app_process = start_app_server(args.port, dict(os.environ), args.workers)
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        rows = []
+        for endpoint in endpoints:
+            rows.extend(asyncio.run(sweep(base_url, endpoint, args.mode, levels, args.duration, args.timeout)))
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    saturation = {
+        endpoint: find_saturation([row for row in rows if row["endpoint"] == endpoint], args.mode, args.saturation_gain)
+        for endpoint in endpoints
+    }
+    os.makedirs(args.report_dir, exist_ok=True)
+    write_csv(rows, os.path.join(args.report_dir, "load_test.csv"))
+    write_html(rows, saturation, os.path.join(args.report_dir, "load_test.html"))
+    for endpoint, level in saturation.items():
+        print(f"/{endpoint} saturates at {level if level is not None else 'n/a'} ({args.mode} loop)")
+    print(f"Report written to {args.report_dir}/load_test.csv and load_test.html")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Local stand-in for the OpenAI chat completions and embeddings APIs.
+
+Lets the pipeline run offline with controlled upstream latency:
+
+    * /v1/embeddings returns deterministic bag-of-words vectors. Each word maps
+      to a fixed pseudo-random direction, so texts sharing words get similar
+      embeddings and vector search still behaves sensibly.
+    * /v1/chat/completions returns canned ReAct responses chosen by the agent
+      role found in the prompt. The Tool Mapper first calls rpa_actions_search
+      once, then answers with a flow; the other agents answer immediately.
+
+Point the clients at it with OPENAI_BASE_URL (openai) and OPENAI_API_BASE
+(langchain), e.g. http://127.0.0.1:8765/v1.
+
+Usage:
+    python -m backend.benchmarks.mock_openai [--port 8765] [--chat-latency 0.5] [--embedding-latency 0.05]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1536
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+STRUCTURED_STEPS = """1. Open the Excel workbook with the monthly invoices
+2. Read the invoice rows from the worksheet
+3. For each invoice, check whether the amount is above the approval limit
+4. If it is, send an approval email to the manager
+5. Close the Excel workbook"""
+
+FLOW_JSON = {
+    "nodes": [
+        {"id": "1", "data": {"label": "Start"}, "shape": "rectangle"},
+        {"id": "2", "data": {"label": "Launch Excel"}, "shape": "rectangle"},
+        {"id": "3", "data": {"label": "Read from Excel worksheet"}, "shape": "rectangle"},
+        {"id": "4", "data": {"label": "If"}, "shape": "diamond"},
+        {"id": "5", "data": {"label": "Send email message through Outlook"}, "shape": "rectangle"},
+        {"id": "6", "data": {"label": "Close Excel"}, "shape": "rectangle"},
+        {"id": "7", "data": {"label": "End"}, "shape": "rectangle"},
+    ],
+    "edges": [
+        {"id": "e1-2", "source": "1", "target": "2", "label": ""},
+        {"id": "e2-3", "source": "2", "target": "3", "label": ""},
+        {"id": "e3-4", "source": "3", "target": "4", "label": ""},
+        {"id": "e4-5", "source": "4", "target": "5", "label": "True"},
+        {"id": "e4-6", "source": "4", "target": "6", "label": "False"},
+        {"id": "e5-6", "source": "5", "target": "6", "label": ""},
+        {"id": "e6-7", "source": "6", "target": "7", "label": ""},
+    ],
+}
+
+MERMAID_SYNTAX = """graph TD
+    1["Start"] --> 2["Launch Excel"]
+    2 --> 3["Read from Excel worksheet"]
+    3 --> 4{"If"}
+    4 -- True --> 5["Send email message through Outlook"]
+    4 -- False --> 6["Close Excel"]
+    5 --> 6
+    6 --> 7["End"]"""
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32)
+
+
+def embed(text: str) -> np.ndarray:
+    """A deterministic unit vector for text: the normalized sum of its word vectors."""
+    words = _WORD_RE.findall(text.lower()) or [""]
+    vector = np.sum([_word_vector(word) for word in words], axis=0)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _message_text(message: Dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def chat_reply(messages: List[Dict]) -> str:
+    """The canned assistant reply for a conversation, picked by agent role."""
+    prompt = "\n".join(_message_text(m) for m in messages)
+    if "Tool Mapper" in prompt:
+        # A fresh conversation is [system, user]; anything longer carries the tool observation
+        if len(messages) <= 2 and "rpa_actions_search" in prompt:
+            return (
+                "Thought: I should look up the matching actions.\n"
+                "Action: rpa_actions_search\n"
+                'Action Input: {"query": "read rows from an Excel worksheet"}'
+            )
+        return f"Thought: I now know the final answer\nFinal Answer: {json.dumps(FLOW_JSON)}"
+    if "Mermaid Syntax Expert" in prompt:
+        return f"Thought: I now know the final answer\nFinal Answer: {MERMAID_SYNTAX}"
+    return f"Thought: I now know the final answer\nFinal Answer: {STRUCTURED_STEPS}"
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send_json(self, payload: Dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sleep(self, latency: float) -> None:
+        jitter = self.server.jitter
+        if latency or jitter:
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/embeddings"):
+            self._embeddings(request)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(request)
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+    def _embeddings(self, request: Dict) -> None:
+        self._sleep(self.server.embedding_latency)
+        texts = request.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        data = []
+        for index, text in enumerate(texts):
+            vector = embed(text)
+            if request.get("encoding_format") == "base64":
+                encoded = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                encoded = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": encoded})
+        tokens = sum(_count_tokens(text) for text in texts)
+        self.server.record("embeddings")
+        self._send_json({
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "mock-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chat(self, request: Dict) -> None:
+        self._sleep(self.server.chat_latency)
+        messages = request.get("messages", [])
+        reply = chat_reply(messages)
+        prompt_tokens = sum(_count_tokens(_message_text(m)) for m in messages)
+        completion_tokens = _count_tokens(reply)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-mock-{self.server.record('chat')}"
+        model = request.get("model", "mock-chat")
+        if request.get("stream"):
+            self._stream_chat(completion_id, model, reply, usage)
+            return
+        self._send_json({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream_chat(self, completion_id: str, model: str, reply: str, usage: Dict) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        chunks = [
+            dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": reply}, "finish_reason": None}]),
+            dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=usage),
+        ]
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """Threaded mock server; counts requests per endpoint."""
+
+    daemon_threads = True
+
+    def __init__(self, address, chat_latency: float = 0.0, embedding_latency: float = 0.0, jitter: float = 0.0):
+        super().__init__(address, MockOpenAIHandler)
+        self.chat_latency = chat_latency
+        self.embedding_latency = embedding_latency
+        self.jitter = jitter
+        self.requests = {"chat": 0, "embeddings": 0}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str) -> int:
+        with self._lock:
+            self.requests[endpoint] += 1
+            return self.requests[endpoint]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_mock_server(
+    port: int = 0,
+    chat_latency: float = 0.0,
+    embedding_latency: float = 0.0,
+    jitter: float = 0.0,
+    host: str = "127.0.0.1",
+) -> MockOpenAIServer:
+    """
+    Starts the mock server on a background thread.
+
+    Args:
+        port: Port to listen on; 0 picks a free port.
+        chat_latency: Seconds added to every chat completion.
+        embedding_latency: Seconds added to every embeddings request.
+        jitter: Maximum seconds of uniform random jitter on both latencies.
+
+    Returns:
+        The running server; call shutdown() to stop it.
+    """
+    server = MockOpenAIServer((host, port), chat_latency, embedding_latency, jitter)
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve mock OpenAI chat and embeddings endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="Seconds per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds per embeddings request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum random jitter in seconds")
+    args = parser.parse_args(argv)
+
+    server = MockOpenAIServer((args.host, args.port), args.chat_latency, args.embedding_latency, args.jitter)
+    print(f"Mock OpenAI API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,21 @@
-
-
 import os
 import json
 import chromadb
-from openai import OpenAI
 from dotenv import load_dotenv
 
-load_dotenv()
+from backend.services import EMBEDDING_MODEL, get_openai_client
+from backend.vector_index import CHROMA_DIR, VECTOR_INDEX_PATH, create_staging, export_collections, finalize_staging, publish_version
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+load_dotenv()
 
-# Initialize ChromaDB client
-chroma_client = chromadb.PersistentClient(path="backend/vector_store")
+script_dir = os.path.dirname(__file__)
+power_automate_path = os.path.join(script_dir, 'data', 'power_automate_actions_detailed.json')
+automation_anywhere_path = os.path.join(script_dir, 'data', 'automation_anywhere_actions_detailed.json')
 
 # Define a function to process and add actions to a collection
-def process_and_add_actions(collection_name, actions_data, tool_name):
+def process_and_add_actions(chroma_client, collection_name, actions_data, tool_name, limit=None):
     collection = chroma_client.get_or_create_collection(name=collection_name)
-    
+
     actions_to_add = []
     if tool_name == "Automation Anywhere":
         for package in actions_data:
@@ -30,7 +28,10 @@ def process_and_add_actions(collection_name, actions_data, tool_name):
                 })
     else:
         actions_to_add = actions_data
+    if limit is not None:
+        actions_to_add = actions_to_add[:limit]
 
+    client = get_openai_client()
     for action in actions_to_add:
         content = f"Tool: {action.get('tool', tool_name)}\nAction: {action.get('action', 'Unknown Action')}\nDescription: {action.get('description', '')}"
         if 'parameters' in action:
@@ -39,7 +40,7 @@ def process_and_add_actions(collection_name, actions_data, tool_name):
 
         response = client.embeddings.create(
             input=content,
-            model="text-embedding-ada-002"
+            model=EMBEDDING_MODEL
         )
         embedding = response.data[0].embedding
 
@@ -50,25 +51,51 @@ def process_and_add_actions(collection_name, actions_data, tool_name):
             ids=[action.get('action', 'Unknown Action')]
         )
     print(f"Collection '{collection_name}' has been built successfully.")
+    return len(actions_to_add)
 
-# Load RPA actions from JSON files
-script_dir = os.path.dirname(__file__)
-power_automate_path = os.path.join(script_dir, 'data', 'power_automate_actions_detailed.json')
-automation_anywhere_path = os.path.join(script_dir, 'data', 'automation_anywhere_actions_detailed.json')
+def build_vector_db(limit=None, index_root=VECTOR_INDEX_PATH, publish=True):
+    """
+    Builds a new vector index version in a staging directory and publishes it.
+
+    The actions are embedded into a fresh Chroma store inside the staging
+    directory and exported to the memory-mapped index. The live version is
+    never written to; publishing swaps the `current` pointer atomically.
+
+    Args:
+        limit: Maximum number of actions to embed per tool (all when None).
+        index_root: The versioned index directory.
+        publish: Make the new version live once it is complete.
+
+    Returns:
+        The new version id.
+    """
+    version, staging = create_staging(index_root)
+    vector_store_path = os.path.join(staging, CHROMA_DIR)
 
-with open(power_automate_path, 'r') as f:
-    power_automate_actions = json.load(f)
+    # Initialize ChromaDB client
+    chroma_client = chromadb.PersistentClient(path=vector_store_path)
 
-with open(automation_anywhere_path, 'r') as f:
-    automation_anywhere_actions = json.load(f)
+    # Load RPA actions from JSON files
+    with open(power_automate_path, 'r') as f:
+        power_automate_actions = json.load(f)
 
-# Process for Power Automate
-process_and_add_actions("power_automate", power_automate_actions, "Power Automate")
+    with open(automation_anywhere_path, 'r') as f:
+        automation_anywhere_actions = json.load(f)
 
-# Process for Automation Anywhere
-process_and_add_actions("automation_anywhere", automation_anywhere_actions, "Automation Anywhere")
+    # Process for Power Automate
+    process_and_add_actions(chroma_client, "power_automate", power_automate_actions, "Power Automate", limit)
 
-print("Vector database has been built successfully.")
+    # Process for Automation Anywhere
+    process_and_add_actions(chroma_client, "automation_anywhere", automation_anywhere_actions, "Automation Anywhere", limit)
 
+    export_collections(vector_store_path, staging, version)
+    finalize_staging(version, index_root)
+    print(f"Vector database version {version} has been built successfully.")
 
+    if publish:
+        publish_version(version, index_root)
+        print(f"Published vector index version {version}.")
+    return version
 
+if __name__ == "__main__":
+    build_vector_db()
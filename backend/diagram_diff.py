@@ -0,0 +1,318 @@
+"""
+Structural diffs between successive flows of a session, with incremental relayout.
+
+When a refined prompt produces a new flow, its nodes are first matched to the
+previous flow's nodes, so unchanged steps keep their ids even when the model
+renumbers them:
+
+    1. same id, label and shape;
+    2. same label and shape under another id;
+    3. same id with a new label or shape (the step was edited in place);
+    4. same shape and most of the same matched neighbours (edited in place and renumbered).
+
+Unmatched new nodes are added and unmatched old nodes removed.
+
+The new flow is then laid out incrementally. Ranks are recomputed (linear
+time). A rank whose members and node sizes are the same as in some old rank
+keeps its x positions. Only the other ("dirty") ranks are placed again: kept
+nodes aim for their old x, new nodes for the median of their neighbours, and
+order and spacing come from the same isotonic placement as the full layout.
+Row heights are restacked. When more than INCREMENTAL_MAX_DIRTY of the ranks
+are dirty, the full layered layout runs instead.
+
+diagram_patch() describes the change as added, removed, relabeled and moved
+nodes plus added and removed edges, keyed by flow_hash() of the base and new
+flow. A client holding the base flow rebuilds the new one with apply_patch().
+Both the response and the re-render scale with the size of the edit.
+"""
+import hashlib
+import json
+import os
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+from backend.diagram_generator import X_SPACING, Y_SPACING, display_label, layout_flow, node_size
+from backend.flow_models import FlowGraph
+from backend.layered_layout import isotonic_positions, median, rank_nodes
+
+# Fraction of ranks that may need placing again before the whole flow is laid out from scratch
+INCREMENTAL_MAX_DIRTY = float(os.getenv("INCREMENTAL_MAX_DIRTY", "0.5"))
+# Coordinates closer than this are the same; rebuilding x from a node's center changes its last bits
+POSITION_TOLERANCE = 1e-6
+
+
+def _label(node: Dict) -> str:
+    return node.get("data", {}).get("label", "")
+
+
+def _key(node: Dict) -> Tuple[str, str]:
+    return " ".join(_label(node).lower().split()), node.get("shape", "rectangle")
+
+
+def _edge_key(edge: Dict) -> Tuple[str, str, str]:
+    return str(edge["source"]), str(edge["target"]), edge.get("label") or ""
+
+
+def flow_hash(flow: Dict) -> str:
+    """A digest of a flow's nodes (with positions) and edges, independent of their order."""
+    nodes = sorted(
+        ({"id": str(n["id"]), "label": _label(n), "shape": n.get("shape", "rectangle"), "position": n.get("position")}
+         for n in flow.get("nodes", [])),
+        key=lambda n: n["id"],
+    )
+    edges = sorted(_edge_key(e) for e in flow.get("edges", []))
+    payload = json.dumps({"nodes": nodes, "edges": edges}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def match_nodes(old_flow: Dict, new_flow: Dict) -> Dict[str, str]:
+    """Maps the ids of new nodes to the ids of the old nodes they continue."""
+    old_nodes, new_nodes = old_flow.get("nodes", []), new_flow.get("nodes", [])
+    old_by_id = {str(node["id"]): node for node in old_nodes}
+    mapping: Dict[str, str] = {}
+    used = set()
+    for node in new_nodes:
+        node_id = str(node["id"])
+        old = old_by_id.get(node_id)
+        if old is not None and _key(old) == _key(node):
+            mapping[node_id] = node_id
+            used.add(node_id)
+    free: Dict[Tuple[str, str], deque] = defaultdict(deque)
+    for node in old_nodes:
+        if str(node["id"]) not in used:
+            free[_key(node)].append(str(node["id"]))
+    for node in new_nodes:
+        node_id = str(node["id"])
+        if node_id not in mapping and free[_key(node)]:
+            old_id = free[_key(node)].popleft()
+            mapping[node_id] = old_id
+            used.add(old_id)
+    for node in new_nodes:
+        node_id = str(node["id"])
+        if node_id not in mapping and node_id in old_by_id and node_id not in used:
+            mapping[node_id] = node_id
+            used.add(node_id)
+
+    old_neighbours: Dict[str, set] = defaultdict(set)
+    for edge in old_flow.get("edges", []):
+        old_neighbours[str(edge["source"])].add(str(edge["target"]))
+        old_neighbours[str(edge["target"])].add(str(edge["source"]))
+    new_neighbours: Dict[str, set] = defaultdict(set)
+    for edge in new_flow.get("edges", []):
+        new_neighbours[str(edge["source"])].add(str(edge["target"]))
+        new_neighbours[str(edge["target"])].add(str(edge["source"]))
+    for node in new_nodes:
+        node_id = str(node["id"])
+        if node_id in mapping:
+            continue
+        # Where the matched neighbours of this node were, an unmatched old node of the same shape took its place
+        anchors = {mapping[n] for n in new_neighbours[node_id] if n in mapping}
+        shape = node.get("shape", "rectangle")
+        shared: Dict[str, int] = defaultdict(int)
+        for anchor in anchors:
+            for candidate in old_neighbours[anchor]:
+                if candidate in old_by_id and candidate not in used and old_by_id[candidate].get("shape", "rectangle") == shape:
+                    shared[candidate] += 1
+        if shared:
+            old_id = max(shared, key=lambda candidate: (shared[candidate], candidate))
+            if 2 * shared[old_id] >= len(anchors | old_neighbours[old_id]):
+                mapping[node_id] = old_id
+                used.add(old_id)
+    return mapping
+
+
+def stabilize_ids(old_flow: Dict, new_flow: Dict) -> Tuple[Dict, Dict[str, str]]:
+    """
+    The new flow with matched nodes renamed to their old ids.
+
+    Returns:
+        The renamed flow, and the mapping from each new node's id to the id it now has.
+    """
+    matched = match_nodes(old_flow, new_flow)
+    taken = set(matched.values())
+    renamed: Dict[str, str] = {}
+    for node in new_flow.get("nodes", []):
+        node_id = str(node["id"])
+        if node_id in matched:
+            renamed[node_id] = matched[node_id]
+            continue
+        # An added node keeps its id unless an old node now uses it
+        fresh, suffix = node_id, 1
+        while fresh in taken:
+            fresh = f"{node_id}_{suffix}"
+            suffix += 1
+        taken.add(fresh)
+        renamed[node_id] = fresh
+    nodes = [
+        # data keeps what action validation recorded, such as original_label
+        {"id": renamed[str(n["id"])], "data": dict(n.get("data") or {}, label=_label(n)), "shape": n.get("shape", "rectangle")}
+        for n in new_flow.get("nodes", [])
+    ]
+    edges = []
+    for edge in new_flow.get("edges", []):
+        source, target = str(edge["source"]), str(edge["target"])
+        renamed_edge = {"source": renamed.get(source, source), "target": renamed.get(target, target)}
+        if edge.get("label"):
+            renamed_edge["label"] = edge["label"]
+        edges.append(renamed_edge)
+    return {"nodes": nodes, "edges": edges}, renamed
+
+
+def _sizes(nodes: List[Dict]) -> Dict[str, Tuple[float, float]]:
+    # Nodes are sized by their label as drawn, like the renderer lays them out
+    return {node["id"]: node_size(display_label(_label(node))) for node in nodes}
+
+
+def full_layout(flow: Dict) -> Dict:
+    """The flow with every node positioned by layout_flow."""
+    laid_out, _ = layout_flow(FlowGraph.from_dict(flow).with_labels(display_label))
+    positions = {node.id: node.position.to_dict() for node in laid_out.nodes}
+    nodes = [dict(node, position=positions[node["id"]]) for node in flow["nodes"] if node["id"] in positions]
+    return {"nodes": nodes, "edges": flow["edges"]}
+
+
+def _same_position(a: Dict, b: Dict) -> bool:
+    return all(abs(a[key] - b[key]) <= POSITION_TOLERANCE for key in ("x", "y", "width", "height"))
+
+
+def incremental_layout(old_flow: Dict, new_flow: Dict) -> Tuple[Dict, Dict]:
+    """
+    Positions a flow whose ids were stabilized against a laid-out old flow, placing only the changed ranks again.
+
+    Returns:
+        The laid-out flow, and stats: ranks, relaid ranks, and whether it fell back to a full layout.
+    """
+    nodes = new_flow["nodes"]
+    if not nodes:
+        return {"nodes": [], "edges": new_flow["edges"]}, {"ranks": 0, "relaid_ranks": 0, "full": False}
+    ids = [node["id"] for node in nodes]
+    sizes = _sizes(nodes)
+    rank = rank_nodes(ids, [(e["source"], e["target"]) for e in new_flow["edges"]])
+    layers: Dict[int, List[str]] = defaultdict(list)
+    for node_id in ids:
+        layers[rank[node_id]].append(node_id)
+
+    old_positions = {node["id"]: node["position"] for node in old_flow.get("nodes", []) if "position" in node}
+    old_rows: Dict[float, set] = defaultdict(set)
+    for node_id, position in old_positions.items():
+        old_rows[position["y"]].add(node_id)
+
+    def unchanged(node_id: str) -> bool:
+        position = old_positions.get(node_id)
+        return position is not None and (position["width"], position["height"]) == sizes[node_id]
+
+    dirty = []
+    for r, members in layers.items():
+        rows = {old_positions[m]["y"] for m in members if m in old_positions}
+        clean = (len(rows) == 1 and set(members) == old_rows[next(iter(rows))]
+                 and all(unchanged(m) for m in members))
+        if not clean:
+            dirty.append(r)
+    if len(dirty) > INCREMENTAL_MAX_DIRTY * len(layers):
+        return full_layout(new_flow), {"ranks": len(layers), "relaid_ranks": len(layers), "full": True}
+
+    center = {m: old_positions[m]["x"] + old_positions[m]["width"] / 2
+              for r, members in layers.items() if r not in dirty for m in members}
+    neighbours: Dict[str, List[str]] = defaultdict(list)
+    for edge in new_flow["edges"]:
+        neighbours[edge["source"]].append(edge["target"])
+        neighbours[edge["target"]].append(edge["source"])
+    fallback = median(list(center.values())) if center else 0.0
+    for r in sorted(dirty):
+        targets = {}
+        for m in layers[r]:
+            if unchanged(m):
+                targets[m] = old_positions[m]["x"] + old_positions[m]["width"] / 2
+            else:
+                placed = [center[n] for n in neighbours[m] if n in center]
+                targets[m] = median(placed) if placed else fallback
+        order = sorted(layers[r], key=lambda m: targets[m])
+        gaps = [(sizes[a][0] + sizes[b][0]) / 2 + X_SPACING for a, b in zip(order, order[1:])]
+        for m, x in zip(order, isotonic_positions([targets[m] for m in order], gaps)):
+            center[m] = x
+
+    positions = {}
+    y = 0.0
+    for r in sorted(layers):
+        for m in layers[r]:
+            width, height = sizes[m]
+            position = {"x": center[m] - width / 2, "y": y, "width": width, "height": height}
+            # A node that stayed put keeps its old position exactly, so diagram_patch doesn't report it as moved
+            old = old_positions.get(m)
+            positions[m] = old if old is not None and _same_position(old, position) else position
+        y += max(sizes[m][1] for m in layers[r]) + Y_SPACING
+    laid_out = [dict(node, position=positions[node["id"]]) for node in nodes]
+    return {"nodes": laid_out, "edges": new_flow["edges"]}, {"ranks": len(layers), "relaid_ranks": len(dirty), "full": False}
+
+
+def diagram_patch(old_flow: Dict, new_flow: Dict) -> Dict:
+    """The changes that turn a laid-out old flow into a laid-out new flow with stabilized ids."""
+    old_nodes = {node["id"]: node for node in old_flow.get("nodes", [])}
+    new_nodes = {node["id"]: node for node in new_flow.get("nodes", [])}
+    added, relabeled, moved = [], [], []
+    for node_id, node in new_nodes.items():
+        old = old_nodes.get(node_id)
+        if old is None:
+            added.append(node)
+        elif _label(old) != _label(node) or old.get("shape", "rectangle") != node.get("shape", "rectangle"):
+            relabeled.append(node)
+        elif old.get("position") != node.get("position"):
+            moved.append({"id": node_id, "position": node.get("position")})
+    old_edges = {_edge_key(e): e for e in old_flow.get("edges", [])}
+    new_edges = {_edge_key(e): e for e in new_flow.get("edges", [])}
+    return {
+        "base": flow_hash(old_flow),
+        "hash": flow_hash(new_flow),
+        "added": added,
+        "removed": [node_id for node_id in old_nodes if node_id not in new_nodes],
+        "relabeled": relabeled,
+        "moved": moved,
+        "edges_added": [e for key, e in new_edges.items() if key not in old_edges],
+        "edges_removed": [e for key, e in old_edges.items() if key not in new_edges],
+    }
+
+
+def apply_patch(flow: Dict, patch: Dict) -> Dict:
+    """
+    Rebuilds the new flow from the base flow of a patch.
+
+    Raises:
+        ValueError: The flow is not the patch's base.
+    """
+    if flow_hash(flow) != patch["base"]:
+        raise ValueError("The patch does not apply to this flow")
+    removed = set(patch["removed"])
+    replaced = {node["id"]: node for node in patch["relabeled"]}
+    moved = {item["id"]: item["position"] for item in patch["moved"]}
+    nodes = []
+    for node in flow["nodes"]:
+        if node["id"] in removed:
+            continue
+        node = replaced.get(node["id"], node)
+        if node["id"] in moved:
+            node = dict(node, position=moved[node["id"]])
+        nodes.append(node)
+    nodes.extend(patch["added"])
+    dropped = {_edge_key(e) for e in patch["edges_removed"]}
+    edges = [e for e in flow["edges"] if _edge_key(e) not in dropped] + patch["edges_added"]
+    return {"nodes": nodes, "edges": edges}
+
+
+def update_flow(old_flow: Optional[Dict], new_flow: Dict) -> Tuple[Dict, Optional[Dict], Dict]:
+    """
+    Carries a session's flow forward to the newest mapping output.
+
+    Args:
+        old_flow: The session's current laid-out flow, or None on the first turn.
+        new_flow: The {"nodes", "edges"} the pipeline produced for this turn.
+
+    Returns:
+        The laid-out flow with stabilized ids, the patch from the old flow (None on
+        the first turn), and layout stats.
+    """
+    if old_flow is None:
+        flow, _ = stabilize_ids({"nodes": [], "edges": []}, new_flow)
+        return full_layout(flow), None, {"ranks": None, "relaid_ranks": None, "full": True}
+    flow, _ = stabilize_ids(old_flow, new_flow)
+    flow, stats = incremental_layout(old_flow, flow)
+    return flow, diagram_patch(old_flow, flow), stats
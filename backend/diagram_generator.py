@@ -1,5 +1,12 @@
+import os
+from functools import lru_cache
+from typing import Tuple
+
 import networkx as nx
 
+from backend.flow_models import FlowGraph, Position
+from backend.layered_layout import layered_layout
+
 # Configuration for graph layout and rendering
 DEFAULT_CHAR_WIDTH_ESTIMATE = 35  # Average pixels per character for node width calculation
 DEFAULT_LINE_HEIGHT_ESTIMATE = 50  # Pixels per line for node height calculation
@@ -16,6 +23,13 @@ SAFETY_FACTOR_HEIGHT = 1.5
 # Maximum characters per line before inserting <br/>
 MAX_CHARS_PER_LINE = 30
 
+# Gaps between nodes of a rank and between ranks
+X_SPACING = 80
+Y_SPACING = 150
+
+# "layered" (crossing-minimizing Sugiyama layout) or "rank" (the original BFS rank layout)
+LAYOUT_ENGINE = os.getenv("LAYOUT_ENGINE", "layered")
+
 def wrap_text_with_br(text: str, max_chars: int) -> str:
     """Wraps text by inserting <br/> tags if a line exceeds max_chars."""
     wrapped_lines = []
@@ -42,13 +56,67 @@ def wrap_text_with_br(text: str, max_chars: int) -> str:
 
     return '<br/>'.join(wrapped_lines)
 
+def display_label(label: str) -> str:
+    """A node label as diagrams show it: without the tool name prefix, wrapped with <br/>."""
+    # Remove tool name prefix robustly (case-insensitive, strip whitespace)
+    prefixes = ["Power Automate: ", "Automation Anywhere: "]
+    for prefix in prefixes:
+        if label.lower().startswith(prefix.lower()):
+            label = label[len(prefix):].lstrip()
+    return wrap_text_with_br(label, MAX_CHARS_PER_LINE)
+
+def node_size(label: str):
+    """The (width, height) a node needs for its label, with <br/> line breaks."""
+    lines = label.split('<br/>')
+
+    current_node_text_width = 0
+    for line in lines:
+        current_node_text_width = max(current_node_text_width, len(line) * DEFAULT_CHAR_WIDTH_ESTIMATE)
+
+    node_calculated_width = (current_node_text_width + PADDING_WIDTH) * SAFETY_FACTOR_WIDTH
+    node_calculated_height = (len(lines) * DEFAULT_LINE_HEIGHT_ESTIMATE + PADDING_HEIGHT) * SAFETY_FACTOR_HEIGHT
+    return node_calculated_width, node_calculated_height
+
+def layout_flow(graph: FlowGraph) -> Tuple[FlowGraph, float]:
+    """
+    Lays out a flow, sizing each node by its label as given.
+
+    LAYOUT_ENGINE picks the layered (Sugiyama) layout of backend/layered_layout.py
+    or the original BFS rank layout ("rank").
+
+    Returns:
+        A new snapshot with every node positioned (the graph passed in is not
+        changed), and the height of the diagram plus a rank gap.
+    """
+    sizes = {node.id: node_size(node.label) for node in graph.nodes}
+    ids = list(sizes)
+    edges = [(edge.source, edge.target) for edge in graph.edges]
+
+    if LAYOUT_ENGINE == "rank":
+        corners = _rank_layout(ids, sizes, edges)
+    else:
+        corners, _ = layered_layout(ids, sizes, edges, X_SPACING, Y_SPACING)
+    positions = {node_id: Position(x, y, *sizes[node_id]) for node_id, (x, y) in corners.items() if node_id in sizes}
+
+    max_y = max((position.y + position.height for position in positions.values()), default=0)
+    return graph.with_positions(positions), max_y + Y_SPACING
+
 def layout_graph(nodes, edges):
-    """Calculate layout positions for nodes in the graph."""
+    """
+    Calculate layout positions for nodes in the graph.
+
+    The dict form of layout_flow: returns copies of the nodes with a `position`
+    added, and the height of the diagram. The nodes passed in are not changed.
+    """
+    laid_out, max_y = layout_flow(FlowGraph.from_dict({"nodes": nodes, "edges": edges}))
+    positions = {node.id: node.position.to_dict() for node in laid_out.nodes}
+    return [dict(node, position=positions[str(node["id"])]) for node in nodes], max_y
+
+def _rank_layout(ids, sizes, edges):
+    """Ranks by BFS from the sources; each rank in id order, centred on the widest. Returns top-left corners by id."""
     G = nx.DiGraph()
-    for node in nodes:
-        G.add_node(node["id"])
-    for edge in edges:
-        G.add_edge(edge["source"], edge["target"])
+    G.add_nodes_from(ids)
+    G.add_edges_from(edges)
 
     # Calculate ranks
     ranks = {node_id: 0 for node_id in G.nodes()}
@@ -68,10 +136,6 @@ def layout_graph(nodes, edges):
             else:
                 ranks[successor] = max(ranks[successor], current_rank + 1)
 
-    for node_id in G.nodes():
-        if node_id not in ranks:
-            ranks[node_id] = 0
-
     # Group nodes by rank
     nodes_by_rank = {}
     for node_id, rank in ranks.items():
@@ -81,90 +145,85 @@ def layout_graph(nodes, edges):
 
     sorted_ranks = sorted(nodes_by_rank.keys())
 
-    # Calculate node dimensions
-    for node in nodes:
-        node_label = node["data"]["label"]
-        lines = node_label.split('<br/>')
-
-        current_node_text_width = 0
-        for line in lines:
-            current_node_text_width = max(current_node_text_width, len(line) * DEFAULT_CHAR_WIDTH_ESTIMATE)
-
-        node_calculated_width = (current_node_text_width + PADDING_WIDTH) * SAFETY_FACTOR_WIDTH
-        node_calculated_height = (len(lines) * DEFAULT_LINE_HEIGHT_ESTIMATE + PADDING_HEIGHT) * SAFETY_FACTOR_HEIGHT
-
-        node["calculated_width"] = node_calculated_width
-        node["calculated_height"] = node_calculated_height
-
     # Layout nodes
-    x_spacing = 80
-    y_spacing = 150
-
+    x_spacing = X_SPACING
+    y_spacing = Y_SPACING
+
+    rank_widths = {
+        rank: sum(sizes[node_id][0] for node_id in nodes_by_rank[rank] if node_id in sizes)
+        + (len(nodes_by_rank[rank]) - 1) * x_spacing
+        for rank in sorted_ranks
+    }
+    # Rows are centred on the widest one (or the viewbox, if wider)
+    layout_width = max([DEFAULT_VIEWBOX_WIDTH] + list(rank_widths.values()))
+
+    # Each rank starts below the tallest node of the rank above it
+    corners = {}
+    current_y_position = 0
     for rank in sorted_ranks:
         current_rank_nodes = nodes_by_rank[rank]
         current_rank_nodes.sort()
 
-        current_rank_total_width = sum(next((n["calculated_width"] for n in nodes if n["id"] == node_id), 0) for node_id in current_rank_nodes) + (len(current_rank_nodes) - 1) * x_spacing
-        current_rank_start_x_offset = (DEFAULT_VIEWBOX_WIDTH - current_rank_total_width) / 2 if current_rank_total_width < DEFAULT_VIEWBOX_WIDTH else 0
-
-        current_x_position = current_rank_start_x_offset
+        current_x_position = (layout_width - rank_widths[rank]) / 2
+        current_rank_height = 0
         for node_id in current_rank_nodes:
-            node = next((n for n in nodes if n["id"] == node_id), None)
-            if node:
-                node["position"] = {
-                    "x": current_x_position,
-                    "y": rank * (max(next((n["calculated_height"] for n in nodes if n["id"] == node_id), 0) for node_id in current_rank_nodes) + y_spacing),
-                    "width": node["calculated_width"],
-                    "height": node["calculated_height"]
-                }
-                current_x_position += node["calculated_width"] + x_spacing
-
-    max_y = 0
-    for node in nodes:
-        if "position" in node and node["position"]["y"] + node["position"]["height"] > max_y:
-            max_y = node["position"]["y"] + node["position"]["height"]
-
-    max_y += y_spacing
-    return nodes, max_y
+            if node_id in sizes:
+                width, height = sizes[node_id]
+                corners[node_id] = (current_x_position, current_y_position)
+                current_x_position += width + x_spacing
+                current_rank_height = max(current_rank_height, height)
+        current_y_position += current_rank_height + y_spacing
+    return corners
+
+
+# Node label style, set once for the diagram rather than inline on every node
+MERMAID_NODE_CSS = "padding: 15px; white-space: pre-wrap; text-align: center; font-weight: bold; font-size: 16px; line-height: 1.5; word-wrap: break-word; max-width: 300px; display: inline-block;"
+MERMAID_HEADER = f'%%{{init: {{"themeCSS": ".nodeLabel {{ {MERMAID_NODE_CSS} }}"}}}}%%\ngraph TD\n'
+
+@lru_cache(maxsize=4096)
+def mermaid_node_line(node_id: str, label: str, shape: str) -> str:
+    """
+    One node's Mermaid definition.
+
+    Cached, so regenerating the diagram of an edited flow only formats the nodes that changed.
+    """
+    node_label = display_label(label)
+
+    # Escape special characters
+    node_label = node_label.replace("\\", "\\\\")
+    node_label = node_label.replace("[", "\\[")
+    node_label = node_label.replace("]", "\\]")
+    node_label = node_label.replace("{", "\\{")
+    node_label = node_label.replace("}", "\\}")
+    node_label = node_label.replace("(", "\\(")
+    node_label = node_label.replace(")", "\\)")
+    node_label = node_label.replace("<", "&lt;")
+    node_label = node_label.replace(">", "&gt;")
+    node_label = node_label.replace("\n", "<br/>")
+
+    if shape == "diamond":
+        return f'    {node_id}{{"{node_label}"}}\n'
+    return f'    {node_id}["{node_label}"]\n'
 
 def generate_mermaid_diagram(nodes, edges):
     """Generate Mermaid diagram syntax from nodes and edges."""
-    mermaid_syntax = "graph TD\n"
-    style = "padding: 15px; white-space: pre-wrap; text-align: center; font-weight: bold; font-size: 16px; line-height: 1.5; word-wrap: break-word; max-width: 300px; display: inline-block;"
+    lines = [MERMAID_HEADER]
 
     # Define nodes
     for node in nodes:
-        node_id = node["id"]
-        node_label = node["data"]["label"]
-        # Remove tool name prefix robustly (case-insensitive, strip whitespace)
-        prefixes = ["Power Automate: ", "Automation Anywhere: "]
-        for prefix in prefixes:
-            if node_label.lower().startswith(prefix.lower()):
-                node_label = node_label[len(prefix):].lstrip()
-        node_label = wrap_text_with_br(node_label, MAX_CHARS_PER_LINE)
-
-        # Escape special characters
-        node_label = node_label.replace("\\", "\\\\")
-        node_label = node_label.replace("[", "\\[")
-        node_label = node_label.replace("]", "\\]")
-        node_label = node_label.replace("{", "\\{")
-        node_label = node_label.replace("}", "\\}")
-        node_label = node_label.replace("(", "\\(")
-        node_label = node_label.replace(")", "\\)")
-        node_label = node_label.replace("<", "&lt;")
-        node_label = node_label.replace(">", "&gt;")
-        node_label = node_label.replace("\n", "<br/>")
-
-        shape = node.get("shape", "rectangle")
-        if shape == "diamond":
-            mermaid_syntax += f'    {node_id}{{"<div style=\"{style}\">{node_label}</div>"}}\n'
-        else:
-            mermaid_syntax += f'    {node_id}["<div style=\"{style}\">{node_label}</div>"]\n'
+        lines.append(mermaid_node_line(node["id"], node["data"]["label"], node.get("shape", "rectangle")))
 
     # Define edges
     for edge in edges:
         source_id = edge["source"]
         target_id = edge["target"]
-        mermaid_syntax += f"    {source_id} --> {target_id}\n"
+        lines.append(f"    {source_id} --> {target_id}\n")
+
+    return "".join(lines)
 
-    return mermaid_syntax
\ No newline at end of file
+def flow_mermaid(graph: FlowGraph) -> str:
+    """generate_mermaid_diagram for a FlowGraph."""
+    lines = [MERMAID_HEADER]
+    lines.extend(mermaid_node_line(node.id, node.label, node.shape) for node in graph.nodes)
+    lines.extend(f"    {edge.source} --> {edge.target}\n" for edge in graph.edges)
+    return "".join(lines)
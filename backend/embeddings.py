@@ -0,0 +1,221 @@
+"""
+Process-wide micro-batching of query embeddings.
+
+Every caller queues its texts with the shared EmbeddingScheduler: rpa_actions_search
+tool calls running in crew threads, intent cache lookups, and async /search
+handlers. A collector thread takes the first queued text, keeps collecting
+for EMBEDDING_BATCH_WINDOW_MS or until EMBEDDING_MAX_BATCH texts, and sends
+them as one `embeddings.create` request on the pooled async client, from an
+event loop of its own. Each vector is resolved on the future of the caller
+that asked for it.
+
+Backpressure: at most EMBEDDING_MAX_INFLIGHT batches are sent at once. While
+all of them are busy, texts wait in a queue bounded by EMBEDDING_MAX_QUEUE.
+A caller that cannot enqueue within EMBEDDING_QUEUE_TIMEOUT seconds gets
+EmbeddingQueueFull. Threads block on the queue; async callers await a future
+the collector resolves when it takes texts off the queue. Batch sizes, queue
+waits and outcomes go to /metrics.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from backend.services import aembed_texts
+from backend.tracing import Counter, Histogram, register
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_MAX_INFLIGHT = int(os.getenv("EMBEDDING_MAX_INFLIGHT", "4"))
+EMBEDDING_MAX_QUEUE = int(os.getenv("EMBEDDING_MAX_QUEUE", "1024"))
+EMBEDDING_QUEUE_TIMEOUT = float(os.getenv("EMBEDDING_QUEUE_TIMEOUT", "30"))
+
+BATCH_SIZE = register(Histogram(
+    "flowpilot_embedding_batch_size", "Texts per batched embeddings request.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+))
+QUEUE_WAIT = register(Histogram(
+    "flowpilot_embedding_queue_wait_seconds", "Time texts waited in the scheduler queue before their batch was sent.",
+))
+BATCHES = register(Counter("flowpilot_embedding_batches_total", "Batched embeddings requests, by outcome."))
+REJECTED = register(Counter("flowpilot_embedding_rejected_total", "Texts rejected because the scheduler queue was full."))
+
+
+class EmbeddingQueueFull(RuntimeError):
+    """The scheduler queue stayed full for longer than the enqueue timeout."""
+
+
+class EmbeddingScheduler:
+    """Queues texts from every thread and event loop and embeds them in batches."""
+
+    def __init__(
+        self,
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+        max_batch: int = EMBEDDING_MAX_BATCH,
+        max_inflight: int = EMBEDDING_MAX_INFLIGHT,
+        max_queue: int = EMBEDDING_MAX_QUEUE,
+        queue_timeout: float = EMBEDDING_QUEUE_TIMEOUT,
+    ):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue_timeout = queue_timeout
+        # Items are (text, future, enqueued at)
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue(maxsize=max_queue)
+        self._slots = threading.Semaphore(max_inflight)
+        # Async callers waiting for queue space
+        self._space_waiters: List[asyncio.Future] = []
+        self._lock = threading.Lock()
+        # Batches are sent concurrently from one event loop, on its pooled async client
+        self._loop = asyncio.new_event_loop()
+        self._sender = threading.Thread(target=self._loop.run_forever, name="embedding-sender", daemon=True)
+        self._sender.start()
+        self._stats = {"texts": 0, "batches": 0, "upstream_inputs": 0, "failed_batches": 0, "rejected": 0}
+        self._collector = threading.Thread(target=self._collect, name="embedding-scheduler", daemon=True)
+        self._collector.start()
+
+    def submit(self, text: str, timeout: Optional[float] = None) -> Future:
+        """
+        Queues text for the next batch.
+
+        Args:
+            text: The text to embed.
+            timeout: Seconds to wait for queue space; defaults to the scheduler's timeout.
+
+        Returns:
+            A future resolving to the embedding.
+
+        Raises:
+            EmbeddingQueueFull: No queue space became free in time.
+        """
+        future = self._enqueue(text, self.queue_timeout if timeout is None else timeout)
+        if future is None:
+            self._reject()
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        """The embedding for text; blocks the calling thread."""
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> List[float]:
+        """The embedding for text, awaited without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        future = self._enqueue(text, 0)
+        while future is None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self._reject()
+            waiter = loop.create_future()
+            with self._lock:
+                self._space_waiters.append(waiter)
+            # Space freed before the waiter was registered would not wake it
+            future = self._enqueue(text, 0)
+            if future is None:
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                future = self._enqueue(text, 0)
+            with self._lock:
+                if waiter in self._space_waiters:
+                    self._space_waiters.remove(waiter)
+        return await asyncio.wrap_future(future)
+
+    def _enqueue(self, text: str, timeout: float) -> Optional[Future]:
+        future: Future = Future()
+        try:
+            if timeout > 0:
+                self._queue.put((text, future, time.perf_counter()), timeout=timeout)
+            else:
+                self._queue.put_nowait((text, future, time.perf_counter()))
+        except queue.Full:
+            return None
+        return future
+
+    def _wake_space_waiters(self) -> None:
+        with self._lock:
+            waiters, self._space_waiters = self._space_waiters, []
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+
+    def _reject(self) -> None:
+        with self._lock:
+            self._stats["rejected"] += 1
+        REJECTED.inc()
+        raise EmbeddingQueueFull(f"Embedding queue is full ({self._queue.maxsize} texts waiting)")
+
+    def _collect(self) -> None:
+        while True:
+            # Wait for a free sender first, so a backlog accumulates in the bounded queue
+            self._slots.acquire()
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._space_waiters:
+                self._wake_space_waiters()
+            asyncio.run_coroutine_threadsafe(self._send(batch), self._loop)
+
+    async def _send(self, batch: List[Tuple[str, Future, float]]) -> None:
+        try:
+            sent_at = time.perf_counter()
+            for _, _, enqueued in batch:
+                QUEUE_WAIT.observe(sent_at - enqueued)
+            # Identical texts in a batch share one input
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            BATCH_SIZE.observe(len(texts))
+            try:
+                vectors = dict(zip(texts, await aembed_texts(texts)))
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+                BATCHES.inc(outcome="error")
+                with self._lock:
+                    self._stats["failed_batches"] += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                return
+            BATCHES.inc(outcome="ok")
+            with self._lock:
+                self._stats["texts"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["upstream_inputs"] += len(texts)
+            for text, future, _ in batch:
+                future.set_result(vectors[text])
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["avg_batch_size"] = stats["texts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_scheduler: Optional[EmbeddingScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_embedding_scheduler() -> EmbeddingScheduler:
+    """The process-wide scheduler, started on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = EmbeddingScheduler()
+    return _scheduler
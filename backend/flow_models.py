@@ -0,0 +1,200 @@
+"""
+The typed flow graph shared by the agents, the diagram generator and the API.
+
+Flows used to travel between run_crew, layout_graph and generate_mermaid_diagram
+as raw {"nodes", "edges"} dicts. Every stage looked up keys with defaults, and
+layout_graph wrote calculated sizes and positions into the dicts it was given.
+A FlowGraph is an immutable snapshot instead. Its nodes and edges are frozen
+slotted dataclasses held in tuples, so a node costs a few pointers rather than
+three nested dicts. Laying a flow out returns a new snapshot that shares the
+unchanged parts with the old one (see diagram_generator.layout_flow).
+
+Adjacency indexes (node by id, successors, predecessors) are built on first
+use and kept on the snapshot. to_json() and from_json() use orjson when it is
+installed, and the standard json module otherwise. to_dict() gives the dict
+format the API, the sessions and the renderer speak.
+"""
+import json
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value) -> str:
+    """Compact JSON text, encoded with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"))
+
+
+def loads(text):
+    """Parses JSON text (str or bytes), with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+@dataclass(frozen=True, slots=True)
+class Position:
+    """A node's box in diagram coordinates: top-left corner and size."""
+    x: float
+    y: float
+    width: float
+    height: float
+
+    def to_dict(self) -> Dict:
+        return {"x": self.x, "y": self.y, "width": self.width, "height": self.height}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Position":
+        return cls(float(data["x"]), float(data["y"]), float(data["width"]), float(data["height"]))
+
+
+@dataclass(frozen=True, slots=True)
+class FlowNode:
+    """One action, decision or terminal of a flow."""
+    id: str
+    label: str
+    shape: str = "rectangle"
+    position: Optional[Position] = None
+    # The mapped label, when action validation snapped it to a catalog name
+    original_label: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        data = {"label": self.label}
+        if self.original_label is not None:
+            data["original_label"] = self.original_label
+        node = {"id": self.id, "data": data, "shape": self.shape}
+        if self.position is not None:
+            node["position"] = self.position.to_dict()
+        return node
+
+    @classmethod
+    def from_dict(cls, node: Dict) -> "FlowNode":
+        data = node.get("data") or {}
+        position = node.get("position")
+        return cls(
+            str(node["id"]),
+            str(data.get("label", node.get("label", ""))),
+            node.get("shape") or "rectangle",
+            Position.from_dict(position) if position else None,
+            data.get("original_label"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class FlowEdge:
+    """A connection between two nodes; decision branches are labelled."""
+    source: str
+    target: str
+    label: str = ""
+
+    def to_dict(self) -> Dict:
+        edge = {"source": self.source, "target": self.target}
+        if self.label:
+            edge["label"] = self.label
+        return edge
+
+    @classmethod
+    def from_dict(cls, edge: Dict) -> "FlowEdge":
+        return cls(str(edge["source"]), str(edge["target"]), edge.get("label") or "")
+
+
+class FlowGraph:
+    """An immutable snapshot of a flow's nodes and edges, with adjacency indexes built on demand."""
+
+    __slots__ = ("nodes", "edges", "_by_id", "_successors", "_predecessors")
+
+    def __init__(self, nodes: Iterable[FlowNode] = (), edges: Iterable[FlowEdge] = ()):
+        set_slot = object.__setattr__
+        set_slot(self, "nodes", tuple(nodes))
+        set_slot(self, "edges", tuple(edges))
+        set_slot(self, "_by_id", None)
+        set_slot(self, "_successors", None)
+        set_slot(self, "_predecessors", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"FlowGraph is immutable; cannot set {name}")
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FlowGraph) and self.nodes == other.nodes and self.edges == other.edges
+
+    def __hash__(self) -> int:
+        return hash((self.nodes, self.edges))
+
+    def __repr__(self) -> str:
+        return f"FlowGraph({len(self.nodes)} nodes, {len(self.edges)} edges)"
+
+    @classmethod
+    def from_dict(cls, flow: Optional[Dict]) -> "FlowGraph":
+        """
+        A snapshot of a {"nodes", "edges"} flow dict.
+
+        Ids are coerced to strings. Nodes without an id and edges without both
+        endpoints are left out, as the diagram tools cannot draw them.
+        """
+        flow = flow or {}
+        nodes = [FlowNode.from_dict(node) for node in flow.get("nodes") or [] if isinstance(node, dict) and "id" in node]
+        edges = [FlowEdge.from_dict(edge) for edge in flow.get("edges") or []
+                 if isinstance(edge, dict) and "source" in edge and "target" in edge]
+        return cls(nodes, edges)
+
+    @classmethod
+    def from_json(cls, text) -> "FlowGraph":
+        """A snapshot of a flow in JSON text; raises ValueError if the text is not JSON."""
+        return cls.from_dict(loads(text) if text else None)
+
+    def to_dict(self) -> Dict:
+        return {"nodes": [node.to_dict() for node in self.nodes], "edges": [edge.to_dict() for edge in self.edges]}
+
+    def to_json(self) -> str:
+        return dumps(self.to_dict())
+
+    def node(self, node_id: str) -> Optional[FlowNode]:
+        """The node with an id, or None; with repeated ids, the first one."""
+        if self._by_id is None:
+            by_id: Dict[str, FlowNode] = {}
+            for node in self.nodes:
+                by_id.setdefault(node.id, node)
+            object.__setattr__(self, "_by_id", by_id)
+        return self._by_id.get(node_id)
+
+    def successors(self, node_id: str) -> Tuple[str, ...]:
+        if self._successors is None:
+            object.__setattr__(self, "_successors", self._adjacency(lambda e: (e.source, e.target)))
+        return self._successors.get(node_id, ())
+
+    def predecessors(self, node_id: str) -> Tuple[str, ...]:
+        if self._predecessors is None:
+            object.__setattr__(self, "_predecessors", self._adjacency(lambda e: (e.target, e.source)))
+        return self._predecessors.get(node_id, ())
+
+    def _adjacency(self, ends: Callable[[FlowEdge], Tuple[str, str]]) -> Dict[str, Tuple[str, ...]]:
+        lists: Dict[str, List[str]] = {}
+        for edge in self.edges:
+            start, end = ends(edge)
+            lists.setdefault(start, []).append(end)
+        return {node_id: tuple(neighbours) for node_id, neighbours in lists.items()}
+
+    @property
+    def positioned(self) -> bool:
+        """Whether every node has a position (the flow is laid out)."""
+        return all(node.position is not None for node in self.nodes)
+
+    def with_positions(self, positions: Dict[str, Position]) -> "FlowGraph":
+        """A new snapshot with the given nodes moved; the edges are shared."""
+        nodes = [FlowNode(n.id, n.label, n.shape, positions[n.id], n.original_label) if n.id in positions else n
+                 for n in self.nodes]
+        return FlowGraph(nodes, self.edges)
+
+    def with_labels(self, relabel: Callable[[str], str]) -> "FlowGraph":
+        """A new snapshot with every label passed through relabel (e.g. display_label)."""
+        nodes = [FlowNode(n.id, relabel(n.label), n.shape, n.position, n.original_label) for n in self.nodes]
+        return FlowGraph(nodes, self.edges)
@@ -0,0 +1,292 @@
+"""
+Semantic cache of precomputed structuring and retrieval results for common workflow intents.
+
+An offline job clusters historical queries by embedding similarity. For each
+cluster it runs the Requirement Analyst once on the most central query and
+retrieves the candidate actions for every resulting step. At request time a
+query whose embedding lies within the similarity threshold of a cluster
+centroid reuses those results. That skips the structuring agent and every
+rpa_actions_search call.
+
+Historical queries are read from a text file (one query per line) or a JSONL
+file of {"query": ..., "tool_choice": ...} records.
+
+Usage:
+    python -m backend.intent_cache build queries.jsonl [--tool-choice power_automate]
+    python -m backend.intent_cache stats
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.services import embed_texts, search_rpa_actions
+from backend.structured_steps import split_structured_steps
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv(
+    "INTENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_cache"),
+)
+# Minimum cosine similarity between a query and a cluster centroid for a hit
+SIMILARITY_THRESHOLD = float(os.getenv("INTENT_CACHE_THRESHOLD", "0.93"))
+# Minimum similarity for two historical queries to share a cluster
+CLUSTER_THRESHOLD = 0.9
+EMBED_BATCH_SIZE = 256
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def cluster_queries(embeddings: np.ndarray, threshold: float = CLUSTER_THRESHOLD, min_size: int = 2) -> List[List[int]]:
+    """
+    Group normalized query embeddings into intent clusters.
+
+    Leader clustering assigns each query to the closest running-mean centroid
+    above the threshold or starts a new cluster. A second pass reassigns
+    every query to its nearest final centroid. Clusters smaller than
+    min_size are dropped: one-off queries are not common intents.
+    """
+    sums: List[np.ndarray] = []
+    centroids: List[np.ndarray] = []
+    for vector in embeddings:
+        if centroids:
+            sims = np.stack(centroids) @ vector
+            best = int(np.argmax(sims))
+            if sims[best] >= threshold:
+                # Running mean keeps the centroid at the middle of the intent
+                sums[best] = sums[best] + vector
+                centroids[best] = _normalize(sums[best])
+                continue
+        sums.append(vector.copy())
+        centroids.append(vector)
+    if not centroids:
+        return []
+
+    assignment = np.argmax(embeddings @ np.stack(centroids).T, axis=1)
+    clusters = [np.flatnonzero(assignment == c).tolist() for c in range(len(centroids))]
+    return [members for members in clusters if len(members) >= min_size]
+
+
+def load_queries(path: str, default_tool: str) -> List[Tuple[str, str]]:
+    """Read (query, tool_choice) pairs from a text or JSONL file."""
+    queries = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                queries.append((record["query"], record.get("tool_choice", default_tool)))
+            else:
+                queries.append((line, default_tool))
+    return queries
+
+
+def build_intent_cache(
+    queries: List[Tuple[str, str]],
+    cache_dir: str = CACHE_DIR,
+    min_cluster_size: int = 2,
+    n_results: int = 10,
+) -> int:
+    """
+    Cluster historical queries and precompute results for each cluster.
+
+    Returns:
+        The number of cached intents written.
+    """
+    from backend.agents import run_structuring
+
+    texts = [query for query, _ in queries]
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(embed_texts(texts[start:start + EMBED_BATCH_SIZE]))
+    embeddings = _normalize(np.asarray(vectors, dtype=np.float32))
+
+    centroids, entries = [], []
+    for tool_choice in sorted({tool for _, tool in queries}):
+        rows = np.asarray([i for i, (_, tool) in enumerate(queries) if tool == tool_choice])
+        for members in cluster_queries(embeddings[rows], min_size=min_cluster_size):
+            member_rows = rows[members]
+            centroid = _normalize(embeddings[member_rows].mean(axis=0))
+            representative = texts[member_rows[int(np.argmax(embeddings[member_rows] @ centroid))]]
+
+            started = time.perf_counter()
+            structured_requirements = run_structuring(representative)
+            retrieved = []
+            for step in split_structured_steps(structured_requirements):
+                results = search_rpa_actions(step, n_results=n_results, collection_name=tool_choice)
+                retrieved.append({"step": step, "ids": results["ids"][0], "documents": results["documents"][0]})
+            elapsed = time.perf_counter() - started
+
+            centroids.append(centroid)
+            entries.append({
+                "intent_id": len(entries),
+                "tool_choice": tool_choice,
+                "representative_query": representative,
+                "cluster_size": len(members),
+                "structured_requirements": structured_requirements,
+                "retrieved_actions": retrieved,
+                "baseline_seconds": round(elapsed, 3),
+            })
+            logger.info(f"Cached intent {len(entries) - 1} ({len(members)} queries): {representative}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    matrix = np.stack(centroids) if centroids else np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+    # Both files are replaced atomically, entries last: servers reload the cache when the entries change
+    centroids_path = os.path.join(cache_dir, "centroids.npy")
+    with open(f"{centroids_path}.{os.getpid()}.tmp", "wb") as f:
+        np.save(f, matrix.astype(np.float32))
+    os.replace(f"{centroids_path}.{os.getpid()}.tmp", centroids_path)
+    entries_path = os.path.join(cache_dir, "entries.json")
+    with open(f"{entries_path}.{os.getpid()}.tmp", "w") as f:
+        json.dump(entries, f, indent=2, ensure_ascii=False)
+    os.replace(f"{entries_path}.{os.getpid()}.tmp", entries_path)
+    return len(entries)
+
+
+class IntentCache:
+    """Embedding-keyed lookup of precomputed intents, with hit-rate accounting."""
+
+    def __init__(self, centroids: np.ndarray, entries: List[Dict], threshold: float = SIMILARITY_THRESHOLD):
+        self.centroids = centroids
+        self.entries = entries
+        self.threshold = threshold
+        self._tools = np.asarray([entry["tool_choice"] for entry in entries])
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "latency_saved_seconds": 0.0, "lookup_seconds": 0.0}
+
+    @classmethod
+    def load(cls, cache_dir: str = CACHE_DIR) -> Optional["IntentCache"]:
+        """
+        The cache in cache_dir, or None when none has been built.
+
+        Raises:
+            ValueError: The files are unreadable, or hold a different number of centroids and entries.
+        """
+        centroids_path = os.path.join(cache_dir, "centroids.npy")
+        entries_path = os.path.join(cache_dir, "entries.json")
+        if not (os.path.exists(centroids_path) and os.path.exists(entries_path)):
+            return None
+        with open(entries_path, "r") as f:
+            entries = json.load(f)
+        centroids = np.load(centroids_path)
+        if len(centroids) != len(entries):
+            # Read between the two replaces of a rebuild
+            raise ValueError(f"{len(centroids)} centroids for {len(entries)} intents")
+        return cls(centroids, entries)
+
+    def lookup(self, query_embedding: List[float], tool_choice: str) -> Optional[Dict]:
+        """
+        Find the cached intent for a query embedding.
+
+        Returns:
+            The cached entry plus its "similarity", or None below the threshold.
+        """
+        mask = self._tools == tool_choice
+        if not mask.any():
+            return None
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        sims = np.where(mask, self.centroids @ query, -1.0)
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return dict(self.entries[best], similarity=float(sims[best]))
+
+    def record(self, entry: Optional[Dict], lookup_seconds: float) -> None:
+        """Account one lookup; a miss costs its lookup time, a hit saves the precomputed work."""
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["lookup_seconds"] += lookup_seconds
+            if entry is not None:
+                self._stats["hits"] += 1
+                self._stats["latency_saved_seconds"] += entry["baseline_seconds"] - lookup_seconds
+            else:
+                self._stats["latency_saved_seconds"] -= lookup_seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["lookups"]
+        stats["intents"] = len(self.entries)
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["avg_lookup_ms"] = 1000 * stats.pop("lookup_seconds") / lookups if lookups else 0.0
+        return stats
+
+
+_intent_cache: Optional[IntentCache] = None
+# st_mtime_ns of the entries file _intent_cache was loaded from
+_intent_cache_mtime: Optional[int] = None
+_intent_cache_lock = threading.Lock()
+
+
+def get_intent_cache() -> Optional[IntentCache]:
+    """
+    The process-wide intent cache, or None when no cache has been built.
+
+    The cache is loaded again when a build has rewritten it since, so a cache
+    built while the server runs is picked up without a restart. If that load
+    fails, the previous cache is kept and the load is retried on the next call.
+    """
+    global _intent_cache, _intent_cache_mtime
+    try:
+        # build_intent_cache writes the entries last
+        mtime = os.stat(os.path.join(CACHE_DIR, "entries.json")).st_mtime_ns
+    except OSError:
+        return None
+    if mtime != _intent_cache_mtime:
+        with _intent_cache_lock:
+            if mtime != _intent_cache_mtime:
+                try:
+                    _intent_cache = IntentCache.load()
+                    _intent_cache_mtime = mtime
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not reload the intent cache, keeping the previous one: {e}")
+    return _intent_cache
+
+
+def format_retrieved_actions(entry: Dict) -> str:
+    """Render an entry's retrieved actions for the mapping prompt."""
+    blocks = []
+    for item in entry["retrieved_actions"]:
+        docs = "\n".join(f"  - {doc.replace(chr(10), ' | ')}" for doc in item["documents"])
+        blocks.append(f"Step: {item['step']}\n{docs}")
+    return "\n\n".join(blocks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or inspect the workflow intent cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Cluster historical queries and precompute their results")
+    build.add_argument("queries_path")
+    build.add_argument("--tool-choice", default="power_automate", help="Tool for queries that do not name one")
+    build.add_argument("--min-cluster-size", type=int, default=2)
+    build.add_argument("--n-results", type=int, default=10)
+    sub.add_parser("stats", help="Summarize the cached intents")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        queries = load_queries(args.queries_path, args.tool_choice)
+        count = build_intent_cache(queries, min_cluster_size=args.min_cluster_size, n_results=args.n_results)
+        print(f"Cached {count} intents from {len(queries)} queries in {CACHE_DIR}")
+    else:
+        cache = IntentCache.load()
+        if cache is None:
+            print(f"No intent cache found in {CACHE_DIR}")
+            return
+        for entry in cache.entries:
+            print(f"[{entry['intent_id']}] {entry['tool_choice']}: {entry['representative_query']} "
+                  f"({entry['cluster_size']} queries, saves ~{entry['baseline_seconds']}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Background jobs for long-running requests, with progress that clients poll.
+
+POST /jobs hands a run_crew call to a bounded pool of job threads and returns
+at once with the job id. The pipeline calls report_progress() as it moves
+through its stages. It reports the stage it is entering and any partial
+results that are ready: the structured steps first, then the mapped flow.
+GET /jobs/{id} returns the job's latest snapshot, so a client can render the
+steps while mapping is still running.
+
+Snapshots are also written to JOBS_DIR (one JSON file per job, replaced
+atomically). Under gunicorn any worker can answer a poll for a job that
+another worker is running. Finished jobs are kept for JOB_TTL seconds. At
+most JOB_MAX_PENDING jobs may wait for a thread; beyond that, submit raises
+JobQueueFull.
+"""
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from backend.tracing import span
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "jobs"))
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "32"))
+# Seconds a finished job stays available to polls
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+
+FINISHED = ("succeeded", "failed")
+
+
+class JobQueueFull(RuntimeError):
+    """Too many jobs are waiting for a job thread."""
+
+
+class Job:
+    """One submitted pipeline run and everything a poll needs to show its progress."""
+
+    def __init__(self, job_id: str, params: Dict):
+        self.id = job_id
+        self.params = params
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.partial: Dict = {}
+        self.result = None
+        self.error: Optional[str] = None
+        self.trace_id: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # Reentrant: publish holds it across update and write so snapshots land on disk in order
+        self._lock = threading.RLock()
+
+    def update(self, **fields) -> Dict:
+        """Applies fields (partial results are merged) and returns the new snapshot."""
+        with self._lock:
+            partial = fields.pop("partial", None)
+            if partial:
+                self.partial.update(partial)
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.updated_at = time.time()
+            return self._snapshot()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> Dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "params": self.params,
+            "partial": dict(self.partial),
+            "result": self.result,
+            "error": self.error,
+            "trace_id": self.trace_id,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+# The job running in this context and the runner that stores it
+_current_job: contextvars.ContextVar[Optional[Tuple["JobRunner", Job]]] = contextvars.ContextVar("flowpilot_job", default=None)
+
+
+def report_progress(stage: str, **partial) -> None:
+    """
+    Publishes the stage the running job entered and any partial results it has.
+
+    A no-op outside a job, so the pipeline calls it unconditionally.
+    """
+    current = _current_job.get()
+    if current is not None:
+        runner, job = current
+        runner.publish(job, stage=stage, partial=partial)
+
+
+class JobRunner:
+    """Runs jobs on a bounded thread pool and keeps their snapshots for polling."""
+
+    def __init__(self, jobs_dir: str = JOBS_DIR, max_workers: int = JOB_MAX_WORKERS,
+                 max_pending: int = JOB_MAX_PENDING, ttl: float = JOB_TTL):
+        self.jobs_dir = jobs_dir
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def submit(self, fn: Callable, params: Dict, *args, **kwargs) -> Job:
+        """
+        Queues fn(*args, **kwargs) as a new job.
+
+        Args:
+            fn: The work to run; its return value becomes the job's result.
+            params: The request parameters, echoed in snapshots.
+
+        Raises:
+            JobQueueFull: JOB_MAX_PENDING jobs are already waiting.
+        """
+        self._expire()
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs are already waiting; try again shortly")
+            job = Job(secrets.token_hex(8), params)
+            self._jobs[job.id] = job
+        self._write(job.snapshot())
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args, kwargs) -> None:
+        token = _current_job.set((self, job))
+        try:
+            # Each job is its own trace; the request that submitted it has already returned
+            with span("job", job_id=job.id) as root:
+                self.publish(job, status="running", trace_id=root.trace_id)
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    logger.error(f"Job {job.id} failed: {e}")
+                    self.publish(job, status="failed", stage=None, error=str(e))
+                    return
+            self.publish(job, status="succeeded", stage=None, result=result)
+        finally:
+            _current_job.reset(token)
+
+    def publish(self, job: Job, **fields) -> None:
+        with job._lock:
+            self._write(job.update(**fields))
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write(self, snapshot: Dict) -> None:
+        path = self._path(snapshot["id"])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Could not write job {snapshot['id']}: {e}")
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """The latest snapshot of a job, whichever process runs it, or None."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        if not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED and job.updated_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        try:
+            names = os.listdir(self.jobs_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "succeeded", "failed")}
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """The process-wide job runner, started on first use."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+    return _runner
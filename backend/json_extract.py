@@ -0,0 +1,336 @@
+"""
+Tolerant, incremental extraction of JSON objects from LLM output.
+
+Task outputs are meant to be a single JSON object, but models often wrap the
+object in prose or Markdown code fences, or leave trailing commas. A plain
+json.loads of such output failed, and the flow came out empty.
+JsonObjectStream instead scans the text for the first balanced top-level
+object and ignores whatever surrounds it. Braces inside strings and escaped
+quotes are handled, and trailing commas are removed when the object does not
+parse as it is. A candidate that still does not parse (prose such as "use
+{label}") is skipped, and the scan continues after its opening brace.
+
+The scan is incremental. feed() takes chunks as they stream in and returns
+the object as soon as its closing brace arrives. It raises MalformedOutput
+once the output cannot contain an object any more: JSON_MAX_PROSE characters
+have gone by without one. A caller reading a streamed completion can stop
+reading (and so cancel the generation) at either point, instead of waiting
+for the model to finish.
+
+Flows are then validated against the nodes/edges schema with pydantic-core.
+Ids are coerced to strings, a node's top-level "label" is moved into "data",
+and edges must join known nodes. FLOW_JSON_SCHEMA is the same schema as JSON
+Schema, for models that generate under it (backend/structured_mapping.py).
+"""
+import json
+import os
+import re
+from typing import Annotated, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, TypeAdapter, ValidationError, model_validator
+
+# Characters of prose allowed before the object starts; beyond it the output is given up
+JSON_MAX_PROSE = int(os.getenv("JSON_MAX_PROSE", "4000"))
+
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+_OPENERS = {"}": "{", "]": "["}
+
+
+class MalformedOutput(ValueError):
+    """The output holds no usable JSON object, or the object does not match the schema."""
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Removes commas directly before a closing brace or bracket, outside strings."""
+    out: List[str] = []
+    in_string = escaped = False
+    pending_comma = None
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if char.isspace():
+                pending_comma.append(char)
+                continue
+            if char not in "}]":
+                out.append(",")
+            out.extend(pending_comma)
+            pending_comma = None
+        if char == ",":
+            pending_comma = []
+            continue
+        if char == '"':
+            in_string = True
+        out.append(char)
+    if pending_comma is not None:
+        out.append(",")
+        out.extend(pending_comma)
+    return "".join(out)
+
+
+class JsonObjectStream:
+    """Finds the first complete top-level JSON object in text fed chunk by chunk."""
+
+    def __init__(self, max_prose: int = JSON_MAX_PROSE):
+        self.max_prose = max_prose
+        self.value: Optional[Dict] = None
+        # Whether the object needed its trailing commas removed
+        self.repaired = False
+        # Chunks are kept as they are and joined once, when an object closes
+        self._chunks: List[str] = []
+        self._length = 0
+        self._start: Optional[int] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Optional[Dict]:
+        """
+        Scans the next chunk of output.
+
+        Returns:
+            The object once it is complete, otherwise None.
+
+        Raises:
+            MalformedOutput: More than max_prose characters precede any object.
+        """
+        if self.value is None and chunk:
+            self._chunks.append(chunk)
+            base, self._length = self._length, self._length + len(chunk)
+            self._scan(chunk, base)
+        return self.value
+
+    def close(self) -> Dict:
+        """
+        The object, once the output is complete.
+
+        Raises:
+            MalformedOutput: The output has no complete JSON object.
+        """
+        if self.value is None:
+            if self._start is not None:
+                raise MalformedOutput(f"Truncated JSON object at character {self._start}")
+            raise MalformedOutput("No JSON object in the output")
+        return self.value
+
+    def _scan(self, text: str, base: int) -> None:
+        """Scans text, which starts at offset base of the output and runs to its current end."""
+        pos = 0
+        while True:
+            if self._start is None:
+                brace = text.find("{", pos)
+                if (base + brace if brace >= 0 else self._length) > self.max_prose:
+                    raise MalformedOutput(f"No JSON object in the first {self.max_prose} characters")
+                if brace < 0:
+                    return
+                self._start, self._stack, self._in_string, self._escaped = base + brace, ["{"], False, False
+                pos = brace + 1
+            if self._escaped:
+                self._escaped, pos = False, pos + 1
+            closed = False
+            while True:
+                match = _STRUCTURAL.search(text, pos)
+                if match is None:
+                    return
+                char, pos = match.group(), match.end()
+                if self._in_string:
+                    if char == "\\":
+                        if pos >= len(text):
+                            # The escaped character is in the next chunk
+                            self._escaped = True
+                            return
+                        pos += 1
+                    elif char == '"':
+                        self._in_string = False
+                    continue
+                if char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._stack.append(char)
+                elif char in "}]":
+                    if self._stack[-1] != _OPENERS[char]:
+                        break
+                    self._stack.pop()
+                    if not self._stack:
+                        closed = True
+                        break
+            output = "".join(self._chunks)
+            if closed:
+                value = self._parse(output[self._start:base + pos])
+                if isinstance(value, dict):
+                    self.value = value
+                    return
+            # Not an object after all; look for the next one after its opening brace
+            text, base, pos = output[self._start + 1:], self._start + 1, 0
+            self._chunks = [output]
+            self._start = None
+
+    def _parse(self, candidate: str):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            pass
+        try:
+            value = json.loads(_strip_trailing_commas(candidate))
+        except ValueError:
+            return None
+        self.repaired = True
+        return value
+
+
+def extract_json_object(text: str) -> Dict:
+    """
+    The first JSON object in a complete output, ignoring prose and code fences around it.
+
+    Raises:
+        MalformedOutput: The output has no JSON object.
+    """
+    text = (text or "").strip()
+    if text.startswith("{") and text.endswith("}"):
+        # The common case: the output is the object and nothing else
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = None
+        if isinstance(value, dict):
+            return value
+    stream = JsonObjectStream(max_prose=len(text))
+    stream.feed(text)
+    return stream.close()
+
+
+_Id = Annotated[str, BeforeValidator(lambda value: str(value) if isinstance(value, (int, float)) else value)]
+
+
+class _NodeData(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    label: str = ""
+
+
+class _Node(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: _Id
+    data: _NodeData
+    shape: str = "rectangle"
+
+    @model_validator(mode="before")
+    @classmethod
+    def _label_into_data(cls, value):
+        if isinstance(value, dict) and "data" not in value and "label" in value:
+            value = dict(value, data={"label": value["label"]})
+        return value
+
+
+class _Edge(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: Optional[_Id] = None
+    source: _Id
+    target: _Id
+    label: Optional[str] = None
+
+
+class _Flow(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    nodes: List[_Node]
+    edges: List[_Edge] = []
+
+
+_FLOW_SCHEMA = TypeAdapter(_Flow)
+
+# The same schema for constrained generation (OpenAI structured outputs, strict mode: every key required)
+FLOW_JSON_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["nodes", "edges"],
+    "properties": {
+        "nodes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["id", "data", "shape"],
+                "properties": {
+                    "id": {"type": "string"},
+                    "data": {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "required": ["label"],
+                        "properties": {"label": {"type": "string", "description": "The exact action name"}},
+                    },
+                    "shape": {"type": "string", "enum": ["rectangle", "diamond"]},
+                },
+            },
+        },
+        "edges": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["source", "target", "label"],
+                "properties": {
+                    "source": {"type": "string"},
+                    "target": {"type": "string"},
+                    "label": {"type": "string", "description": "'True' or 'False' on decision branches, otherwise empty"},
+                },
+            },
+        },
+    },
+}
+
+
+def validate_flow(value: Dict) -> Dict:
+    """
+    Checks a parsed flow against the nodes/edges schema and returns it normalized.
+
+    Raises:
+        MalformedOutput: The flow does not match the schema, repeats a node id, or
+            has an edge to an unknown node.
+    """
+    try:
+        flow = _FLOW_SCHEMA.validate_python(value)
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()[:5])
+        raise MalformedOutput(f"The flow does not match the nodes/edges schema: {problems}") from None
+    ids = [node.id for node in flow.nodes]
+    if len(set(ids)) != len(ids):
+        raise MalformedOutput(f"Repeated node ids: {sorted({i for i in ids if ids.count(i) > 1})}")
+    known = set(ids)
+    dangling = [f"{edge.source}->{edge.target}" for edge in flow.edges if edge.source not in known or edge.target not in known]
+    if dangling:
+        raise MalformedOutput(f"Edges to unknown nodes: {', '.join(dangling[:5])}")
+    return flow.model_dump(exclude_none=True)
+
+
+def parse_flow(text: str) -> Dict:
+    """
+    The validated {"nodes", "edges"} flow in a complete mapping output.
+
+    Raises:
+        MalformedOutput: No flow can be read from the output.
+    """
+    return validate_flow(extract_json_object(text))
+
+
+def stream_flow(chunks: Iterable[str], max_prose: int = JSON_MAX_PROSE) -> Dict:
+    """
+    The validated flow of a streamed mapping output, read only as far as the object's end.
+
+    The caller closes the stream when this returns or raises, which cancels the rest
+    of the generation.
+
+    Raises:
+        MalformedOutput: The output cannot contain a flow (raised as soon as that is
+            known), or the flow does not match the schema.
+    """
+    stream = JsonObjectStream(max_prose=max_prose)
+    for chunk in chunks:
+        if stream.feed(chunk) is not None:
+            break
+    return validate_flow(stream.close())
@@ -0,0 +1,159 @@
+"""
+BM25 keyword search over the action documents, and hybrid fusion with vector search.
+
+The keyword index covers the same records as the vector index of the
+published version, so keyword and vector results share ids. It is built when
+a version loads, alongside the vector matrices. When nothing is published,
+it is built once from the Chroma collection's documents.
+
+Hybrid search merges the vector and keyword rankings by reciprocal rank
+fusion: each id scores sum(1 / (HYBRID_RRF_K + rank)) over the two lists.
+Literal matches (action names, product words like "Excel" or "SFTP") rank
+high even when their embedding is a near miss.
+"""
+import math
+import os
+import re
+import threading
+import weakref
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from backend.vector_index import VectorIndex, add_index_loader, current_chroma_path, get_vector_index
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Rank constant of reciprocal rank fusion; larger values flatten the contribution of top ranks
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Results taken from each ranking before fusing
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or that the this to with "
+    "tool action description parameter".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric tokens without stopwords, with a plural 's' stripped."""
+    tokens = []
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class KeywordIndex:
+    """An inverted index with BM25 scoring over one collection's documents."""
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for row, document in enumerate(documents):
+            tokens = tokenize(document)
+            lengths[row] = len(tokens)
+            for token in tokens:
+                postings[token][row] = postings[token].get(row, 0) + 1
+        average = float(lengths.mean()) if len(lengths) else 0.0
+        # Per-document length normalization of the BM25 denominator, computed once
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average) if average else np.full(len(lengths), BM25_K1)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for token, rows in postings.items():
+            row_ids = np.fromiter(rows.keys(), dtype=np.int64, count=len(rows))
+            tf = np.fromiter(rows.values(), dtype=np.float32, count=len(rows))
+            idf = math.log(1 + (len(documents) - len(rows) + 0.5) / (len(rows) + 0.5))
+            self._postings[token] = (row_ids, idf * tf * (BM25_K1 + 1) / (tf + norm[row_ids]))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, n_results: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """The rows with the n_results highest BM25 scores (only rows matching a term), and their scores."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self._postings.get(token)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        matching = np.flatnonzero(scores)
+        if len(matching) > n_results:
+            matching = matching[np.argpartition(-scores[matching], n_results - 1)[:n_results]]
+        matching = matching[np.argsort(-scores[matching], kind="stable")]
+        return matching, scores[matching]
+
+    def query(self, query: str, n_results: int = 10) -> Dict:
+        """A Chroma-style result with BM25 `scores` (higher is better) in place of distances."""
+        rows, scores = self.search(query, n_results)
+        return {
+            "ids": [[self.ids[i] for i in rows]],
+            "documents": [[self.documents[i] for i in rows]],
+            "metadatas": [[self.metadatas[i] for i in rows]],
+            "scores": [[round(float(s), 4) for s in scores]],
+        }
+
+
+_indexes: "weakref.WeakKeyDictionary[VectorIndex, KeywordIndex]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _index_for(vector_index: VectorIndex) -> KeywordIndex:
+    keyword_index = _indexes.get(vector_index)
+    if keyword_index is None:
+        with _lock:
+            keyword_index = _indexes.get(vector_index)
+            if keyword_index is None:
+                keyword_index = KeywordIndex(vector_index.ids, vector_index.documents, vector_index.metadatas)
+                _indexes[vector_index] = keyword_index
+    return keyword_index
+
+
+@lru_cache(maxsize=None)
+def _chroma_keyword_index(chroma_path: str, collection_name: str) -> KeywordIndex:
+    from backend.services import get_chroma_client
+
+    data = get_chroma_client(chroma_path).get_collection(name=collection_name).get(include=["documents", "metadatas"])
+    return KeywordIndex(data["ids"], data["documents"], data["metadatas"])
+
+
+def get_keyword_index(collection_name: str) -> KeywordIndex:
+    """The keyword index over the records the vector search of a collection serves."""
+    vector_index = get_vector_index(collection_name)
+    if vector_index is None:
+        return _chroma_keyword_index(current_chroma_path(), collection_name)
+    return _index_for(vector_index)
+
+
+add_index_loader(lambda collection_name, index: _index_for(index))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = HYBRID_RRF_K) -> List[Tuple[str, float]]:
+    """Ids of all rankings ordered by their fused score sum(1 / (k + rank)), best first."""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            fused[id_] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_result(vector_result: Dict, keyword_result: Dict, n_results: int, rrf_k: int = HYBRID_RRF_K) -> Dict:
+    """Fuses a vector and a keyword result into the top n_results, with RRF `scores`."""
+    records: Dict[str, Tuple[str, Dict]] = {}
+    for result in (keyword_result, vector_result):
+        for id_, document, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0]):
+            records[id_] = (document, metadata)
+    fused = reciprocal_rank_fusion([vector_result["ids"][0], keyword_result["ids"][0]], rrf_k)[:n_results]
+    return {
+        "ids": [[id_ for id_, _ in fused]],
+        "documents": [[records[id_][0] for id_, _ in fused]],
+        "metadatas": [[records[id_][1] for id_, _ in fused]],
+        "scores": [[round(score, 6) for _, score in fused]],
+    }
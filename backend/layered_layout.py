@@ -0,0 +1,339 @@
+"""
+Sugiyama-style layered layout for flow diagrams.
+
+    1. Cycle breaking: edges that close a cycle (found by depth-first search
+       in node order, so the flow's own start comes first) are reversed while
+       laying out.
+    2. Ranking: longest path from the sources. Sources are then pulled down to
+       sit just above their highest successor, so side inputs don't stretch
+       long edges across the whole flow.
+    3. Edges spanning several ranks are split by dummy nodes, one per rank
+       crossed, so the ordering step sees them.
+    4. Crossing reduction: alternating down and up sweeps that order each rank
+       by the median (or barycenter) of its neighbours in the previous rank.
+       Crossings are counted after each sweep and the best ordering is kept.
+       Sweeps stop after LAYOUT_MAX_SWEEPS, after two sweeps without
+       improvement, or once LAYOUT_TIME_BUDGET_MS is spent.
+    5. Coordinate assignment: each rank is placed as close as possible (least
+       squares) to the median x of its neighbours, subject to the order and
+       minimum spacing, by isotonic regression. Alternating passes pull
+       chains straight and compact the rows.
+
+Every step is linear or O(E log V) per sweep, so flows of thousands of nodes
+lay out within the time budget. Compare it with the original rank layout on
+synthetic DAGs with `python -m backend.benchmarks.bench_layout`.
+"""
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+LAYOUT_MAX_SWEEPS = int(os.getenv("LAYOUT_MAX_SWEEPS", "12"))
+LAYOUT_TIME_BUDGET_MS = float(os.getenv("LAYOUT_TIME_BUDGET_MS", "250"))
+# "median" or "barycenter"
+LAYOUT_ORDERING = os.getenv("LAYOUT_ORDERING", "median")
+# Passes of the coordinate assignment
+COORDINATE_PASSES = 4
+# Horizontal room reserved for an edge passing through a rank
+DUMMY_WIDTH = 40
+# Weight of a node's packed, centred position against its neighbours' median.
+# Without it, merges that each pull half a column sideways add up over long flows.
+CENTER_PULL = 0.15
+
+
+class _Dummy:
+    """A point where a long edge passes through a rank."""
+
+    __slots__ = ("edge", "rank")
+
+    def __init__(self, edge: Tuple[Hashable, Hashable], rank: int):
+        self.edge = edge
+        self.rank = rank
+
+
+def _break_cycles(ids: Sequence[Hashable], successors: Dict[Hashable, List[Hashable]]) -> List[Tuple[Hashable, Hashable]]:
+    """The edges (u, v) of a DFS in node order that point back to a node still on the stack."""
+    state: Dict[Hashable, int] = {}  # 1 = on the stack, 2 = done
+    reversed_edges = []
+    for root in ids:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif child not in state:
+                state[child] = 1
+                stack.append((child, iter(successors[child])))
+            elif state[child] == 1:
+                reversed_edges.append((node, child))
+    return reversed_edges
+
+
+def _rank(ids: Sequence[Hashable], edges: List[Tuple[Hashable, Hashable]]) -> Dict[Hashable, int]:
+    """Longest-path ranks of an acyclic graph, with sources pulled down to their successors."""
+    successors: Dict[Hashable, List[Hashable]] = defaultdict(list)
+    indegree = {node: 0 for node in ids}
+    for u, v in edges:
+        successors[u].append(v)
+        indegree[v] += 1
+    order = [node for node in ids if indegree[node] == 0]
+    remaining = dict(indegree)
+    for node in order:
+        for child in successors[node]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                order.append(child)
+    rank = {node: 0 for node in ids}
+    for node in order:
+        for child in successors[node]:
+            rank[child] = max(rank[child], rank[node] + 1)
+    # The first source is the flow's start; keep it on top
+    for node in reversed(order[1:]):
+        if indegree[node] == 0 and successors[node]:
+            rank[node] = min(rank[child] for child in successors[node]) - 1
+    return rank
+
+
+def _acyclic_ranks(ids: Sequence[Hashable], edges: Sequence[Tuple[Hashable, Hashable]]) -> Tuple[Dict, List[Tuple], int]:
+    """Ranks, the edges oriented downwards, and how many edges had to be reversed."""
+    known = set(ids)
+    unique_edges = list(dict.fromkeys((u, v) for u, v in edges if u in known and v in known and u != v))
+    successors: Dict[Hashable, List[Hashable]] = defaultdict(list)
+    for u, v in unique_edges:
+        successors[u].append(v)
+    reversed_edges = set(_break_cycles(ids, successors))
+    dag_edges = list(dict.fromkeys((v, u) if (u, v) in reversed_edges else (u, v) for u, v in unique_edges))
+    return _rank(ids, dag_edges), dag_edges, len(reversed_edges)
+
+
+def rank_nodes(ids: Sequence[Hashable], edges: Sequence[Tuple[Hashable, Hashable]]) -> Dict[Hashable, int]:
+    """The rank layered_layout puts each node on (cycles broken the same way)."""
+    return _acyclic_ranks(ids, edges)[0]
+
+
+def _crossings_between(upper_pos: Dict, lower_pos: Dict, edges: List[Tuple]) -> int:
+    """Crossings between two adjacent ranks: inversions of the lower ends when sorted by the upper ends."""
+    if len(edges) < 2:
+        return 0
+    lower = [lower_pos[v] for u, v in sorted(edges, key=lambda e: (upper_pos[e[0]], lower_pos[e[1]]))]
+    # Fenwick tree over lower positions
+    size = max(lower) + 1
+    tree = [0] * (size + 1)
+    crossings = 0
+    for seen, value in enumerate(lower):
+        i = value + 1
+        greater = seen
+        while i > 0:
+            greater -= tree[i]
+            i -= i & -i
+        crossings += greater
+        i = value + 1
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+def median(values: List[float]) -> float:
+    """The median of neighbour positions that ordering and placement pull a node towards."""
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    if len(values) == 2:
+        return (values[0] + values[1]) / 2
+    # Weighted median (Gansner et al.): lean towards the side whose neighbours are packed tighter
+    left = values[middle - 1] - values[0]
+    right = values[-1] - values[middle]
+    if left + right == 0:
+        return (values[middle - 1] + values[middle]) / 2
+    return (values[middle - 1] * right + values[middle] * left) / (left + right)
+
+
+def isotonic_positions(targets: List[float], gaps: List[float]) -> List[float]:
+    """
+    x closest to targets (least squares) with x[i+1] - x[i] >= gaps[i], by pool adjacent violators.
+    """
+    offsets = [0.0]
+    for gap in gaps:
+        offsets.append(offsets[-1] + gap)
+    # With y = x - offset the constraints become y non-decreasing
+    blocks: List[List[float]] = []  # [mean, weight, count]
+    for target, offset in zip(targets, offsets):
+        blocks.append([target - offset, 1.0, 1])
+        while len(blocks) > 1 and blocks[-2][0] > blocks[-1][0]:
+            mean, weight, count = blocks.pop()
+            previous = blocks[-1]
+            total = previous[1] + weight
+            previous[0] = (previous[0] * previous[1] + mean * weight) / total
+            previous[1] = total
+            previous[2] += count
+    xs = []
+    for mean, _, count in blocks:
+        xs.extend([mean] * count)
+    return [y + offset for y, offset in zip(xs, offsets)]
+
+
+def layered_layout(
+    ids: Sequence[Hashable],
+    sizes: Dict[Hashable, Tuple[float, float]],
+    edges: Sequence[Tuple[Hashable, Hashable]],
+    x_spacing: float = 80,
+    y_spacing: float = 150,
+    max_sweeps: int = LAYOUT_MAX_SWEEPS,
+    time_budget_ms: float = LAYOUT_TIME_BUDGET_MS,
+    ordering: str = LAYOUT_ORDERING,
+) -> Tuple[Dict[Hashable, Tuple[float, float]], Dict]:
+    """
+    Lays out a directed graph top to bottom in ranks.
+
+    Args:
+        ids: Node ids, in the flow's order (the first node is kept on the top rank).
+        sizes: (width, height) of each node.
+        edges: (source, target) pairs; self loops and edges to unknown nodes are ignored.
+        x_spacing: Minimum horizontal gap between neighbours in a rank.
+        y_spacing: Vertical gap between ranks.
+        max_sweeps: Upper bound on crossing reduction sweeps.
+        time_budget_ms: Crossing reduction stops once this much time is spent.
+        ordering: "median" or "barycenter" ordering heuristic.
+
+    Returns:
+        The top-left (x, y) of each node, and stats: ranks, dummy nodes, crossings
+        before and after reduction, sweeps run, width, height and elapsed milliseconds.
+    """
+    started = time.perf_counter()
+    rank, dag_edges, reversed_count = _acyclic_ranks(ids, edges)
+
+    # Split long edges into unit-length segments through dummy nodes
+    rank_count = max(rank.values(), default=-1) + 1
+    layers: List[List] = [[] for _ in range(rank_count)]
+    for node in ids:
+        layers[rank[node]].append(node)
+    segments: List[Tuple] = []
+    dummies = 0
+    for u, v in dag_edges:
+        previous = u
+        for r in range(rank[u] + 1, rank[v]):
+            dummy = _Dummy((u, v), r)
+            rank[dummy] = r
+            layers[r].append(dummy)
+            segments.append((previous, dummy))
+            previous = dummy
+            dummies += 1
+        segments.append((previous, v))
+    up: Dict = defaultdict(list)
+    down: Dict = defaultdict(list)
+    for u, v in segments:
+        down[u].append(v)
+        up[v].append(u)
+    # Segments grouped by the rank of their upper end, for counting crossings
+    between: List[List[Tuple]] = [[] for _ in range(max(rank_count - 1, 0))]
+    for u, v in segments:
+        between[rank[u]].append((u, v))
+
+    # Initial order: each rank by the mean position of its predecessors, ties in flow order
+    position: Dict = {node: i for i, node in enumerate(layers[0])} if layers else {}
+    for r in range(1, rank_count):
+        layers[r].sort(key=lambda n: sum(position[p] for p in up[n]) / len(up[n]) if up[n] else 0.0)
+        for i, node in enumerate(layers[r]):
+            position[node] = i
+
+    def count() -> int:
+        return sum(_crossings_between(position, position, between[r]) for r in range(rank_count - 1))
+
+    def sweep(ranks: range, neighbours: Dict) -> None:
+        for r in ranks:
+            keys = {}
+            for node in layers[r]:
+                adjacent = [position[n] for n in neighbours[node]]
+                if not adjacent:
+                    keys[node] = position[node]
+                elif ordering == "barycenter":
+                    keys[node] = sum(adjacent) / len(adjacent)
+                else:
+                    keys[node] = median(adjacent)
+            # Stable sort: ties keep their current order
+            layers[r].sort(key=lambda n: keys[n])
+            for i, node in enumerate(layers[r]):
+                position[node] = i
+
+    initial_crossings = best_crossings = count()
+    best = [list(layer) for layer in layers]
+    sweeps = stale = 0
+    deadline = started + time_budget_ms / 1000
+    while best_crossings and sweeps < max_sweeps and stale < 2 and time.perf_counter() < deadline:
+        if sweeps % 2 == 0:
+            sweep(range(1, rank_count), up)
+        else:
+            sweep(range(rank_count - 2, -1, -1), down)
+        sweeps += 1
+        crossings = count()
+        if crossings < best_crossings:
+            best_crossings, best, stale = crossings, [list(layer) for layer in layers], 0
+        else:
+            stale += 1
+    layers = best
+
+    # Coordinates: centres pulled towards the median of the neighbours' centres, order and spacing kept
+    def width(node) -> float:
+        return DUMMY_WIDTH if isinstance(node, _Dummy) else sizes[node][0]
+
+    # Start from each rank packed and centred on x = 0; `home` is that packed centre
+    center: Dict = {}
+    for layer in layers:
+        x = -(sum(width(node) for node in layer) + x_spacing * (len(layer) - 1)) / 2
+        for node in layer:
+            center[node] = x + width(node) / 2
+            x += width(node) + x_spacing
+    home = dict(center)
+    gaps_by_layer = [
+        [(width(a) + width(b)) / 2 + (x_spacing if not (isinstance(a, _Dummy) and isinstance(b, _Dummy)) else x_spacing / 4)
+         for a, b in zip(layer, layer[1:])]
+        for layer in layers
+    ]
+    for p in range(COORDINATE_PASSES):
+        downward = p % 2 == 0
+        ranks = range(1, rank_count) if downward else range(rank_count - 2, -1, -1)
+        neighbours = up if downward else down
+        # The first rank follows its successors too, so the start sits over the flow
+        for r in list(ranks) + ([0] if downward and rank_count > 1 else []):
+            layer = layers[r]
+            adjacent = down if r == 0 and downward else neighbours
+            targets = [
+                (1 - CENTER_PULL) * median([center[n] for n in adjacent[node]]) + CENTER_PULL * home[node]
+                if adjacent[node] else center[node]
+                for node in layer
+            ]
+            for node, x in zip(layer, isotonic_positions(targets, gaps_by_layer[r])):
+                center[node] = x
+
+    left = min((center[node] - width(node) / 2 for node in center), default=0.0)
+    positions: Dict[Hashable, Tuple[float, float]] = {}
+    y = 0.0
+    right = 0.0
+    for layer in layers:
+        real = [node for node in layer if not isinstance(node, _Dummy)]
+        for node in real:
+            x = center[node] - sizes[node][0] / 2 - left
+            positions[node] = (x, y)
+            right = max(right, x + sizes[node][0])
+        y += max((sizes[node][1] for node in real), default=0.0) + y_spacing
+
+    stats = {
+        "ranks": rank_count,
+        "dummies": dummies,
+        "reversed_edges": reversed_count,
+        "initial_crossings": initial_crossings,
+        "crossings": best_crossings,
+        "sweeps": sweeps,
+        "width": round(right, 1),
+        "height": round(max(y - y_spacing, 0.0), 1),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    return positions, stats
+
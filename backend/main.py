@@ -1,30 +1,220 @@
 
-from fastapi import FastAPI
-from backend.services import search_rpa_actions
-from backend.agents import run_crew
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from backend.embeddings import EmbeddingQueueFull, get_embedding_scheduler
+from backend.jobs import JobQueueFull, get_job_runner
+from backend.sessions import REFINEMENT_MODE, SessionNotFound, get_session_store, run_session_turn
+from backend.services import SEARCH_MODE, SEARCH_N_RESULTS, asearch_rpa_actions
+from backend.agents import run_crew, MAPPING_MODE
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel
+from backend.intent_cache import get_intent_cache
+from backend.tracing import HTTP_REQUEST_DURATION, render_prometheus, span
+from backend.action_catalog import TOOL_SOURCES
+from backend.action_index import get_action_index
+from backend.vector_index import index_status, warm_up_vector_indexes
+from backend.svg_renderer import SVG_STREAM_MIN_NODES, cached_render, diagram_hash, iter_svg
+from backend.responses import CompressionMiddleware, FastJSONResponse
 import os
 import base64
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
+
+def warm_up():
+    """
+    Loads the read-only indexes up front.
+
+    Under gunicorn with preload_app this runs in the master before forking,
+    so workers share the mapped pages instead of each loading their own copy.
+    """
+    collections = warm_up_vector_indexes()
+    for tool in TOOL_SOURCES:
+        get_action_index(tool)
+    return collections
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Opens the root span of each request and records its latency.
+    """
+    with span("http.request", method=request.method, path=request.url.path) as root:
+        response = await call_next(request)
+        # Label by route template, not raw path, to keep the metric's label set bounded
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        root.set_attribute("route", route_path)
+        root.set_attribute("status_code", response.status_code)
+    HTTP_REQUEST_DURATION.observe(root.duration, route=route_path, method=request.method, status=response.status_code)
+    response.headers["X-Trace-Id"] = root.trace_id
+    return response
+
+@app.exception_handler(EmbeddingQueueFull)
+async def embedding_queue_full(request: Request, exc: EmbeddingQueueFull):
+    """
+    Sheds load when the embedding scheduler is saturated.
+    """
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(JobQueueFull)
+async def job_queue_full(request: Request, exc: JobQueueFull):
+    """
+    Rejects new jobs while every job thread is busy and the backlog is full.
+    """
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the FlowPilot API"}
 
 @app.get("/search")
-def search(query: str):
+async def search(query: str, n_results: int = Query(SEARCH_N_RESULTS, ge=1, le=100),
+                 mode: Literal["vector", "keyword", "hybrid"] = SEARCH_MODE):
     """
     Searches for RPA actions based on a query.
     """
-    return search_rpa_actions(query)
+    return await asearch_rpa_actions(query, n_results=n_results, mode=mode)
+
+@app.exception_handler(SessionNotFound)
+async def session_not_found(request: Request, exc: SessionNotFound):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
 
 @app.get("/process-query")
-def process_query(query: str, tool_choice: str = "power_automate"):
+def process_query(query: str, tool_choice: str = "power_automate", mapping_mode: Literal["sequential", "parallel", "structured"] = MAPPING_MODE,
+                  session_id: Optional[str] = None, diagram_format: Literal["full", "patch"] = "full",
+                  refinement: Literal["delta", "rerun"] = REFINEMENT_MODE):
     """
     Processes the user's query using the CrewAI agents.
+
+    With a session_id the query is the next message of that session: follow-ups edit
+    the previous steps and flow (refinement="delta"), and diagram_format="patch"
+    returns only the changes to the previous turn's diagram.
+    """
+    if session_id:
+        results = run_session_turn(session_id, query, mapping_mode, diagram_format, refinement)
+    else:
+        results = run_crew(query, tool_choice, mapping_mode)
+
+    # Encoded directly, without FastAPI's jsonable_encoder walk over the whole flow
+    return FastJSONResponse(results)
+
+class SessionRequest(BaseModel):
+    tool_choice: str = "power_automate"
+
+@app.post("/sessions", status_code=201)
+def create_session(request: SessionRequest):
+    """
+    Starts a conversation whose turns refine one flow.
     """
-    results = run_crew(query, tool_choice)
+    return get_session_store().create(request.tool_choice).to_dict()
 
-    return results
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    """
+    Returns a session's prompts, latest steps and laid-out flow (with its hash, the base of the next patch).
+    """
+    session = get_session_store().get(session_id)
+    if session is None:
+        raise SessionNotFound(f"Unknown session: {session_id}")
+    snapshot = session.to_dict()
+    # Retrieval results only serve later turns on the server
+    snapshot.pop("retrieval")
+    return FastJSONResponse(snapshot)
 
+class JobRequest(BaseModel):
+    query: str
+    tool_choice: str = "power_automate"
+    mapping_mode: Literal["sequential", "parallel", "structured"] = MAPPING_MODE
+    session_id: Optional[str] = None
+    diagram_format: Literal["full", "patch"] = "full"
+    refinement: Literal["delta", "rerun"] = REFINEMENT_MODE
 
+@app.post("/jobs", status_code=202)
+def create_job(request: JobRequest):
+    """
+    Starts processing a query in the background and returns the job to poll.
+    """
+    if request.session_id:
+        if get_session_store().get(request.session_id) is None:
+            raise SessionNotFound(f"Unknown session: {request.session_id}")
+        job = get_job_runner().submit(run_session_turn, request.model_dump(), request.session_id, request.query,
+                                      request.mapping_mode, request.diagram_format, request.refinement)
+    else:
+        job = get_job_runner().submit(run_crew, request.model_dump(), request.query, request.tool_choice, request.mapping_mode)
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Reports a job's status, current stage, partial results (structured steps, then the flow) and final result.
+    """
+    snapshot = get_job_runner().get(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return FastJSONResponse(snapshot)
+
+class FlowDiagram(BaseModel):
+    nodes: List[Dict] = []
+    edges: List[Dict] = []
+
+def _rendered(flow: FlowDiagram, request: Request, fmt: str, media_type: str) -> Response:
+    try:
+        key = diagram_hash(flow.nodes, flow.edges)
+        headers = {"ETag": f'"{key}"', "X-Diagram-Hash": key}
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        if fmt == "svg" and len(flow.nodes) >= SVG_STREAM_MIN_NODES:
+            # Large diagrams are streamed as they are drawn rather than built and cached whole
+            return StreamingResponse(iter_svg(flow.nodes, flow.edges), media_type=media_type, headers=headers)
+        _, output = cached_render(flow.nodes, flow.edges, fmt)
+    except (KeyError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Malformed flow diagram: {e}")
+    return Response(content=output, media_type=media_type, headers=headers)
+
+@app.post("/render/svg")
+def render_flow_svg(flow: FlowDiagram, request: Request):
+    """
+    Renders a flow's nodes and edges as SVG, cached by diagram hash (returned as the ETag).
+    """
+    return _rendered(flow, request, "svg", "image/svg+xml")
+
+@app.post("/render/png")
+def render_flow_png(flow: FlowDiagram, request: Request):
+    """
+    Renders a flow's nodes and edges as PNG, cached by diagram hash (returned as the ETag).
+    """
+    try:
+        return _rendered(flow, request, "png", "image/png")
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+@app.get("/intent-cache/stats")
+def intent_cache_stats():
+    """
+    Reports hit rate and latency saved by the intent cache.
+    """
+    intent_cache = get_intent_cache()
+    if intent_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **intent_cache.stats()}
+
+@app.get("/embeddings/stats")
+def embedding_stats():
+    """
+    Reports batching efficiency and backpressure of the embedding scheduler.
+    """
+    return get_embedding_scheduler().stats()
+
+@app.get("/index/version")
+def index_version():
+    """
+    Reports the published vector index version, the one this worker serves, and rollback targets.
+    """
+    return index_status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Exposes stage latencies, token usage, tool calls and cache hits in the Prometheus text format.
+    """
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
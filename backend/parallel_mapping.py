@@ -0,0 +1,154 @@
+"""
+Parallel mapping of structured steps: split into chunks, map concurrently, stitch.
+
+Each chunk of consecutive steps is mapped on its own into a {"nodes", "edges"}
+flow. stitch_flows then joins the chunk flows in step order:
+
+    * ids are renumbered sequentially ("1", "2", ...) in chunk order, and edge
+      ids are rebuilt as "e<source>-<target>";
+    * Start/End terminals between chunks are removed, so only the first Start
+      and the last End survive;
+    * every dangling exit of a chunk (a node with no outgoing edge, or a
+      decision missing one of its True/False branches) is wired to the entry
+      of the next chunk, keeping the branch label.
+
+The result depends only on the chunk outputs and their order, never on which
+chunk finished first.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence
+
+from backend.action_index import normalize_label
+
+START_LABELS = frozenset({"start", "begin"})
+END_LABELS = frozenset({"end", "stop", "finish"})
+BRANCH_LABELS = ("True", "False")
+
+
+def chunk_steps(steps: Sequence[str], chunk_size: int) -> List[List[str]]:
+    """Split steps into consecutive chunks of at most chunk_size."""
+    chunk_size = max(1, chunk_size)
+    return [list(steps[i:i + chunk_size]) for i in range(0, len(steps), chunk_size)]
+
+
+def _label(node: Dict) -> str:
+    return normalize_label((node.get("data") or {}).get("label", ""))
+
+
+def stitch_flows(flows: List[Dict]) -> Dict:
+    """
+    Join per-chunk flows into one flow, in chunk order.
+
+    Args:
+        flows: One {"nodes": [...], "edges": [...]} dict per chunk.
+
+    Returns:
+        A single {"nodes", "edges"} flow with renumbered ids.
+    """
+    nodes: List[Dict] = []
+    edges: List[Dict] = []
+    # Exits of the previous chunk awaiting the next entry: (node key, branch label)
+    pending: List[tuple] = []
+    last = len(flows) - 1
+
+    for chunk, flow in enumerate(flows):
+        chunk_nodes = {f"{chunk}:{n['id']}": n for n in flow.get("nodes", []) if "id" in n}
+        chunk_edges = [
+            dict(e, source=f"{chunk}:{e['source']}", target=f"{chunk}:{e['target']}")
+            for e in flow.get("edges", [])
+            if f"{chunk}:{e.get('source')}" in chunk_nodes and f"{chunk}:{e.get('target')}" in chunk_nodes
+        ]
+
+        # Drop inner terminals, remembering what they connected to
+        entries: List[str] = []
+        dropped = set()
+        for key, node in chunk_nodes.items():
+            label = _label(node)
+            if chunk > 0 and label in START_LABELS:
+                dropped.add(key)
+                entries.extend(e["target"] for e in chunk_edges if e["source"] == key)
+            elif chunk < last and label in END_LABELS:
+                dropped.add(key)
+        exits = [(e["source"], e.get("label", "")) for e in chunk_edges
+                 if e["target"] in dropped and _label(chunk_nodes[e["target"]]) in END_LABELS]
+        chunk_edges = [e for e in chunk_edges if e["source"] not in dropped and e["target"] not in dropped]
+        kept = [key for key in chunk_nodes if key not in dropped]
+
+        incoming = {e["target"] for e in chunk_edges}
+        outgoing: Dict[str, List[str]] = {}
+        for e in chunk_edges:
+            outgoing.setdefault(e["source"], []).append(e.get("label", ""))
+        entries = [key for key in entries if key not in dropped] or [key for key in kept if key not in incoming]
+
+        # Wire the previous chunk's exits to this chunk's entry
+        if entries:
+            for source, label in pending:
+                edges.append({"source": source, "target": entries[0], "label": label})
+            pending = []
+
+        nodes.extend(dict(chunk_nodes[key], id=key) for key in kept)
+        edges.extend(chunk_edges)
+
+        if chunk < last:
+            pending.extend(exits)
+            for key in kept:
+                branches = outgoing.get(key, []) + [label for source, label in exits if source == key]
+                if not branches:
+                    pending.append((key, ""))
+                elif chunk_nodes[key].get("shape") == "diamond" and len(branches) < 2:
+                    missing = next((b for b in BRANCH_LABELS if b not in branches), "")
+                    pending.append((key, missing))
+
+    # Renumber deterministically in stitched order
+    new_ids = {node["id"]: str(i) for i, node in enumerate(nodes, 1)}
+    for node in nodes:
+        node["id"] = new_ids[node["id"]]
+    stitched_edges = []
+    seen, edge_ids = set(), set()
+    for edge in edges:
+        source, target, label = new_ids[edge["source"]], new_ids[edge["target"]], edge.get("label", "")
+        if (source, target, label) in seen:
+            continue
+        seen.add((source, target, label))
+        edge_id = f"e{source}-{target}"
+        if edge_id in edge_ids:
+            edge_id = f"{edge_id}-{len(stitched_edges)}"
+        edge_ids.add(edge_id)
+        item = {"id": edge_id, "source": source, "target": target, "label": label}
+        item.update((k, v) for k, v in edge.items() if k not in item)
+        stitched_edges.append(item)
+    return {"nodes": nodes, "edges": stitched_edges}
+
+
+def map_steps_parallel(
+    steps: Sequence[str],
+    map_chunk: Callable[[List[str], int, int], Dict],
+    chunk_size: int = 2,
+    max_workers: int = 8,
+) -> Dict:
+    """
+    Map steps chunk by chunk on a thread pool and stitch the results.
+
+    Args:
+        steps: The structured steps, in order.
+        map_chunk: Called as map_chunk(chunk_steps, first_step_number, total_steps);
+            returns the chunk's {"nodes", "edges"} flow.
+        chunk_size: Steps per chunk.
+        max_workers: Maximum concurrent chunk mappings.
+
+    Returns:
+        The stitched flow.
+    """
+    chunks = chunk_steps(steps, chunk_size)
+    if not chunks:
+        return {"nodes": [], "edges": []}
+    starts = [sum(len(c) for c in chunks[:i]) + 1 for i in range(len(chunks))]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        # Each chunk runs in a copy of the caller's context so its trace spans nest under the request
+        futures = [
+            executor.submit(contextvars.copy_context().run, map_chunk, chunk, start, len(steps))
+            for chunk, start in zip(chunks, starts)
+        ]
+        flows = [future.result() for future in futures]
+    return stitch_flows(flows)
@@ -0,0 +1,151 @@
+"""
+Compressed copies of the catalog embeddings for in-process vector search.
+
+Every exported index version stores two compressed representations next to
+the float32 matrix:
+
+    int8  Per-dimension symmetric scalar quantization (4x smaller).
+    pca   Projection onto the top PCA_DIMENSIONS principal components, kept as
+          float32 (1536 / PCA_DIMENSIONS times smaller; 6x at the default 256).
+          It also makes scans cheaper.
+
+With VECTOR_QUANTIZATION set to one of them, searches scan only the compressed
+matrix. They take the n_results * VECTOR_RESCORE_FACTOR best candidates and
+rescore those exactly against their float32 rows. The full-precision matrix
+stays on disk and only the candidate rows are paged in. Measure recall
+against full precision with `python -m backend.benchmarks.eval_quantization`.
+"""
+import os
+from typing import Dict, List
+
+import numpy as np
+
+QUANTIZATION_KINDS = ("int8", "pca")
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+PCA_DIMENSIONS = int(os.getenv("PCA_DIMENSIONS", "256"))
+# Candidates rescored exactly, per requested result
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "5"))
+
+# Rows upcast at a time when scanning int8 codes, to bound the temporary buffer
+_INT8_CHUNK_ROWS = 256
+
+
+def quantize_int8(vectors: np.ndarray) -> Dict[str, np.ndarray]:
+    """Symmetric int8 codes with one scale per dimension, plus the norms of the dequantized rows."""
+    scales = np.abs(vectors).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    dequantized = codes * scales
+    return {
+        "codes": codes,
+        "scales": scales.astype(np.float32),
+        "norms": (dequantized * dequantized).sum(axis=1).astype(np.float32),
+    }
+
+
+def fit_pca(vectors: np.ndarray, dimensions: int = PCA_DIMENSIONS) -> Dict[str, np.ndarray]:
+    """The top principal components of vectors and the rows projected onto them."""
+    mean = vectors.mean(axis=0)
+    centered = vectors - mean
+    dimensions = max(1, min(dimensions, *centered.shape))
+    if centered.shape[0] < centered.shape[1]:
+        # Fewer rows than dimensions: the thin SVD is cheaper than the covariance
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        components = vt[:dimensions].T
+    else:
+        _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        components = eigenvectors[:, ::-1][:, :dimensions]
+    components = components.astype(np.float32)
+    reduced = (centered @ components).astype(np.float32)
+    total = float((centered * centered).sum())
+    return {
+        "vectors": reduced,
+        "norms": (reduced * reduced).sum(axis=1),
+        "components": components,
+        "mean": mean.astype(np.float32),
+        "explained_variance": np.float32(float((reduced * reduced).sum()) / total if total else 1.0),
+    }
+
+
+def export_quantized(vectors: np.ndarray, out_dir: str, name: str) -> Dict:
+    """
+    Writes the int8 and PCA representations of a collection's matrix.
+
+    Returns:
+        The `quantized` manifest entry: file names of each representation's arrays.
+    """
+    entry: Dict = {}
+    if not len(vectors):
+        return entry
+    representations = {"int8": quantize_int8(vectors), "pca": fit_pca(vectors)}
+    for kind, arrays in representations.items():
+        entry[kind] = {}
+        for key, array in arrays.items():
+            if array.ndim == 0:
+                entry[kind][key] = float(array)
+                continue
+            filename = f"{name}.{kind}.{key}.npy"
+            np.save(os.path.join(out_dir, filename), array)
+            entry[kind][key] = filename
+    return entry
+
+
+def load_quantized(version_path: str, entry: Dict) -> Dict[str, Dict[str, np.ndarray]]:
+    """Memory-maps the arrays of a `quantized` manifest entry; scalar fields are kept as they are."""
+    loaded = {}
+    for kind, files in entry.items():
+        loaded[kind] = {
+            key: np.load(os.path.join(version_path, value), mmap_mode="r") if isinstance(value, str) else value
+            for key, value in files.items()
+        }
+    return loaded
+
+
+def scanned_arrays(arrays: Dict[str, np.ndarray]) -> List[np.ndarray]:
+    """The arrays every query reads, i.e. what has to stay resident."""
+    return [value for value in arrays.values() if isinstance(value, np.ndarray)]
+
+
+def approximate_distances(kind: str, arrays: Dict[str, np.ndarray], query: np.ndarray) -> np.ndarray:
+    """
+    Squared L2 distances from query to every row in a compressed representation.
+
+    They omit the query's own norm, a constant that does not change the ranking.
+    """
+    if kind == "pca":
+        projected = (query - arrays["mean"]) @ arrays["components"]
+        return arrays["norms"] - 2.0 * (arrays["vectors"] @ projected)
+    codes = arrays["codes"]
+    weights = query * arrays["scales"]
+    dots = np.empty(len(codes), dtype=np.float32)
+    buffer = np.empty((min(_INT8_CHUNK_ROWS, len(codes)), codes.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), _INT8_CHUNK_ROWS):
+        chunk = buffer[:min(_INT8_CHUNK_ROWS, len(codes) - start)]
+        np.copyto(chunk, codes[start:start + len(chunk)], casting="unsafe")
+        dots[start:start + len(chunk)] = chunk @ weights
+    return arrays["norms"] - 2.0 * dots
+
+
+def quantized_query(index, kind: str, query_embedding: List[float], n_results: int = 10,
+                    rescore_factor: int = VECTOR_RESCORE_FACTOR) -> Dict:
+    """
+    Searches a VectorIndex on a compressed representation and rescores the best candidates exactly.
+
+    Falls back to exact search when the index version has no such representation.
+
+    Returns:
+        A Chroma-style result, with exact squared L2 distances.
+    """
+    arrays = index.quantized.get(kind)
+    if arrays is None or not len(index):
+        return index.query(query_embedding, n_results)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    approximate = approximate_distances(kind, arrays, query)
+    candidates = min(len(index), max(n_results * rescore_factor, n_results))
+    rows = np.argpartition(approximate, candidates - 1)[:candidates] if candidates < len(index) else np.arange(len(index))
+    rows.sort()
+    # Only the candidate rows of the float32 matrix are read
+    distances = index.norms[rows] - 2.0 * (index.vectors[rows] @ query) + float(query @ query)
+    k = min(n_results, len(rows))
+    best = np.argsort(distances)[:k]
+    return index.result(rows[best], distances[best])
@@ -0,0 +1,193 @@
+"""
+Delta refinement: follow-up messages edit the previous turn's steps and flow.
+
+A follow-up such as "also email the report to finance" used to rerun the
+whole pipeline: structuring, retrieval for every step, and mapping every
+step again. With a session, the previous structured steps and flow are kept
+on the server, and a follow-up runs two small tasks instead:
+
+    1. the Requirement Analyst returns only the edits to the numbered steps
+       ({"edits": [{"op": "replace" | "insert" | "delete", ...}]});
+    2. the Tool Mapper sees the current flow in a compact form and the edited
+       steps with their candidate actions. It returns only the changes to the
+       flow ({"add_nodes", "update_nodes", "remove_nodes", "add_edges",
+       "remove_edges"}).
+
+Retrieval only runs for steps whose text is new to the session. Results are
+kept per step text, so an undone edit reuses them. This module applies edits
+and formats the prompts; the tasks themselves are in backend/agents.py.
+"""
+import logging
+from typing import Dict, List, Tuple
+
+from backend.json_extract import extract_json_object
+
+logger = logging.getLogger(__name__)
+
+STEP_EDITS_FORMAT = """Return ONLY a JSON object with the edits to the current steps, numbered as they are now:
+        {"edits": [
+            {"op": "replace", "step": 3, "text": "New text of step 3"},
+            {"op": "insert", "after": 4, "text": "A new step after step 4 (0 inserts before the first step)"},
+            {"op": "delete", "step": 5}
+        ]}
+        Leave every step the request does not affect unchanged. Return {"edits": []} if nothing changes."""
+
+FLOW_EDITS_FORMAT = """Return ONLY a JSON object with the changes to the current flow:
+        {"add_nodes": [{"id": "n1", "data": {"label": "Exact action name"}, "shape": "rectangle"}],
+         "update_nodes": [{"id": "4", "data": {"label": "Exact action name"}, "shape": "diamond"}],
+         "remove_nodes": ["5"],
+         "add_edges": [{"source": "4", "target": "n1", "label": "True"}],
+         "remove_edges": [{"source": "4", "target": "5"}]}
+        Keep the ids of existing nodes. New node ids must not be used by existing nodes. Edges of removed nodes
+        are removed with them. Shapes are 'rectangle' for actions and 'diamond' for decisions; decision branches
+        are labelled 'True' or 'False'. Omit any key with nothing to change."""
+
+
+def number_steps(steps: List[str]) -> str:
+    return "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+
+
+def parse_edits(output: str) -> Dict:
+    """
+    Parses a delta task's JSON output, ignoring prose and code fences around the object.
+
+    Raises:
+        MalformedOutput: The output has no JSON object.
+    """
+    return extract_json_object(output)
+
+
+def apply_step_edits(steps: List[str], edits: List[Dict]) -> Tuple[List[str], List[Dict]]:
+    """
+    Applies step edits numbered against the current steps.
+
+    Returns:
+        The new steps, and the effective changes: {"op", "text"} for inserts and
+        replacements (with "was" for replacements) and {"op", "was"} for deletions.
+        Edits naming a step that does not exist are skipped.
+    """
+    replaced: Dict[int, str] = {}
+    deleted = set()
+    inserted: Dict[int, List[str]] = {}
+    for edit in edits:
+        op = edit.get("op")
+        try:
+            if op == "insert":
+                after = int(edit.get("after", len(steps)))
+                if 0 <= after <= len(steps) and str(edit.get("text", "")).strip():
+                    inserted.setdefault(after, []).append(str(edit["text"]).strip())
+                    continue
+            elif op in ("replace", "delete"):
+                step = int(edit["step"])
+                if 1 <= step <= len(steps):
+                    if op == "delete":
+                        deleted.add(step)
+                    elif str(edit.get("text", "")).strip():
+                        replaced[step] = str(edit["text"]).strip()
+                    continue
+        except (KeyError, TypeError, ValueError):
+            pass
+        logger.warning(f"Skipping invalid step edit: {edit}")
+
+    new_steps: List[str] = []
+    changes: List[Dict] = []
+    for text in inserted.get(0, []):
+        new_steps.append(text)
+        changes.append({"op": "insert", "text": text})
+    for number, step in enumerate(steps, 1):
+        if number in deleted:
+            changes.append({"op": "delete", "was": step})
+        elif number in replaced and replaced[number] != step:
+            new_steps.append(replaced[number])
+            changes.append({"op": "replace", "was": step, "text": replaced[number]})
+        else:
+            new_steps.append(step)
+        for text in inserted.get(number, []):
+            new_steps.append(text)
+            changes.append({"op": "insert", "text": text})
+    return new_steps, changes
+
+
+def describe_step_changes(changes: List[Dict]) -> str:
+    lines = []
+    for change in changes:
+        if change["op"] == "insert":
+            lines.append(f"- New step: {change['text']}")
+        elif change["op"] == "replace":
+            lines.append(f"- Changed step: \"{change['was']}\" is now \"{change['text']}\"")
+        else:
+            lines.append(f"- Removed step: {change['was']}")
+    return "\n".join(lines)
+
+
+def compact_flow(flow: Dict) -> str:
+    """A flow as short lines for a prompt: one per node, then one per edge (positions are left out)."""
+    lines = [f"{node['id']} [{node.get('shape', 'rectangle')}] {node.get('data', {}).get('label', '')}"
+             for node in flow.get("nodes", [])]
+    lines.extend(f"{edge['source']} -> {edge['target']}" + (f" ({edge['label']})" if edge.get("label") else "")
+                 for edge in flow.get("edges", []))
+    return "\n".join(lines)
+
+
+def apply_flow_edits(flow: Dict, edits: Dict) -> Dict:
+    """
+    Applies a Tool Mapper delta to a flow.
+
+    Returns:
+        The new {"nodes", "edges"} flow. Edits naming unknown nodes are skipped, added
+        nodes whose id is taken are renamed, and edges left without an endpoint are dropped.
+    """
+    removed = {str(node_id) for node_id in edits.get("remove_nodes") or []}
+    updates = {str(node["id"]): node for node in edits.get("update_nodes") or [] if isinstance(node, dict) and "id" in node}
+    nodes = []
+    for node in flow.get("nodes", []):
+        node_id = str(node["id"])
+        if node_id in removed:
+            continue
+        # data keeps what action validation recorded, such as original_label, until the label changes
+        data = dict(node.get("data") or {}, label=(node.get("data") or {}).get("label", ""))
+        update = updates.get(node_id)
+        if update is not None:
+            label = (update.get("data") or {}).get("label") or data["label"]
+            if label != data["label"]:
+                data = dict(update.get("data") or {}, label=label)
+            node = {"id": node_id, "data": data, "shape": update.get("shape") or node.get("shape", "rectangle")}
+        else:
+            node = {"id": node_id, "data": data, "shape": node.get("shape", "rectangle")}
+        nodes.append(node)
+
+    kept = {node["id"] for node in nodes}
+    taken = set(kept)
+    renamed: Dict[str, str] = {}
+    for node in edits.get("add_nodes") or []:
+        if not isinstance(node, dict) or "id" not in node:
+            continue
+        node_id = fresh = str(node["id"])
+        suffix = 1
+        while fresh in taken:
+            fresh = f"{node_id}_{suffix}"
+            suffix += 1
+        taken.add(fresh)
+        renamed[node_id] = fresh
+        nodes.append({"id": fresh, "data": dict(node.get("data") or {}, label=(node.get("data") or {}).get("label", "")),
+                      "shape": node.get("shape", "rectangle")})
+
+    dropped = {(str(e.get("source")), str(e.get("target"))) for e in edits.get("remove_edges") or [] if isinstance(e, dict)}
+    edges = [
+        edge for edge in flow.get("edges", [])
+        if str(edge["source"]) in kept and str(edge["target"]) in kept
+        and (str(edge["source"]), str(edge["target"])) not in dropped
+    ]
+    present = {(str(edge["source"]), str(edge["target"])) for edge in edges}
+    for edge in edits.get("add_edges") or []:
+        if not isinstance(edge, dict):
+            continue
+        source = renamed.get(str(edge.get("source")), str(edge.get("source")))
+        target = renamed.get(str(edge.get("target")), str(edge.get("target")))
+        if source in taken and target in taken and (source, target) not in present:
+            present.add((source, target))
+            added = {"source": source, "target": target}
+            if edge.get("label"):
+                added["label"] = edge["label"]
+            edges.append(added)
+    return {"nodes": nodes, "edges": edges}
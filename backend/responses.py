@@ -0,0 +1,142 @@
+"""
+Fast JSON encoding and negotiated compression of API responses.
+
+A /process-query result holds the steps, the Mermaid text and the whole flow.
+FastAPI's default path walked it with jsonable_encoder and then encoded it with
+json.dumps. FastJSONResponse encodes it with orjson in one pass, when orjson is
+installed. Endpoints that return large results build the response themselves,
+so the jsonable_encoder walk is skipped as well. Values orjson cannot encode
+fall back to the default path.
+
+CompressionMiddleware compresses responses of at least COMPRESS_MIN_SIZE bytes
+with the best encoding the client accepts (Accept-Encoding, with q-values).
+Brotli is preferred when the brotli package is installed, then gzip. Streamed
+SVGs are compressed chunk by chunk as they are drawn. PNGs and other
+already-compressed types are sent as they are.
+"""
+import os
+from typing import Dict
+
+import anyio.to_thread
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1000"))
+# zlib level 1-9; 6 compresses JSON nearly as well as 9 in a fraction of the time
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Brotli quality 0-11; 5 beats gzip -6 on size at a similar speed
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# Bodies at least this large are compressed in a worker thread rather than on the event loop
+THREAD_COMPRESS_MIN_SIZE = 128 * 1024
+
+
+class FastJSONResponse(JSONResponse):
+    """A JSON response encoded with orjson when it is installed."""
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+            except TypeError:
+                pass
+        return super().render(jsonable_encoder(content))
+
+
+class BrotliResponder(IdentityResponder):
+    """Brotli counterpart of starlette's GZipResponder."""
+
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = BROTLI_QUALITY):
+        super().__init__(app, minimum_size)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        if len(body) >= THREAD_COMPRESS_MIN_SIZE:
+            return await anyio.to_thread.run_sync(self._compress, body, more_body)
+        return self._compress(body, more_body)
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        if more_body:
+            # Flush each chunk of a streamed body, so the client can start on it
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """The q-value of each coding in an Accept-Encoding header."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """
+    The content coding for a client: "br", "gzip" or "identity".
+
+    The coding with the highest q-value wins; brotli wins ties, but only when the
+    brotli package is installed.
+    """
+    accepted = _accepted_encodings(accept_encoding)
+    default = accepted.get("*", 0.0)
+    best, best_q = "identity", 0.0
+    for coding in (("br",) if brotli is not None else ()) + ("gzip",):
+        q = accepted.get(coding, default)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """Compresses responses with brotli or gzip, whichever the client prefers."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_SIZE, gzip_level: int = GZIP_LEVEL,
+                 brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("Accept-Encoding", ""))
+        if encoding == "br":
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif encoding == "gzip":
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level,
+                                      thread_minimum_size=THREAD_COMPRESS_MIN_SIZE)
+        else:
+            # Still adds Vary: Accept-Encoding, so caches keep the encodings apart
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
@@ -8,8 +8,16 @@ from urllib.parse import urljoin
 
 import requests
 from bs4 import BeautifulSoup, Tag
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
+
+from backend.scraper_utils import (
+    SiteAdapter,
+    _clean_text,
+    _detect_table_headers,
+    _make_session,
+    _project_path,
+    map_columns,
+    table_to_columns,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -41,32 +49,20 @@ class ScrapingError(Exception):
     """Custom exception for scraping errors"""
     pass
 
-def _clean_text(value: str) -> str:
-    """Clean and normalize text content"""
-    if not value:
-        return ""
-    # Remove extra whitespace
-    return re.sub(r"\s+", " ", value).strip()
-
-def _make_session() -> requests.Session:
-    """Create a requests session with retry logic and proper headers"""
-    session = requests.Session()
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    })
-    retry = Retry(
-        total=5,
-        backoff_factor=0.5,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=("GET", "HEAD"),
-        raise_on_status=False,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
+class AutomationAnywhereAdapter(SiteAdapter):
+    """Table rules for docs.automationanywhere.com package pages."""
+
+    # Package tables mix th/td cells in body rows and always lead with a header row
+    cell_tags = ("td", "th")
+
+    def data_rows(self, table_soup: Tag) -> List[Tag]:
+        return table_soup.find_all("tr")[1:]  # Skip header row
+
+
+ADAPTER = AutomationAnywhereAdapter()
+
+# Action name and description are the first two cells of each package table row
+PACKAGE_ACTION_FIELDS = {"name": ("Col1",), "description": ("Col2",)}
 
 def get_package_actions(session: requests.Session, package_url: str) -> List[Tuple[str, str]]:
     """Extract actions and their descriptions from a package page"""
@@ -94,17 +90,12 @@ def get_package_actions(session: requests.Session, package_url: str) -> List[Tup
         if not actions_table:
             return []
             
-        actions = []
-        rows = actions_table.find_all('tr')[1:]  # Skip header row
-        for row in rows:
-            cells = row.find_all(['td', 'th'])
-            if len(cells) >= 2:
-                action_name = _clean_text(cells[0].get_text())
-                description = _clean_text(cells[1].get_text())
-                if action_name and description:
-                    actions.append((action_name, description))
-                    
-        return actions
+        _, columns = table_to_columns(actions_table, ADAPTER, positional=True)
+        return [
+            (row["name"], row["description"])
+            for row in map_columns(columns, PACKAGE_ACTION_FIELDS)
+            if len(row) == 2
+        ]
         
     except Exception as e:
         logger.error(f"Error scraping package page {package_url}: {str(e)}")
@@ -134,22 +125,6 @@ def get_section_content(heading: Tag) -> Tag:
     
     return BeautifulSoup(''.join(content), 'html.parser')
 
-def _detect_table_headers(table_soup: Tag) -> List[str]:
-    """Detect and normalize table headers"""
-    thead = table_soup.find("thead")
-    if thead:
-        ths = thead.find_all("th")
-        if ths:
-            return [_clean_text(th.get_text()) for th in ths]
-
-    # Fallback: some tables omit thead; use first row's th/td as headers
-    first_row = table_soup.find("tr")
-    if first_row:
-        cells = first_row.find_all(["th", "td"])
-        if cells:
-            return [_clean_text(c.get_text()) for c in cells]
-    return []
-
 def extract_last_updated(soup: BeautifulSoup) -> Optional[str]:
     """Extract the last updated date from the page"""
     date_patterns = [
@@ -239,132 +214,13 @@ def scrape_automation_anywhere() -> List[Dict]:
         logger.error(f"Error in main scraping function: {str(e)}")
         return []
 
-if __name__ == "__main__":
-    scrape_automation_anywhere()
-
-
-
-
 
 
 
 
 
-def _heading_level(tag: Tag) -> int:
-    if not isinstance(tag, Tag):
-        return 99
-    if tag.name and tag.name.startswith("h") and len(tag.name) == 2 and tag.name[1].isdigit():
-        return int(tag.name[1])
-    return 99
 
 
-def _first_paragraph_after(heading: Tag) -> str:
-    tag = heading
-    base_level = _heading_level(heading)
-    while tag:
-        tag = tag.find_next_sibling()
-        if tag is None:
-            break
-        if isinstance(tag, Tag) and tag.name and tag.name.startswith("h") and _heading_level(tag) <= base_level:
-            break
-        if isinstance(tag, Tag) and tag.name == "p":
-            text = _clean_text(tag.get_text())
-            if text:
-                return text
-    return ""
-
-
-def _collect_sectioned_tables(heading: Tag) -> List[Tuple[str, Tag]]:
-    action_level = _heading_level(heading)
-    sectioned: List[Tuple[str, Tag]] = []
-    current_section: str = None
-    tag = heading
-    while tag:
-        tag = tag.find_next_sibling()
-        if tag is None:
-            break
-        if isinstance(tag, Tag) and tag.name and tag.name.startswith("h"):
-            level = _heading_level(tag)
-            if level <= action_level:
-                break
-            section_text = _clean_text(tag.get_text()).lower()
-            if "input" in section_text and "parameter" in section_text:
-                current_section = "Input parameters"
-            elif ("variable" in section_text or "output" in section_text) and ("produced" in section_text or True):
-                current_section = "Variables produced"
-            elif "exception" in section_text or "error" in section_text:
-                current_section = "Exceptions"
-            else:
-                current_section = None
-            continue
-        if isinstance(tag, Tag) and tag.name == "table":
-            sectioned.append((current_section, tag))
-        if isinstance(tag, Tag) and tag.name in ("section", "div"):
-            for t in tag.find_all("table"):
-                sectioned.append((current_section, t))
-    return sectioned
-
-
-def _map_input(rows: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    out: List[Dict[str, str]] = []
-    for r in rows:
-        argument = r.get("Name") or r.get("Argument") or r.get("Parameter") or r.get("Col1")
-        ptype = r.get("Type") or r.get("Accepts") or r.get("Col2")
-        description = r.get("Description") or r.get("Col3")
-        item: Dict[str, str] = {}
-        if argument:
-            item["Argument"] = argument
-        if ptype:
-            item["Type"] = ptype
-        if description:
-            item["Description"] = description
-        if item:
-            out.append(item)
-    return out
-
-
-def _map_output(rows: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    out: List[Dict[str, str]] = []
-    for r in rows:
-        argument = r.get("Variable") or r.get("Name") or r.get("Output") or r.get("Col1")
-        ptype = r.get("Type") or r.get("Accepts") or r.get("Col2")
-        description = r.get("Description") or r.get("Col3")
-        item: Dict[str, str] = {}
-        if argument:
-            item["Argument"] = argument
-        if ptype:
-            item["Type"] = ptype
-        if description:
-            item["Description"] = description
-        if item:
-            out.append(item)
-    return out
-
-
-def _map_exceptions(rows: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    out: List[Dict[str, str]] = []
-    for r in rows:
-        ex = r.get("Exception") or r.get("Name") or r.get("Error") or r.get("Col1")
-        description = r.get("Description") or r.get("Col2")
-        item: Dict[str, str] = {}
-        if ex:
-            item["Exception"] = ex
-        if description:
-            item["Description"] = description
-        if item:
-            out.append(item)
-    return out
-
-
-
-
-
-
-
-def _project_path(*parts: str) -> str:
-    """Get absolute path to a file in the project"""
-    base_dir = os.path.dirname(__file__)  # backend/
-    return os.path.join(base_dir, *parts)
 
 def extract_packages_from_main_page(session: requests.Session) -> List[PackageInfo]:
     """Extract package information from the main commands panel page"""
@@ -1,18 +1,24 @@
 import re
 import os
-import time
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Sequence
 import requests
 from bs4 import BeautifulSoup, Tag
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
+# Patterns are compiled once at import; _clean_text runs for every cell on every page
+_WHITESPACE_RE = re.compile(r"\s+")
+_HEADING_NAME_RE = re.compile(r"^h(\d)$")
+
+# Columnar table representation: normalized header -> one value per row
+Columns = Dict[str, List[str]]
+
 def _clean_text(value: str) -> str:
     """Clean and normalize text content"""
     if not value:
         return ""
     # Remove extra whitespace
-    return re.sub(r"\s+", " ", value).strip()
+    return _WHITESPACE_RE.sub(" ", value).strip()
 
 def _make_session() -> requests.Session:
     """Create a requests session with retry logic and proper headers"""
@@ -50,14 +56,158 @@ def _detect_table_headers(table_soup: Tag) -> List[str]:
             return [_clean_text(c.get_text()) for c in cells]
     return []
 
-def _first_paragraph_after(heading: Tag) -> str:
+def _heading_level(tag: Tag) -> int:
+    """Determine the heading level of a BeautifulSoup Tag"""
+    if not isinstance(tag, Tag) or not tag.name:
+        return 99
+    match = _HEADING_NAME_RE.match(tag.name)
+    return int(match.group(1)) if match else 99
+
+
+class SiteAdapter:
+    """
+    Site-specific rules plugged into the shared extraction engine.
+
+    Scrapers subclass this and override only what differs for their docs site:
+    how section headings are classified, how table headers are normalized and
+    which columns feed each output field.
+    """
+
+    # Column fallbacks per output field, in priority order
+    input_fields: Dict[str, Tuple[str, ...]] = {
+        "Argument": ("Name", "Argument", "Variable", "Col1"),
+        "Type": ("Accepts", "Type", "Col2"),
+        "Description": ("Description", "Col3"),
+    }
+    output_fields: Dict[str, Tuple[str, ...]] = {
+        "Argument": ("Variable", "Name", "Argument", "Col1"),
+        "Type": ("Accepts", "Type", "Col2"),
+        "Description": ("Description", "Col3"),
+    }
+    exception_fields: Dict[str, Tuple[str, ...]] = {
+        "Exception": ("Exception", "Name", "Col1"),
+        "Description": ("Description", "Col2"),
+    }
+
+    # Tags treated as data cells within a body row
+    cell_tags: Tuple[str, ...] = ("td",)
+
+    def data_rows(self, table_soup: Tag) -> List[Tag]:
+        """Rows of a table that carry data (header rows excluded)."""
+        tbody = table_soup.find("tbody") or table_soup
+        rows = tbody.find_all("tr")
+        # Skip header row if it exists within tbody
+        if rows and rows[0].find_all("th"):
+            rows = rows[1:]
+        return rows
+
+    def classify_section(self, section_text: str) -> Optional[str]:
+        """Map a lower-cased sub-heading to a section name (or None)."""
+        if "input parameters" in section_text or ("input" in section_text and "parameter" in section_text):
+            return "Input parameters"
+        if "variables produced" in section_text or "outputs" in section_text or "output" in section_text:
+            return "Variables produced"
+        if "exceptions" in section_text:
+            return "Exceptions"
+        return None
+
+    def normalize_header(self, header: str) -> str:
+        """Map a raw table header to the column key used by the field fallbacks."""
+        return header
+
+    def is_paragraph_boundary(self, tag: Tag, base_level: int) -> bool:
+        """Whether the description lookahead should stop at this tag."""
+        return tag.name in ("h2", "h3", "h4")
+
+
+def table_to_columns(
+    table_soup: Tag,
+    adapter: Optional[SiteAdapter] = None,
+    positional: bool = False,
+) -> Tuple[List[str], Columns]:
+    """
+    Convert a table into columnar arrays.
+
+    Args:
+        table_soup: The <table> element.
+        adapter: Optional site adapter used to normalize header names and pick rows.
+        positional: Key every column as "Col<n>" regardless of its header.
+
+    Returns:
+        A tuple of (raw headers, columns). Every column has one entry per data
+        row; cells missing from a short row are empty strings. Cells beyond the
+        header count land in "Col<n>" columns.
+    """
+    adapter = adapter or SiteAdapter()
+    headers = _detect_table_headers(table_soup)
+    keys = [] if positional else [adapter.normalize_header(h) for h in headers]
+
+    cell_rows = []
+    width = len(keys)
+    for row in adapter.data_rows(table_soup):
+        cells = row.find_all(list(adapter.cell_tags))
+        if not cells:
+            continue
+        cell_rows.append([_clean_text(c.get_text()) for c in cells])
+        if len(cells) > width:
+            width = len(cells)
+
+    keys.extend(f"Col{idx + 1}" for idx in range(len(keys), width))
+    columns: Columns = {}
+    for idx, key in enumerate(keys):
+        values = [cells[idx] if idx < len(cells) else "" for cells in cell_rows]
+        # Duplicate normalized headers: the right-most column wins, as it did for row dicts
+        columns[key] = values
+    return headers, columns
+
+
+def column_count(columns: Columns) -> int:
+    """Number of data rows in a columnar table."""
+    for values in columns.values():
+        return len(values)
+    return 0
+
+
+def _coalesce(columns: Columns, keys: Sequence[str], n_rows: int) -> List[str]:
+    """Per row, the first non-empty value across the candidate columns."""
+    present = [columns[k] for k in keys if k in columns]
+    if not present:
+        return [""] * n_rows
+    if len(present) == 1:
+        return present[0]
+    return [next((v for v in values if v), "") for values in zip(*present)]
+
+
+def map_columns(columns: Columns, fields: Dict[str, Tuple[str, ...]]) -> List[Dict[str, str]]:
+    """
+    Project columnar table data onto output records.
+
+    Each output field takes, per row, the first non-empty value among its
+    candidate columns. Rows that end up with no fields are dropped.
+    """
+    n_rows = column_count(columns)
+    if not n_rows:
+        return []
+    names = list(fields)
+    resolved = [_coalesce(columns, fields[name], n_rows) for name in names]
+    mapped: List[Dict[str, str]] = []
+    for values in zip(*resolved):
+        item = {name: value for name, value in zip(names, values) if value}
+        if item:
+            mapped.append(item)
+    return mapped
+
+
+def _first_paragraph_after(heading: Tag, adapter: Optional[SiteAdapter] = None) -> str:
     """Look ahead until next heading for the first non-empty paragraph"""
+    adapter = adapter or SiteAdapter()
+    base_level = _heading_level(heading)
     tag = heading
     while tag:
         tag = tag.find_next_sibling()
         if tag is None:
             break
-        if isinstance(tag, Tag) and tag.name in ("h2", "h3", "h4"):
+        if isinstance(tag, Tag) and adapter.is_paragraph_boundary(tag, base_level):
             break
         if isinstance(tag, Tag) and tag.name == "p":
             text = _clean_text(tag.get_text())
@@ -65,16 +215,9 @@ def _first_paragraph_after(heading: Tag) -> str:
                 return text
     return ""
 
-def _heading_level(tag: Tag) -> int:
-    """Determine the heading level of a BeautifulSoup Tag"""
-    if not isinstance(tag, Tag):
-        return 99
-    if tag.name and tag.name.startswith("h") and len(tag.name) == 2 and tag.name[1].isdigit():
-        return int(tag.name[1])
-    return 99
-
-def _collect_sectioned_tables(heading: Tag) -> List[Tuple[str, Tag]]:
+def _collect_sectioned_tables(heading: Tag, adapter: Optional[SiteAdapter] = None) -> List[Tuple[str, Tag]]:
     """Collect tables within a section defined by a heading"""
+    adapter = adapter or SiteAdapter()
     action_level = _heading_level(heading)
     sectioned: List[Tuple[str, Tag]] = []
     current_section: str = None
@@ -86,16 +229,10 @@ def _collect_sectioned_tables(heading: Tag) -> List[Tuple[str, Tag]]:
         if isinstance(tag, Tag) and tag.name and tag.name.startswith("h"):
             level = _heading_level(tag)
             if level <= action_level:
+                # next action or higher-level section begins
                 break
-            section_text = _clean_text(tag.get_text()).lower()
-            if "input parameters" in section_text or ("input" in section_text and "parameter" in section_text):
-                current_section = "Input parameters"
-            elif "variables produced" in section_text or "outputs" in section_text or "output" in section_text:
-                current_section = "Variables produced"
-            elif "exceptions" in section_text:
-                current_section = "Exceptions"
-            else:
-                current_section = None
+            # lower-level heading inside this action -> may denote a section
+            current_section = adapter.classify_section(_clean_text(tag.get_text()).lower())
             continue
         if isinstance(tag, Tag) and tag.name == "table":
             sectioned.append((current_section, tag))
@@ -104,6 +241,34 @@ def _collect_sectioned_tables(heading: Tag) -> List[Tuple[str, Tag]]:
                 sectioned.append((current_section, t))
     return sectioned
 
+def extract_action_tables(heading: Tag, adapter: SiteAdapter) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Extract the parameter tables that belong to an action heading.
+
+    Tables are routed by the section they sit under, falling back to their
+    headers, and mapped through the adapter's field fallbacks.
+
+    Returns:
+        A dict with "Input parameters", "Variables produced" and "Exceptions" lists.
+    """
+    result: Dict[str, List[Dict[str, str]]] = {
+        "Input parameters": [],
+        "Variables produced": [],
+        "Exceptions": [],
+    }
+    for section, table in _collect_sectioned_tables(heading, adapter):
+        headers, columns = table_to_columns(table, adapter)
+        if not column_count(columns):
+            continue
+        headers_joined = " ".join(h.lower() for h in headers)
+        if section == "Exceptions" or "exception" in headers_joined:
+            result["Exceptions"].extend(map_columns(columns, adapter.exception_fields))
+        elif section == "Variables produced" or "variable" in headers_joined or "output" in headers_joined:
+            result["Variables produced"].extend(map_columns(columns, adapter.output_fields))
+        else:
+            result["Input parameters"].extend(map_columns(columns, adapter.input_fields))
+    return result
+
 def _project_path(*parts: str) -> str:
     """Get absolute path to a file in the project, relative to the backend directory"""
     base_dir = os.path.dirname(os.path.abspath(__file__)) # backend/
@@ -12,4 +12,3 @@ if __name__ == '__main__':
         print(search_results)
     else:
         print("Please provide a search query as a command-line argument.")
-")
\ No newline at end of file
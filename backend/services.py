@@ -1,42 +1,196 @@
-
+import asyncio
+import contextvars
 import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List
+
 import chromadb
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 from dotenv import load_dotenv
 
+from backend.tracing import EMBEDDING_TOKENS, span
+
 load_dotenv()
 
-def search_rpa_actions(query: str, n_results: int = 10):
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Chroma store searched when no versioned index has been published (see backend/vector_index.py)
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "backend/vector_store")
+# Upper bound on pooled connections to the OpenAI API, per client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+# Threads dedicated to blocking Chroma queries from async handlers
+CHROMA_MAX_WORKERS = int(os.getenv("CHROMA_MAX_WORKERS", "8"))
+# Retrieval mode of search_rpa_actions: vector, keyword (BM25) or hybrid (both, rank-fused)
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# Actions returned per search; every result ends up in the Tool Mapper's prompt
+SEARCH_N_RESULTS = int(os.getenv("SEARCH_N_RESULTS", "10"))
+
+_chroma_executor = ThreadPoolExecutor(max_workers=CHROMA_MAX_WORKERS, thread_name_prefix="chroma")
+# Async clients are bound to the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> OpenAI:
+    """Shared OpenAI client, so connections are pooled across calls."""
+    limits = httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=DefaultHttpxClient(limits=limits))
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Shared async OpenAI client for the running event loop, with a bounded keep-alive connection pool."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+        client = _async_clients[loop] = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"), http_client=DefaultAsyncHttpxClient(limits=limits)
+        )
+    return client
+
+@lru_cache(maxsize=None)
+def get_chroma_client(path: str = VECTOR_STORE_PATH):
+    """Shared Chroma client per vector store path, opened once."""
+    return chromadb.PersistentClient(path=path)
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Creates embeddings for a batch of texts in a single request.
+
+    Args:
+        texts: The texts to embed.
+
+    Returns:
+        One embedding per text, in input order.
+    """
+    with span("embedding", model=EMBEDDING_MODEL, inputs=len(texts)) as current:
+        response = get_openai_client().embeddings.create(
+            input=texts,
+            model=EMBEDDING_MODEL
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            EMBEDDING_TOKENS.inc(usage.prompt_tokens, model=EMBEDDING_MODEL)
+            current.set_attribute("tokens", usage.prompt_tokens)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+async def aembed_texts(texts: List[str]) -> List[List[float]]:
+    """Async variant of embed_texts on the pooled async client."""
+    with span("embedding", model=EMBEDDING_MODEL, inputs=len(texts)) as current:
+        response = await get_async_openai_client().embeddings.create(
+            input=texts,
+            model=EMBEDDING_MODEL
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            EMBEDDING_TOKENS.inc(usage.prompt_tokens, model=EMBEDDING_MODEL)
+            current.set_attribute("tokens", usage.prompt_tokens)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def embed_query(query: str) -> List[float]:
+    """
+    Creates the embedding for a single query.
+
+    Queries from all concurrent callers are micro-batched by the process-wide
+    embedding scheduler (backend/embeddings.py).
+    """
+    from backend.embeddings import get_embedding_scheduler
+
+    return get_embedding_scheduler().embed(query)
+
+def _query_collection(collection_name: str, query_embedding: List[float], n_results: int):
+    from backend.vector_backends import select_backend
+
+    backend = select_backend(collection_name)
+    with span(f"{backend.name}.query", collection=collection_name, n_results=n_results):
+        return backend.query(collection_name, query_embedding, n_results)
+
+def _query_keywords(collection_name: str, query: str, n_results: int):
+    from backend.keyword_search import get_keyword_index
+
+    with span("keyword.query", collection=collection_name, n_results=n_results):
+        return get_keyword_index(collection_name).query(query, n_results)
+
+def _search(collection_name: str, query: str, query_embedding: List[float], n_results: int, mode: str):
+    if mode == "vector":
+        return _query_collection(collection_name, query_embedding, n_results)
+    from backend.keyword_search import HYBRID_CANDIDATES, hybrid_result
+
+    # Fuse deeper rankings than requested so that items ranked well by only one side still surface
+    candidates = max(n_results, HYBRID_CANDIDATES)
+    with span("hybrid.query", collection=collection_name, n_results=n_results):
+        vector = _query_collection(collection_name, query_embedding, candidates)
+        keyword = _query_keywords(collection_name, query, candidates)
+        return hybrid_result(vector, keyword, n_results)
+
+def _check_mode(mode: str) -> str:
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}'; expected one of {', '.join(SEARCH_MODES)}")
+    return mode
+
+def search_rpa_actions(query: str, n_results: int = SEARCH_N_RESULTS, collection_name: str = "power_automate",
+                       query_embedding: List[float] = None, mode: str = None):
     """
     Searches the RPA actions vector database for a given query.
 
     Args:
         query: The search query.
         n_results: The number of results to return.
+        collection_name: The tool collection to search.
+        query_embedding: A precomputed embedding for the query, if available.
+        mode: "vector", "keyword" or "hybrid"; defaults to SEARCH_MODE.
 
     Returns:
-        A list of search results.
+        A list of search results. Keyword and hybrid results carry `scores`
+        (higher is better) instead of `distances`.
     """
-    # Initialize OpenAI client
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    mode = _check_mode(mode)
+    if mode == "keyword":
+        # Keyword search needs no embedding request
+        return _query_keywords(collection_name, query, n_results)
 
     # Create embedding for the query
-    response = client.embeddings.create(
-        input=query,
-        model="text-embedding-ada-002"
-    )
-    query_embedding = response.data[0].embedding
+    if query_embedding is None:
+        query_embedding = embed_query(query)
 
-    # Initialize ChromaDB client
-    chroma_client = chromadb.PersistentClient(path="backend/vector_store")
+    return _search(collection_name, query, query_embedding, n_results, mode)
 
-    # Get the collection
-    collection = chroma_client.get_collection(name=collection_name)
+async def asearch_rpa_actions(query: str, n_results: int = SEARCH_N_RESULTS, collection_name: str = "power_automate",
+                              mode: str = None):
+    """
+    Non-blocking search_rpa_actions for async handlers.
+
+    The query is awaited on the embedding scheduler. Vector searches of an
+    in-process index run inline. Everything else runs on a dedicated bounded
+    executor, so it neither blocks the event loop nor occupies the server's
+    request threadpool: Chroma queries, and keyword scoring, whose first call
+    may read the whole collection to build the BM25 index.
+
+    Args:
+        query: The search query.
+        n_results: The number of results to return.
+        collection_name: The tool collection to search.
+        mode: "vector", "keyword" or "hybrid"; defaults to SEARCH_MODE.
+
+    Returns:
+        A list of search results.
+    """
+    from backend.embeddings import get_embedding_scheduler
+    from backend.vector_backends import select_backend
 
-    # Query the collection
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results,
-        include=["metadatas", "documents", "distances"]
+    mode = _check_mode(mode)
+    loop = asyncio.get_running_loop()
+    if mode == "keyword":
+        return await loop.run_in_executor(
+            _chroma_executor, contextvars.copy_context().run, _query_keywords, collection_name, query, n_results
+        )
+    query_embedding = await get_embedding_scheduler().aembed(query)
+    if mode == "vector" and not select_backend(collection_name).blocking:
+        # In-process vector searches take microseconds; a thread hop would cost more
+        return _search(collection_name, query, query_embedding, n_results, mode)
+    # Run in a copy of the context so the search spans stay in the request's trace
+    return await loop.run_in_executor(
+        _chroma_executor, contextvars.copy_context().run, _search, collection_name, query, query_embedding, n_results, mode
     )
-    return results
@@ -0,0 +1,313 @@
+"""
+Conversation sessions that keep the latest flow between refinements.
+
+A session remembers the tool and the laid-out flow (nodes with positions, and
+edges) of its last turn. run_session_turn() runs the pipeline for a refined
+prompt and carries the flow forward with backend.diagram_diff: unchanged steps
+keep their ids and positions, and only the ranks the edit touched are placed
+again. With diagram_format="patch", the result carries a diagram_patch against
+the previous turn's flow instead of the full diagram. The response then grows
+with the size of the edit rather than the size of the flow.
+
+Follow-up messages are refinements. With refinement="delta" (the default,
+REFINEMENT_MODE), a turn after the first runs agents.run_refinement. Two small
+tasks edit only the affected steps and nodes (see backend/refinement.py), and
+retrieval results are reused across turns from the session. With "rerun",
+the message is taken as a complete refined prompt and the whole pipeline runs.
+
+Sessions are cached in memory (at most SESSION_CACHE_SIZE, least recently used
+evicted) and written to SESSIONS_DIR as JSON files, replaced atomically.
+Under gunicorn any worker can continue a session. A cached session is read
+again when its file has changed since this worker read or wrote it, and a
+turn holds an exclusive lock on the session's .lock file (fcntl), so turns
+run one at a time across workers and each starts from the last saved turn.
+Sessions untouched for SESSION_TTL seconds are removed.
+"""
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from backend.diagram_diff import flow_hash, update_flow
+from backend.diagram_generator import flow_mermaid
+from backend.flow_models import FlowGraph
+from backend.tracing import span
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: turns are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_DIR = os.getenv("SESSIONS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sessions"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+# Seconds an idle session is kept
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+# How follow-up turns run: "delta" edits the previous steps and flow, "rerun" runs the whole pipeline
+REFINEMENT_MODE = os.getenv("REFINEMENT_MODE", "delta")
+
+
+class SessionNotFound(LookupError):
+    """The session id is unknown or the session has expired."""
+
+
+class Session:
+    """One conversation: its tool, its prompts and the flow of its last turn."""
+
+    def __init__(self, session_id: str, tool_choice: str):
+        self.id = session_id
+        self.tool_choice = tool_choice
+        self.turns: List[str] = []
+        self.structured_requirements: Optional[str] = None
+        self.flow: Optional[Dict] = None
+        self.flow_hash: Optional[str] = None
+        # Retrieved actions by step text, reused by delta refinements
+        self.retrieval: Dict[str, Dict] = {}
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # st_mtime_ns of the session file when this copy was read or written
+        self.file_mtime: Optional[int] = None
+        # Turns of one session run one at a time, so each diffs against the flow of the one before
+        self.lock = threading.RLock()
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "tool_choice": self.tool_choice,
+            "turns": list(self.turns),
+            "structured_requirements": self.structured_requirements,
+            "flow": self.flow,
+            "flow_hash": self.flow_hash,
+            "retrieval": self.retrieval,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        session = cls(data["id"], data["tool_choice"])
+        session.load(data)
+        return session
+
+    def load(self, data: Dict) -> None:
+        """Replaces this copy's state with a saved one (the lock is kept)."""
+        self.tool_choice = data.get("tool_choice", self.tool_choice)
+        self.turns = data.get("turns", [])
+        self.structured_requirements = data.get("structured_requirements")
+        self.flow = data.get("flow")
+        self.flow_hash = data.get("flow_hash")
+        self.retrieval = data.get("retrieval", {})
+        self.created_at = data.get("created_at", self.created_at)
+        self.updated_at = data.get("updated_at", self.updated_at)
+
+
+class SessionStore:
+    """Sessions cached in memory and persisted to one JSON file each."""
+
+    def __init__(self, sessions_dir: str = SESSIONS_DIR, cache_size: int = SESSION_CACHE_SIZE, ttl: float = SESSION_TTL):
+        self.sessions_dir = sessions_dir
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(sessions_dir, exist_ok=True)
+
+    def create(self, tool_choice: str) -> Session:
+        self._expire()
+        session = Session(secrets.token_hex(8), tool_choice)
+        self._remember(session)
+        self.save(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """
+        A session from memory or, if another worker created it, from disk; None if unknown.
+
+        A cached session that another worker has saved since is read again first.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+        if session is not None:
+            # A turn running in this process has the latest state; don't wait for it
+            if session.lock.acquire(blocking=False):
+                try:
+                    self._refresh(session)
+                finally:
+                    session.lock.release()
+            return session
+        if not all(c in "0123456789abcdef" for c in session_id):
+            return None
+        try:
+            mtime, data = self._read(session_id)
+            session = Session.from_dict(data)
+        except (OSError, ValueError, KeyError):
+            return None
+        if session.updated_at < time.time() - self.ttl:
+            return None
+        session.file_mtime = mtime
+        return self._remember(session)
+
+    @contextmanager
+    def turn(self, session: Session) -> Iterator[Session]:
+        """
+        Runs one turn of a session exclusively, across threads and worker processes.
+
+        The session is brought up to date with its file once the lock is held, so
+        the turn continues from the last turn saved by any worker.
+        """
+        with session.lock:
+            lock_file = open(f"{self._path(session.id)}.lock", "a") if fcntl is not None else None
+            try:
+                if lock_file is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                self._refresh(session)
+                yield session
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def save(self, session: Session) -> None:
+        session.updated_at = time.time()
+        path = self._path(session.id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(session.to_dict(), f)
+            os.replace(tmp_path, path)
+            session.file_mtime = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Could not write session {session.id}: {e}")
+
+    def _remember(self, session: Session) -> Session:
+        with self._lock:
+            # Two requests may load the same session from disk; both continue the first copy
+            session = self._sessions.setdefault(session.id, session)
+            self._sessions.move_to_end(session.id)
+            while len(self._sessions) > self.cache_size:
+                self._sessions.popitem(last=False)
+        return session
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.json")
+
+    def _read(self, session_id: str):
+        """The saved state of a session and the st_mtime_ns of its file."""
+        with open(self._path(session_id), "r") as f:
+            return os.fstat(f.fileno()).st_mtime_ns, json.load(f)
+
+    def _refresh(self, session: Session) -> None:
+        """Reads a cached session again if its file changed since this copy was read or written."""
+        try:
+            if os.stat(self._path(session.id)).st_mtime_ns == session.file_mtime:
+                return
+            mtime, data = self._read(session.id)
+        except (OSError, ValueError):
+            # Not saved yet, or removed on expiry: the cached copy is all there is
+            return
+        session.load(data)
+        session.file_mtime = mtime
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for session_id in [s.id for s in self._sessions.values() if s.updated_at < cutoff]:
+                del self._sessions[session_id]
+        try:
+            names = os.listdir(self.sessions_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.sessions_dir, name)
+            # A lock file lasts as long as its session; its own mtime is when it was created
+            age_path = path[:-len(".lock")] if name.endswith(".lock") else path
+            try:
+                if os.path.getmtime(age_path if os.path.exists(age_path) else path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """The process-wide session store, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+    return _store
+
+
+def run_session_turn(session_id: str, query: str, mapping_mode: str, diagram_format: str = "full",
+                     refinement: str = REFINEMENT_MODE) -> Dict:
+    """
+    Runs the pipeline for the next message of a session and carries its flow forward.
+
+    Args:
+        session_id: The session to continue.
+        query: The first prompt, or a follow-up message.
+        mapping_mode: "sequential", "parallel" or "structured"; used by full runs.
+        diagram_format: "full" returns the whole laid-out flow; "patch" returns
+            diagram_patch against the previous turn's flow instead, once there is one.
+        refinement: "delta" edits the previous turn's steps and flow; "rerun" runs
+            the whole pipeline on the message.
+
+    Returns:
+        run_crew's result with session_id, turn and diagram_hash added. flow_diagram_json
+        carries the stabilized ids and node positions.
+
+    Raises:
+        SessionNotFound: The session is unknown or has expired.
+    """
+    # Imported here: the crew pulls in the LLM stack, which the session API itself does not need
+    from backend.agents import run_crew, run_refinement
+
+    store = get_session_store()
+    session = store.get(session_id)
+    if session is None:
+        raise SessionNotFound(f"Unknown session: {session_id}")
+    with store.turn(session):
+        if refinement == "delta" and session.flow and session.structured_requirements:
+            previous = {"query": "\n".join(session.turns), "structured_requirements": session.structured_requirements,
+                        "flow": session.flow}
+            result = run_refinement(query, session.tool_choice, previous, session.retrieval)
+        else:
+            result = run_crew(query, session.tool_choice, mapping_mode)
+        new_flow = FlowGraph.from_dict(result.get("flow_diagram_json")).to_dict()
+        with span("update_flow", session_id=session.id, nodes=len(new_flow["nodes"])):
+            flow, patch, stats = update_flow(session.flow, new_flow)
+        if patch is not None:
+            logger.info(f"Session {session.id}: {len(patch['added'])} added, {len(patch['removed'])} removed, "
+                        f"{len(patch['relabeled'])} relabeled, {len(patch['moved'])} moved; "
+                        f"relaid {stats['relaid_ranks']}/{stats['ranks']} ranks")
+        session.turns.append(query)
+        session.structured_requirements = result.get("structured_requirements")
+        session.flow = flow
+        session.flow_hash = flow_hash(flow)
+        store.save(session)
+
+    result = dict(result, session_id=session.id, turn=len(session.turns), diagram_hash=session.flow_hash)
+    if diagram_format == "patch" and patch is not None:
+        result["diagram_patch"] = dict(patch, layout=stats)
+        result["flow_diagram_json"] = None
+        result["mermaid_syntax"] = None
+    else:
+        graph = FlowGraph.from_dict(flow)
+        result["flow_diagram_json"] = graph.to_dict()
+        if any(a["id"] != b.id for a, b in zip(new_flow["nodes"], graph.nodes)):
+            # The model's Mermaid uses its own ids; draw it again with the session's
+            result["mermaid_syntax"] = flow_mermaid(graph)
+    return result
@@ -0,0 +1,95 @@
+"""
+Schema-constrained Tool Mapper: one structured-output call instead of a mapping crew.
+
+In the sequential crew the Tool Mapper learns the flow format from prose and an
+example. It searches for actions with tool calls spread over several LLM
+rounds, and a Mermaid expert then checks the diagram. In structured mode
+(mapping_mode="structured") the actions for every step are retrieved up front.
+The mapping is then a single chat completion whose response_format is the
+strict nodes/edges JSON schema (json_extract.FLOW_JSON_SCHEMA). The model can
+only produce a valid flow, so there are no parse fallbacks or guardrail
+retries. The Mermaid diagram is generated locally from the nodes.
+
+The completion is streamed through json_extract.stream_flow. A refusal or a
+flow cut off at the token limit raises MalformedOutput as soon as it shows,
+and the stream is closed, which cancels the rest of the generation.
+"""
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from backend.json_extract import FLOW_JSON_SCHEMA, MalformedOutput, stream_flow
+from backend.services import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+# Output tokens allowed for one flow
+STRUCTURED_MAX_TOKENS = int(os.getenv("STRUCTURED_MAX_TOKENS", "16000"))
+
+MAPPER_INSTRUCTIONS = """You are a Tool Mapper, an expert in RPA tools and workflow design.
+Translate the user's workflow steps into a flow graph of actions from the designated RPA toolset.
+- Each action node's label is the exact name of an action from the candidate actions listed for its step.
+- Decisions are 'diamond' nodes; their two outgoing edges are labelled 'True' and 'False'.
+- Every other node is a 'rectangle' and every other edge has an empty label.
+- Start with a 'Start' node and end every path in an 'End' node.
+- Node ids are short strings ("1", "2", ...), unique within the flow."""
+
+
+def _content_chunks(stream, usage: Dict) -> Iterator[str]:
+    """The text of a streamed completion, collecting its token usage into usage."""
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage.update(
+                prompt_tokens=chunk.usage.prompt_tokens,
+                completion_tokens=chunk.usage.completion_tokens,
+                total_tokens=chunk.usage.total_tokens,
+            )
+        for choice in chunk.choices:
+            if getattr(choice.delta, "refusal", None):
+                raise MalformedOutput(f"The model refused to map the flow: {choice.delta.refusal}")
+            if choice.delta.content:
+                yield choice.delta.content
+            if choice.finish_reason == "length":
+                raise MalformedOutput(f"The flow was cut off at {STRUCTURED_MAX_TOKENS} output tokens")
+
+
+def map_flow_structured(prompt: str, model: str, temperature: Optional[float] = None, client=None) -> Tuple[Dict, Dict]:
+    """
+    Maps steps to a flow with one schema-constrained completion.
+
+    Args:
+        prompt: The steps and their candidate actions.
+        model: The chat model; it must support structured outputs.
+        temperature: Sampling temperature, or None for the model's default.
+        client: An OpenAI client; defaults to the shared one.
+
+    Returns:
+        The validated {"nodes", "edges"} flow, and the token usage.
+
+    Raises:
+        MalformedOutput: The model refused, or the flow was cut off.
+    """
+    messages: List[Dict] = [
+        {"role": "system", "content": MAPPER_INSTRUCTIONS},
+        {"role": "user", "content": prompt},
+    ]
+    params = {"temperature": temperature} if temperature is not None else {}
+    stream = (client or get_openai_client()).chat.completions.create(
+        model=model,
+        messages=messages,
+        response_format={"type": "json_schema", "json_schema": {"name": "flow", "strict": True, "schema": FLOW_JSON_SCHEMA}},
+        max_completion_tokens=STRUCTURED_MAX_TOKENS,
+        stream=True,
+        stream_options={"include_usage": True},
+        **params,
+    )
+    usage: Dict = {}
+    chunks = _content_chunks(stream, usage)
+    try:
+        flow = stream_flow(chunks)
+        # Only the usage chunk follows the object's closing brace
+        for _ in chunks:
+            pass
+    finally:
+        stream.close()
+    return flow, usage
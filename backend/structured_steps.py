@@ -0,0 +1,34 @@
+"""
+Helpers for the Requirement Analyst's numbered step list.
+"""
+import re
+from typing import List
+
+_STEP_RE = re.compile(r"^\s*(?:step\s*)?\d+\s*[.):-]\s*(.+?)\s*$", re.IGNORECASE)
+_BULLET_RE = re.compile(r"^\s*[-*•]\s+(.+?)\s*$")
+
+
+def split_structured_steps(text: str) -> List[str]:
+    """
+    Split the structuring task output into individual steps.
+
+    Numbered lines ("1. ...", "2) ...", "Step 3: ...") start a new step;
+    indented or bulleted lines underneath are folded into the step above so
+    sub-points stay with their parent. Falls back to bullet lines, then to
+    non-empty lines, when the output is not numbered.
+    """
+    lines = (text or "").splitlines()
+    steps: List[str] = []
+    for line in lines:
+        match = _STEP_RE.match(line)
+        if match:
+            steps.append(match.group(1).strip("* "))
+        elif steps and line.strip():
+            steps[-1] = f"{steps[-1]} {line.strip().lstrip('-*• ')}"
+    if steps:
+        return steps
+
+    bullets = [m.group(1) for m in map(_BULLET_RE.match, lines) if m]
+    if bullets:
+        return bullets
+    return [line.strip() for line in lines if line.strip()]
@@ -0,0 +1,474 @@
+"""
+Server-side SVG and PNG rendering of flow diagrams.
+
+The Streamlit app used to render every flowchart in the browser. Each one was
+an HTML component that downloaded mermaid.js from a CDN and laid the diagram
+out again on every rerun. This module draws the same nodes and edges from the
+positions layout_flow computes, with no JS runtime. Flows whose nodes all
+carry a position (session flows, see backend/diagram_diff.py) are drawn where
+they are, so a refined diagram does not jump around.
+
+Edges are routed orthogonally. Every edge leaves its node through the bottom
+(decisions also use their side corners) and runs horizontally in its own slot
+of the channel below the row. It drops into its target from the top. When
+the straight drop would cross a node, or the target is above the source, the
+edge climbs or descends on a lane to the right of the rows in between.
+
+iter_svg() yields the document in chunks, so large diagrams can be written to
+a file or an HTTP response without building the whole string. PNG export
+rasterizes the SVG with cairosvg when it is installed. Otherwise it draws the
+same geometry with Pillow.
+
+Diagrams are identified by diagram_hash(), a digest of the parts that affect
+the drawing. Rendered output is kept in a process-wide LRU (SVG_CACHE_SIZE
+entries) keyed by that hash. POST /render/svg and /render/png return the hash
+as the ETag. The frontend caches the SVG under the same hash with
+st.cache_data, so a diagram is rendered once per server and fetched once per
+frontend.
+
+Usage:
+    python -m backend.svg_renderer flow.json -o flow.svg|flow.png [--scale 0.25]
+
+flow.json holds {"nodes", "edges"}, or a /process-query result whose
+flow_diagram_json is rendered.
+"""
+import argparse
+import bisect
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from xml.sax.saxutils import escape
+
+from backend.diagram_generator import DEFAULT_LINE_HEIGHT_ESTIMATE, display_label, layout_flow
+from backend.flow_models import FlowGraph
+
+try:
+    import cairosvg
+except (ImportError, OSError):
+    # OSError: the package is installed but the cairo library is missing
+    cairosvg = None
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+# Bumped whenever the drawing changes, so cached output of older renderers is not reused
+RENDERER_VERSION = "3"
+SVG_CACHE_SIZE = int(os.getenv("SVG_CACHE_SIZE", "256"))
+# Diagrams with more nodes are streamed by the API instead of cached
+SVG_STREAM_MIN_NODES = int(os.getenv("SVG_STREAM_MIN_NODES", "500"))
+# PNG pixels per layout unit; layout units are large (a short label is ~1000 wide)
+PNG_SCALE = float(os.getenv("PNG_SCALE", "0.25"))
+
+MARGIN = 60
+FONT_SIZE = int(DEFAULT_LINE_HEIGHT_ESTIMATE * 0.8)
+EDGE_LABEL_FONT_SIZE = int(FONT_SIZE * 0.8)
+STROKE_WIDTH = 4
+# Channel height used above the first row and below the last
+CHANNEL_GAP = 120
+# Distance between parallel lanes right of the rows
+LANE_GAP = 40
+# Horizontal stub out of a decision's side corner before turning down
+SIDE_STUB = 40
+# Elements per chunk yielded by iter_svg
+CHUNK_SIZE = 64
+# Matches the dark theme of frontend/ui/style.css
+THEME = {
+    "background": "#0F172A",
+    "node_fill": "#1F2937",
+    "decision_fill": "#111827",
+    "stroke": "#3B82F6",
+    "decision_stroke": "#FF7A00",
+    "text": "#E5E7EB",
+    "edge": "#9CA3AF",
+}
+
+Point = Tuple[float, float]
+
+
+def canonical_flow(nodes: List[Dict], edges: List[Dict]) -> Dict:
+    """Only the fields that change the drawing, in a stable order. Positions are kept when every node has one."""
+    positioned = bool(nodes) and all("position" in node for node in nodes)
+    return {
+        "nodes": [
+            dict({"id": str(node["id"]), "label": node.get("data", {}).get("label", ""), "shape": node.get("shape", "rectangle")},
+                 **({"position": node["position"]} if positioned else {}))
+            for node in nodes
+        ],
+        "edges": [
+            {"source": str(edge["source"]), "target": str(edge["target"]), "label": edge.get("label") or ""}
+            for edge in edges
+        ],
+    }
+
+
+def diagram_hash(nodes: List[Dict], edges: List[Dict]) -> str:
+    """A digest identifying the rendered diagram of a flow."""
+    payload = json.dumps(canonical_flow(nodes, edges), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{RENDERER_VERSION}:{payload}".encode("utf-8")).hexdigest()[:32]
+
+
+class _Rows:
+    """The laid-out nodes grouped into rows, for finding free channels and lanes."""
+
+    def __init__(self, nodes: List[Dict]):
+        by_top: Dict[float, List[Dict]] = defaultdict(list)
+        for node in nodes:
+            by_top[node["position"]["y"]].append(node)
+        self.tops = sorted(by_top)
+        self.rows = [sorted(by_top[top], key=lambda n: n["position"]["x"]) for top in self.tops]
+        self.bottoms = [max(n["position"]["y"] + n["position"]["height"] for n in row) for row in self.rows]
+        self.rights = [max(n["position"]["x"] + n["position"]["width"] for n in row) for row in self.rows]
+        self._lefts = [[n["position"]["x"] for n in row] for row in self.rows]
+        self.index = {node["id"]: i for i, row in enumerate(self.rows) for node in row}
+
+    def channel_below(self, row: int) -> Tuple[float, float]:
+        top = self.bottoms[row]
+        bottom = self.tops[row + 1] if row + 1 < len(self.tops) else top + CHANNEL_GAP
+        return top, max(bottom, top + STROKE_WIDTH * 4)
+
+    def channel_above(self, row: int) -> Tuple[float, float]:
+        return self.channel_below(row - 1) if row > 0 else (self.tops[0] - CHANNEL_GAP, self.tops[0])
+
+    def _between(self, y_from: float, y_to: float) -> Iterator[int]:
+        low, high = min(y_from, y_to), max(y_from, y_to)
+        for i, top in enumerate(self.tops):
+            if top < high and self.bottoms[i] > low:
+                yield i
+
+    def blocked(self, x: float, y_from: float, y_to: float) -> bool:
+        """Whether a vertical segment at x between the two heights passes through a node."""
+        for i in self._between(y_from, y_to):
+            j = bisect.bisect_right(self._lefts[i], x) - 1
+            if j >= 0:
+                pos = self.rows[i][j]["position"]
+                if x <= pos["x"] + pos["width"]:
+                    return True
+        return False
+
+    def right_of(self, y_from: float, y_to: float) -> float:
+        """The right edge of the widest row between the two heights."""
+        return max((self.rights[i] for i in self._between(y_from, y_to)), default=0.0)
+
+
+def _exits(node: Dict, count: int) -> List[List[Point]]:
+    """
+    The stubs that `count` outgoing edges leave a node by, each ending where it turns into the channel.
+
+    Rectangles spread their exits along the bottom. Decisions use the left
+    corner, the bottom corner and then the right corner, so Yes/No branches
+    separate at once.
+    """
+    pos = node["position"]
+    x, y, w, h = pos["x"], pos["y"], pos["width"], pos["height"]
+    if node.get("shape") == "diamond":
+        bottom = [(x + w / 2, y + h)]
+        left = [(x, y + h / 2), (x - SIDE_STUB, y + h / 2)]
+        right = [(x + w, y + h / 2), (x + w + SIDE_STUB, y + h / 2)]
+        if count == 1:
+            return [bottom]
+        if count == 2:
+            return [left, right]
+        return [left] + [bottom] * (count - 2) + [right]
+    return [[(x + w * (i + 1) / (count + 1), y + h)] for i in range(count)]
+
+
+def route_edges(nodes: List[Dict], edges: List[Dict]) -> List[Tuple[Dict, List[Point]]]:
+    """
+    Orthogonal polylines for the edges between laid-out nodes.
+
+    Args:
+        nodes: Nodes with a `position` from layout_flow.
+        edges: Edges with 'source' and 'target' ids; edges to unknown nodes are skipped.
+
+    Returns:
+        (edge, points) pairs; each polyline ends on the top of its target node.
+    """
+    by_id = {node["id"]: node for node in nodes}
+    rows = _Rows(nodes)
+    edges = [edge for edge in edges if edge["source"] in by_id and edge["target"] in by_id]
+
+    # Exits are assigned left to right in the order of the targets' x, so sibling edges don't cross
+    outgoing: Dict[str, List[Dict]] = defaultdict(list)
+    for edge in edges:
+        outgoing[edge["source"]].append(edge)
+    stubs: Dict[int, List[Point]] = {}
+    for source, out in outgoing.items():
+        out.sort(key=lambda e: by_id[e["target"]]["position"]["x"])
+        for edge, stub in zip(out, _exits(by_id[source], len(out))):
+            stubs[id(edge)] = stub
+
+    # Each edge runs in its own slot of the channel below its source's row, ordered by exit x
+    slots: Dict[int, List[Dict]] = defaultdict(list)
+    for edge in edges:
+        slots[rows.index[edge["source"]]].append(edge)
+    channel_y: Dict[int, float] = {}
+    for row, row_edges in slots.items():
+        row_edges.sort(key=lambda e: stubs[id(e)][-1][0])
+        top, bottom = rows.channel_below(row)
+        for k, edge in enumerate(row_edges):
+            channel_y[id(edge)] = top + (bottom - top) * (k + 1) / (len(row_edges) + 1)
+
+    routes = []
+    lanes = 0
+    for edge in edges:
+        source, target = by_id[edge["source"]], by_id[edge["target"]]
+        points = list(stubs[id(edge)])
+        x1 = points[-1][0]
+        cy = channel_y[id(edge)]
+        t = target["position"]
+        x2, y2 = t["x"] + t["width"] / 2, t["y"]
+        points.append((x1, cy))
+        target_row = rows.index[target["id"]]
+        if target_row > rows.index[source["id"]] and not rows.blocked(x2, cy, y2):
+            points += [(x2, cy), (x2, y2)]
+        else:
+            # Around the rows in between: right to a free lane, along it, then into the channel above the target
+            above_top, above_bottom = rows.channel_above(target_row)
+            ty = above_bottom - (above_bottom - above_top) / 4 - (lanes % 3) * STROKE_WIDTH * 2
+            lane = max(x1, x2, rows.right_of(cy, ty)) + LANE_GAP * (1 + lanes)
+            lanes += 1
+            points += [(lane, cy), (lane, ty), (x2, ty), (x2, y2)]
+        routes.append((edge, _simplify(points)))
+    return routes
+
+
+def _simplify(points: List[Point]) -> List[Point]:
+    """Drops repeated points and the middle of collinear runs."""
+    result: List[Point] = []
+    for point in points:
+        if result and point == result[-1]:
+            continue
+        if len(result) >= 2:
+            (ax, ay), (bx, by) = result[-2], result[-1]
+            if (ax == bx == point[0]) or (ay == by == point[1]):
+                result[-1] = point
+                continue
+        result.append(point)
+    return result
+
+
+def _label_anchor(points: List[Point]) -> Point:
+    """Where an edge's label goes: beside its first segment, clear of the source node."""
+    (ax, ay), (bx, by) = points[0], points[1]
+    if ax == bx:
+        return ax + 10, ay + min(abs(by - ay) / 2, 40)
+    return (ax + bx) / 2, ay - 18
+
+
+def layout(nodes: List[Dict], edges: List[Dict]) -> Tuple[List[Dict], List[Tuple[Dict, List[Point]]], Tuple[float, float, float, float]]:
+    """Positions, edge routes and the bounding box (x, y, width, height) of a flow."""
+    flow = canonical_flow(nodes, edges)
+    graph = FlowGraph.from_dict(flow).with_labels(display_label)
+    # Session flows arrive laid out (backend/diagram_diff.py); drawing them must not move their nodes
+    if not graph.positioned:
+        graph, _ = layout_flow(graph)
+    laid_out = [node.to_dict() for node in graph.nodes if node.position is not None]
+    if not laid_out:
+        return [], [], (0.0, 0.0, 2.0 * MARGIN, 2.0 * MARGIN)
+    routes = route_edges(laid_out, flow["edges"])
+    xs = [node["position"]["x"] for node in laid_out] + [node["position"]["x"] + node["position"]["width"] for node in laid_out]
+    ys = [node["position"]["y"] for node in laid_out] + [node["position"]["y"] + node["position"]["height"] for node in laid_out]
+    for _, points in routes:
+        xs.extend(x for x, _ in points)
+        ys.extend(y for _, y in points)
+    min_x, min_y = min(xs) - MARGIN, min(ys) - MARGIN
+    return laid_out, routes, (min_x, min_y, max(xs) + MARGIN - min_x, max(ys) + MARGIN - min_y)
+
+
+def _label_lines(node: Dict) -> List[str]:
+    return node["data"]["label"].replace("\n", "<br/>").split("<br/>")
+
+
+def _svg_text(x: float, y: float, lines: List[str], font_size: int, line_height: float, anchor: str = "middle") -> str:
+    # Centre the block of lines vertically on y
+    first = y - (len(lines) - 1) * line_height / 2
+    spans = "".join(
+        f'<tspan x="{x:.1f}" y="{first + i * line_height:.1f}">{escape(line)}</tspan>'
+        for i, line in enumerate(lines)
+    )
+    return (f'<text font-size="{font_size}" text-anchor="{anchor}" dominant-baseline="central" '
+            f'fill="{THEME["text"]}">{spans}</text>')
+
+
+def _svg_node(node: Dict) -> str:
+    pos = node["position"]
+    x, y, w, h = pos["x"], pos["y"], pos["width"], pos["height"]
+    cx, cy = x + w / 2, y + h / 2
+    if node.get("shape") == "diamond":
+        shape = (f'<polygon points="{cx:.1f},{y:.1f} {x + w:.1f},{cy:.1f} {cx:.1f},{y + h:.1f} {x:.1f},{cy:.1f}" '
+                 f'fill="{THEME["decision_fill"]}" stroke="{THEME["decision_stroke"]}" stroke-width="{STROKE_WIDTH}"/>')
+    else:
+        shape = (f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" rx="24" '
+                 f'fill="{THEME["node_fill"]}" stroke="{THEME["stroke"]}" stroke-width="{STROKE_WIDTH}"/>')
+    text = _svg_text(cx, cy, _label_lines(node), FONT_SIZE, DEFAULT_LINE_HEIGHT_ESTIMATE)
+    return f'<g id="node-{escape(str(node["id"]))}">{shape}{text}</g>'
+
+
+def _svg_edge(edge: Dict, points: List[Point]) -> str:
+    coords = " ".join(f"{x:.1f},{y:.1f}" for x, y in points)
+    svg = (f'<polyline points="{coords}" fill="none" stroke="{THEME["edge"]}" stroke-width="{STROKE_WIDTH}" '
+           f'stroke-linejoin="round" marker-end="url(#arrow)"/>')
+    if edge["label"]:
+        x, y = _label_anchor(points)
+        anchor = "start" if points[0][0] == points[1][0] else "middle"
+        svg += _svg_text(x, y, [edge["label"]], EDGE_LABEL_FONT_SIZE, EDGE_LABEL_FONT_SIZE, anchor)
+    return svg
+
+
+def iter_svg(nodes: List[Dict], edges: List[Dict]) -> Iterator[str]:
+    """
+    Draws a flow as a standalone SVG document, yielded in chunks.
+
+    Args:
+        nodes: Flow nodes with 'id', 'data.label' and an optional 'shape' ('rectangle' or 'diamond').
+        edges: Flow edges with 'source', 'target' and an optional 'label'.
+
+    Yields:
+        Consecutive pieces of the SVG markup. The document scales to the width of its container.
+    """
+    laid_out, routes, (min_x, min_y, width, height) = layout(nodes, edges)
+    yield (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{min_x:.1f} {min_y:.1f} {width:.1f} {height:.1f}" '
+        f'width="100%" preserveAspectRatio="xMidYMin meet" font-family="Inter, Helvetica, Arial, sans-serif" font-weight="bold">'
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="6" markerHeight="6" orient="auto-start-reverse">'
+        f'<path d="M0,0 L10,5 L0,10 z" fill="{THEME["edge"]}"/></marker></defs>'
+        f'<rect x="{min_x:.1f}" y="{min_y:.1f}" width="{width:.1f}" height="{height:.1f}" fill="{THEME["background"]}"/>'
+    )
+    chunk: List[str] = []
+    for edge, points in routes:
+        chunk.append(_svg_edge(edge, points))
+        if len(chunk) >= CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    for node in laid_out:
+        chunk.append(_svg_node(node))
+        if len(chunk) >= CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    chunk.append("</svg>")
+    yield "".join(chunk)
+
+
+def render_svg(nodes: List[Dict], edges: List[Dict]) -> str:
+    """The whole SVG document of a flow; see iter_svg."""
+    return "".join(iter_svg(nodes, edges))
+
+
+def render_png(nodes: List[Dict], edges: List[Dict], scale: float = PNG_SCALE) -> bytes:
+    """
+    Rasterizes a flow to PNG, through cairosvg when installed and Pillow otherwise.
+
+    Raises:
+        ImportError: Neither cairosvg nor Pillow is installed.
+    """
+    if cairosvg is not None:
+        _, _, (_, _, width, _) = layout(nodes, edges)
+        return cairosvg.svg2png(bytestring=render_svg(nodes, edges).encode("utf-8"), output_width=max(1, int(width * scale)))
+    if Image is None:
+        raise ImportError("PNG export requires cairosvg or Pillow (pip install cairosvg)")
+    return _draw_png(nodes, edges, scale)
+
+
+def _draw_png(nodes: List[Dict], edges: List[Dict], scale: float) -> bytes:
+    laid_out, routes, (min_x, min_y, width, height) = layout(nodes, edges)
+    image = Image.new("RGB", (max(1, int(width * scale)), max(1, int(height * scale))), THEME["background"])
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=max(6, FONT_SIZE * scale))
+    label_font = ImageFont.load_default(size=max(6, EDGE_LABEL_FONT_SIZE * scale))
+    line = max(1, round(STROKE_WIDTH * scale))
+
+    def at(x: float, y: float) -> Point:
+        return (x - min_x) * scale, (y - min_y) * scale
+
+    for edge, points in routes:
+        draw.line([at(x, y) for x, y in points], fill=THEME["edge"], width=line, joint="curve")
+        # Arrowhead on the last segment, which always points down into the target
+        tip_x, tip_y = at(*points[-1])
+        size = max(3.0, 14 * scale)
+        draw.polygon([(tip_x, tip_y), (tip_x - size / 2, tip_y - size), (tip_x + size / 2, tip_y - size)], fill=THEME["edge"])
+        if edge["label"]:
+            anchor = "lm" if points[0][0] == points[1][0] else "mm"
+            draw.text(at(*_label_anchor(points)), edge["label"], fill=THEME["text"], font=label_font, anchor=anchor)
+    for node in laid_out:
+        pos = node["position"]
+        x0, y0 = at(pos["x"], pos["y"])
+        x1, y1 = at(pos["x"] + pos["width"], pos["y"] + pos["height"])
+        if node.get("shape") == "diamond":
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            draw.polygon([(cx, y0), (x1, cy), (cx, y1), (x0, cy)], fill=THEME["decision_fill"],
+                         outline=THEME["decision_stroke"], width=line)
+        else:
+            draw.rounded_rectangle((x0, y0, x1, y1), radius=24 * scale, fill=THEME["node_fill"],
+                                   outline=THEME["stroke"], width=line)
+        draw.multiline_text(((x0 + x1) / 2, (y0 + y1) / 2), "\n".join(_label_lines(node)), fill=THEME["text"],
+                            font=font, anchor="mm", align="center", spacing=(DEFAULT_LINE_HEIGHT_ESTIMATE - FONT_SIZE) * scale)
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+_cache: "OrderedDict[Tuple[str, str], Union[str, bytes]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cached_render(nodes: List[Dict], edges: List[Dict], fmt: str = "svg") -> Tuple[str, Union[str, bytes]]:
+    """The diagram hash and rendering ('svg' text or 'png' bytes) of a flow, rendered at most once while in the LRU."""
+    key = diagram_hash(nodes, edges)
+    with _cache_lock:
+        output = _cache.get((fmt, key))
+        if output is not None:
+            _cache.move_to_end((fmt, key))
+            return key, output
+    output = render_png(nodes, edges) if fmt == "png" else render_svg(nodes, edges)
+    with _cache_lock:
+        _cache[(fmt, key)] = output
+        while len(_cache) > SVG_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return key, output
+
+
+def cached_svg(nodes: List[Dict], edges: List[Dict]) -> Tuple[str, str]:
+    """The diagram hash and SVG of a flow, rendered at most once while it stays in the LRU."""
+    return cached_render(nodes, edges, "svg")
+
+
+def load_flow(path: str) -> Dict:
+    """A {"nodes", "edges"} flow from a flow file or a /process-query result."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    flow = data.get("flow_diagram_json", data)
+    if isinstance(flow, str):
+        flow = json.loads(flow)
+    return {"nodes": flow.get("nodes", []), "edges": flow.get("edges", [])}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Render a flow diagram to SVG or PNG without a browser.")
+    parser.add_argument("flow", help="JSON file with nodes and edges, or a /process-query result")
+    parser.add_argument("-o", "--output", required=True, help="Output file; .png renders PNG, anything else SVG")
+    parser.add_argument("--scale", type=float, default=PNG_SCALE, help="PNG pixels per layout unit")
+    args = parser.parse_args(argv)
+
+    flow = load_flow(args.flow)
+    started = time.perf_counter()
+    if args.output.lower().endswith(".png"):
+        with open(args.output, "wb") as f:
+            f.write(render_png(flow["nodes"], flow["edges"], args.scale))
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for chunk in iter_svg(flow["nodes"], flow["edges"]):
+                f.write(chunk)
+    print(f"Rendered {len(flow['nodes'])} nodes and {len(flow['edges'])} edges to {args.output} "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,8 @@ from backend.agents import run_crew
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         query = sys.argv[1]
-        result = run_crew(query)
+        tool_choice = sys.argv[2] if len(sys.argv) > 2 else "power_automate"
+        result = run_crew(query, tool_choice)
         print(result)
     else:
-        print("Please provide a query as a command-line argument.")
+        print("Please provide a query (and optionally a tool choice) as command-line arguments.")
@@ -0,0 +1,295 @@
+"""
+Lightweight tracing and metrics for the request pipeline.
+
+Spans follow the OpenTelemetry data model: 128-bit trace ids, 64-bit span ids,
+parent links, nanosecond timestamps and attributes. Finished spans are written
+by a local exporter as OTLP-style JSON lines to TRACE_EXPORT_PATH, when that is
+set. Every span also feeds a per-stage latency histogram. Those histograms and
+the token/tool/cache counters are rendered in the Prometheus text format for
+the /metrics endpoint.
+
+Usage:
+    with span("embedding", model=EMBEDDING_MODEL) as current:
+        ...
+        current.set_attribute("tokens", 42)
+"""
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("flowpilot_current_span", default=None)
+_current_timeline: contextvars.ContextVar = contextvars.ContextVar("flowpilot_current_timeline", default=None)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """A monotonically increasing Prometheus counter with labels."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """A cumulative-bucket Prometheus histogram with labels."""
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._values.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return "\n".join(lines)
+
+
+STAGE_DURATION = Histogram("flowpilot_stage_duration_seconds", "Latency of each traced pipeline stage.")
+HTTP_REQUEST_DURATION = Histogram("flowpilot_http_request_duration_seconds", "Latency of API requests.")
+LLM_TOKENS = Counter("flowpilot_llm_tokens_total", "LLM tokens used, by stage and kind (prompt/completion).")
+EMBEDDING_TOKENS = Counter("flowpilot_embedding_tokens_total", "Tokens sent to the embeddings API.")
+TOOL_CALLS = Counter("flowpilot_tool_calls_total", "Agent tool invocations, by tool and outcome.")
+CACHE_REQUESTS = Counter("flowpilot_cache_requests_total", "Cache lookups, by cache and result (hit/miss).")
+
+REGISTRY = [STAGE_DURATION, HTTP_REQUEST_DURATION, LLM_TOKENS, EMBEDDING_TOKENS, TOOL_CALLS, CACHE_REQUESTS]
+
+
+def register(metric):
+    """Adds a metric to the /metrics output and returns it."""
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class Span:
+    """One timed operation in a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1) -> None:
+        """Increments a numeric attribute, e.g. a per-task tool-call count."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": [{"key": k, "value": v} for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+
+
+class JsonLinesExporter:
+    """Appends finished spans as OTLP-style JSON lines to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, finished: Span) -> None:
+        line = json.dumps(finished.to_otlp(), default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+_exporter = JsonLinesExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _finish(finished: Span, end_ns: Optional[int] = None) -> None:
+    finished.end_ns = end_ns or time.time_ns()
+    STAGE_DURATION.observe(finished.duration, stage=finished.name)
+    if _exporter is not None:
+        _exporter.export(finished)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Times a block as a child of the current span (or as a new trace root)."""
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "ERROR"
+        current.set_attribute("error", repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes) -> Span:
+    """Records an already-finished stage (e.g. a crew task timed by callbacks)."""
+    recorded = Span(name, _current_span.get(), attributes)
+    recorded.start_ns = start_ns
+    _finish(recorded, end_ns)
+    return recorded
+
+
+class CrewTimeline:
+    """
+    Times the tasks of a sequential crew from their completion callbacks.
+
+    A task's span runs from the previous task's completion (or kickoff) to its
+    own completion, which is exact for sequential crews. Events counted while
+    the timeline is active (tool calls, cache hits, LLM tokens) are attributed
+    to the task that is running when they happen. Tokens counted as
+    "llm.<kind>" are also summed per stage in token_usage.
+    """
+
+    def __init__(self):
+        self._mark = time.time_ns()
+        self._pending: Dict[str, float] = {}
+        # Stage -> {"prompt_tokens", "completion_tokens", "total_tokens"} of its tasks
+        self.token_usage: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def active(self) -> Iterator["CrewTimeline"]:
+        """Wrap crew.kickoff() so the first task is timed from kickoff."""
+        token = _current_timeline.set(self)
+        self._mark = time.time_ns()
+        try:
+            yield self
+        finally:
+            _current_timeline.reset(token)
+
+    def callback(self, stage: str):
+        """A crewAI Task callback that records the task's span."""
+        def on_task_done(output) -> None:
+            now = time.time_ns()
+            attributes, self._pending = self._pending, {}
+            record_span(f"task.{stage}", self._mark, now, **attributes)
+            for key, value in attributes.items():
+                if key.startswith("llm."):
+                    usage = self.token_usage.setdefault(stage, {})
+                    usage[key[4:]] = usage.get(key[4:], 0) + value
+            self._mark = now
+        return on_task_done
+
+
+def count(key: str, amount: float = 1) -> None:
+    """Counts an event against the running crew task, or else the current span."""
+    timeline = _current_timeline.get()
+    if timeline is not None:
+        timeline._pending[key] = timeline._pending.get(key, 0) + amount
+        return
+    current = _current_span.get()
+    if current is not None:
+        current.add(key, amount)
+
+
+def count_token_usage(stage: str, usage: Dict) -> None:
+    """Adds a stage's prompt and completion tokens to the LLM token counter."""
+    LLM_TOKENS.inc(usage.get("prompt_tokens") or 0, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(usage.get("completion_tokens") or 0, stage=stage, kind="completion")
+
+
+def record_token_usage(stage: Optional[str], usage, target: Optional[Span] = None) -> None:
+    """
+    Records crew token usage (crewAI UsageMetrics or a dict) on counters and a span.
+
+    With stage None the usage only annotates the span, for a total whose stages
+    were counted separately.
+    """
+    if usage is None:
+        return
+    if not isinstance(usage, dict):
+        usage = {k: getattr(usage, k, 0) for k in ("prompt_tokens", "completion_tokens", "total_tokens", "successful_requests")}
+    if stage is not None:
+        count_token_usage(stage, usage)
+    target = target or _current_span.get()
+    if target is not None:
+        for key, value in usage.items():
+            target.set_attribute(f"llm.{key}", value)
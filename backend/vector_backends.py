@@ -0,0 +1,192 @@
+"""
+Pluggable vector search backends behind search_rpa_actions.
+
+    chroma  Queries the Chroma store of the published version (or the legacy
+            VECTOR_STORE_PATH) through its persistent client.
+    numpy   Exact search with one float32 matrix-vector product over the
+            memory-mapped embeddings of the published version. With
+            VECTOR_QUANTIZATION=int8|pca it scans a compressed copy instead
+            and rescores the best candidates exactly (backend/quantization.py).
+    hnsw    Approximate search on an in-process HNSW graph (hnswlib). The graph
+            is built once per published version from the same memory-mapped
+            matrix, before that version goes live.
+
+VECTOR_BACKEND picks one. The default, `auto`, uses numpy for collections
+smaller than HNSW_MIN_ITEMS and hnsw for larger ones when hnswlib is installed.
+It uses chroma when no index version is published. Every backend returns a
+Chroma-shaped result with squared L2 distances.
+
+For catalogs of a few hundred actions, exact search takes tens of
+microseconds and skips Chroma's per-query SQLite and segment overhead. Compare
+the backends with `python -m backend.benchmarks.bench_vector_backends`.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend.quantization import QUANTIZATION_KINDS, VECTOR_QUANTIZATION, quantized_query
+from backend.vector_index import VectorIndex, add_index_loader, current_chroma_path, get_vector_index
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "chroma", "numpy", "hnsw")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto")
+# Collections at least this large use HNSW in `auto` mode
+HNSW_MIN_ITEMS = int(os.getenv("HNSW_MIN_ITEMS", "20000"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+
+class VectorBackend:
+    """Searches a tool collection and returns a Chroma-style result."""
+
+    name = ""
+    # Whether a query blocks long enough to be worth moving off the event loop
+    blocking = False
+
+    def query(self, collection_name: str, query_embedding: List[float], n_results: int) -> Dict:
+        raise NotImplementedError
+
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+    blocking = True
+
+    def query(self, collection_name: str, query_embedding: List[float], n_results: int) -> Dict:
+        from backend.services import get_chroma_client
+
+        collection = get_chroma_client(current_chroma_path()).get_collection(name=collection_name)
+        return collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=["metadatas", "documents", "distances"]
+        )
+
+
+class NumpyBackend(VectorBackend):
+    name = "numpy"
+
+    def query(self, collection_name: str, query_embedding: List[float], n_results: int) -> Dict:
+        return get_vector_index(collection_name).query(query_embedding, n_results)
+
+
+class QuantizedBackend(VectorBackend):
+    """Scans a compressed representation, then rescores the top candidates on the float32 rows."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.name = kind
+
+    def query(self, collection_name: str, query_embedding: List[float], n_results: int) -> Dict:
+        return quantized_query(get_vector_index(collection_name), self.kind, query_embedding, n_results)
+
+
+class HnswBackend(VectorBackend):
+    """
+    HNSW graphs built from the memory-mapped indexes, one per loaded collection index.
+
+    Graphs are keyed by the VectorIndex object. Once a version is swapped out
+    and no longer referenced, its graphs are dropped with it.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION, ef_search: int = HNSW_EF_SEARCH):
+        if hnswlib is None:
+            raise ImportError("The hnsw vector backend requires hnswlib (pip install hnswlib)")
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._graphs: "weakref.WeakKeyDictionary[VectorIndex, hnswlib.Index]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def graph(self, index: VectorIndex):
+        """The graph for an index, built on first use."""
+        graph = self._graphs.get(index)
+        if graph is None:
+            with self._lock:
+                graph = self._graphs.get(index)
+                if graph is None:
+                    graph = self._build(index)
+                    self._graphs[index] = graph
+        return graph
+
+    def _build(self, index: VectorIndex):
+        started = time.perf_counter()
+        graph = hnswlib.Index(space="l2", dim=index.vectors.shape[1])
+        graph.init_index(max_elements=len(index), ef_construction=self.ef_construction, M=self.m)
+        graph.add_items(np.asarray(index.vectors), np.arange(len(index)))
+        # ef is global to the graph, so it is set once here rather than per query
+        graph.set_ef(self.ef_search)
+        logger.info(f"Built HNSW graph over {len(index)} vectors of {index.version} in {time.perf_counter() - started:.2f}s")
+        return graph
+
+    def query(self, collection_name: str, query_embedding: List[float], n_results: int) -> Dict:
+        index = get_vector_index(collection_name)
+        k = min(n_results, len(index))
+        if k == 0 or k > self.ef_search:
+            # The graph cannot return more neighbours than ef; exact search can
+            return index.query(query_embedding, n_results)
+        rows, distances = self.graph(index).knn_query(np.asarray(query_embedding, dtype=np.float32), k=k, num_threads=1)
+        return index.result(rows[0], distances[0])
+
+
+_chroma = ChromaBackend()
+_numpy = NumpyBackend()
+_hnsw: Optional[HnswBackend] = None
+_quantized: Optional[QuantizedBackend] = None
+
+if VECTOR_BACKEND not in BACKENDS:
+    logger.warning(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}'; using auto.")
+    VECTOR_BACKEND = "auto"
+if VECTOR_QUANTIZATION in QUANTIZATION_KINDS:
+    _quantized = QuantizedBackend(VECTOR_QUANTIZATION)
+elif VECTOR_QUANTIZATION != "none":
+    logger.warning(f"Unknown VECTOR_QUANTIZATION '{VECTOR_QUANTIZATION}'; searching full-precision vectors.")
+if hnswlib is not None:
+    _hnsw = HnswBackend()
+elif VECTOR_BACKEND == "hnsw":
+    logger.warning("VECTOR_BACKEND=hnsw but hnswlib is not installed; using exact numpy search.")
+
+
+def _uses_hnsw(index: VectorIndex) -> bool:
+    if _hnsw is None:
+        return False
+    return VECTOR_BACKEND == "hnsw" or (VECTOR_BACKEND == "auto" and len(index) >= HNSW_MIN_ITEMS)
+
+
+def _prepare(collection_name: str, index: VectorIndex) -> None:
+    # Build graphs while a new version loads, so the first queries after the swap don't
+    if _uses_hnsw(index):
+        try:
+            _hnsw.graph(index)
+        except Exception as e:
+            logger.error(f"Could not build HNSW graph for '{collection_name}'; it will be retried on first query: {e}")
+
+
+add_index_loader(_prepare)
+
+
+def select_backend(collection_name: str) -> VectorBackend:
+    """The backend that serves a collection under the current VECTOR_BACKEND setting."""
+    if VECTOR_BACKEND == "chroma":
+        return _chroma
+    index = get_vector_index(collection_name)
+    if index is None:
+        return _chroma
+    if _uses_hnsw(index):
+        return _hnsw
+    if _quantized is not None and _quantized.kind in index.quantized:
+        return _quantized
+    return _numpy
@@ -0,0 +1,436 @@
+"""
+Versioned, read-only, memory-mapped vector indexes with atomic publishing.
+
+Layout of VECTOR_INDEX_PATH:
+
+    versions/<version>/chroma/        the Chroma store built for this version
+    versions/<version>/<tool>.npy     float32 embeddings exported from it
+    versions/<version>/<tool>.norms.npy
+    versions/<version>/<tool>.json    ids, documents, metadatas
+    versions/<version>/<tool>.int8.*.npy, <tool>.pca.*.npy
+                                      compressed copies (see backend/quantization.py)
+    versions/<version>/manifest.json
+    current -> versions/<version>     the live version
+
+build_vector_db writes a new version into a staging directory that nothing
+reads and renames it into versions/ when complete. It is then published by
+atomically replacing the `current` symlink. Builds never touch the live
+files, and the previous versions stay on disk for rollback
+(INDEX_KEEP_VERSIONS are kept).
+
+Workers open the matrices with np.load(mmap_mode="r"). When the app is
+preloaded before forking (see gunicorn.conf.py) the pages are shared through
+the OS page cache. Searches compute exact squared L2 distances (Chroma's
+default space) and return results shaped like Chroma's.
+
+Each process runs a watcher thread that checks `current` every
+INDEX_RELOAD_INTERVAL seconds. It fully loads a newly published version
+before swapping it in with a single reference assignment, so queries never
+wait on a load or a lock. Queries already running finish on the old version.
+
+Usage:
+    python -m backend.vector_index list
+    python -m backend.vector_index rollback [--to VERSION]
+    python -m backend.vector_index publish VERSION
+    python -m backend.vector_index import-store [--vector-store backend/vector_store]
+"""
+import argparse
+import json
+import logging
+import os
+import secrets
+import shutil
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.action_catalog import TOOL_SOURCES
+from backend.quantization import VECTOR_QUANTIZATION, export_quantized, load_quantized, scanned_arrays
+from backend.services import VECTOR_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_PATH = os.getenv(
+    "VECTOR_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "vector_index"),
+)
+# Seconds between checks for a newly published index version
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "2"))
+# Published versions kept on disk for rollback
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+
+VERSIONS_DIR = "versions"
+CURRENT = "current"
+MANIFEST = "manifest.json"
+CHROMA_DIR = "chroma"
+STAGING_PREFIX = ".staging-"
+
+
+class VectorIndex:
+    """Exact nearest-neighbour search over one collection's memory-mapped embeddings."""
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray, records: Dict, version: str, quantized: Optional[Dict] = None):
+        self.vectors = vectors
+        self.norms = norms
+        # Compressed representations by kind (see backend/quantization.py)
+        self.quantized: Dict[str, Dict] = quantized or {}
+        self.ids: List[str] = records["ids"]
+        self.documents: List[str] = records["documents"]
+        self.metadatas: List[Dict] = records["metadatas"]
+        self.version = version
+
+    @classmethod
+    def load(cls, version_path: str, entry: Dict, version: str) -> "VectorIndex":
+        vectors = np.load(os.path.join(version_path, entry["vectors"]), mmap_mode="r")
+        norms = np.load(os.path.join(version_path, entry["norms"]), mmap_mode="r")
+        with open(os.path.join(version_path, entry["records"]), "r") as f:
+            records = json.load(f)
+        quantized = load_quantized(version_path, entry.get("quantized", {}))
+        return cls(vectors, norms, records, version, quantized)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def warm(self) -> None:
+        """Reads every page that queries scan, so the first queries after a swap don't fault them in."""
+        arrays = self.quantized.get(VECTOR_QUANTIZATION)
+        # Quantized scans only rescore a few float32 rows, which are left on disk
+        for array in (scanned_arrays(arrays) if arrays else (self.vectors, self.norms)):
+            array.sum()
+
+    def query(self, query_embedding: List[float], n_results: int = 10) -> Dict:
+        """
+        The n_results nearest records by squared L2 distance.
+
+        Returns:
+            A Chroma-style result: ids, documents, metadatas and distances, each
+            wrapped in a one-element list for the single query.
+        """
+        if not len(self):
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = self.norms - 2.0 * (self.vectors @ query) + float(query @ query)
+        k = min(n_results, len(self))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return self.result(nearest, distances[nearest])
+
+    def result(self, rows, distances) -> Dict:
+        """A Chroma-style result for the given rows, nearest first, and their distances."""
+        return {
+            "ids": [[self.ids[i] for i in rows]],
+            "documents": [[self.documents[i] for i in rows]],
+            "metadatas": [[self.metadatas[i] for i in rows]],
+            "distances": [[float(max(d, 0.0)) for d in distances]],
+        }
+
+
+def version_path(version: str, index_root: str = VECTOR_INDEX_PATH) -> str:
+    return os.path.join(index_root, VERSIONS_DIR, version)
+
+
+def list_versions(index_root: str = VECTOR_INDEX_PATH) -> List[str]:
+    """Completed versions, oldest first (version ids sort chronologically)."""
+    try:
+        names = os.listdir(os.path.join(index_root, VERSIONS_DIR))
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if not name.startswith("."))
+
+
+def current_version(index_root: str = VECTOR_INDEX_PATH) -> Optional[str]:
+    """The published version, or None when nothing has been published."""
+    try:
+        return os.path.basename(os.readlink(os.path.join(index_root, CURRENT)))
+    except OSError:
+        return None
+
+
+def read_manifest(version: Optional[str] = None, index_root: str = VECTOR_INDEX_PATH) -> Optional[Dict]:
+    """The manifest of a version, by default the published one."""
+    version = version or current_version(index_root)
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(version_path(version, index_root), MANIFEST), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def current_chroma_path(index_root: str = VECTOR_INDEX_PATH) -> str:
+    """The Chroma store of the published version, or the legacy VECTOR_STORE_PATH."""
+    version = current_version(index_root)
+    if version is not None:
+        path = os.path.join(version_path(version, index_root), CHROMA_DIR)
+        if os.path.isdir(path):
+            return path
+    return VECTOR_STORE_PATH
+
+
+def create_staging(index_root: str = VECTOR_INDEX_PATH) -> Tuple[str, str]:
+    """
+    Reserves a new version and its staging directory.
+
+    Returns:
+        (version, staging path). Nothing reads the staging directory until finalize_staging.
+    """
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+    path = os.path.join(index_root, VERSIONS_DIR, STAGING_PREFIX + version)
+    os.makedirs(path)
+    return version, path
+
+
+def export_collections(vector_store_path: str, out_dir: str, version: str) -> Dict:
+    """
+    Exports every tool collection of a Chroma store as .npy matrices and writes the manifest.
+
+    Returns:
+        The manifest.
+    """
+    import chromadb
+
+    chroma_client = chromadb.PersistentClient(path=vector_store_path)
+    manifest = {"version": version, "created_at": time.time(), "collections": {}}
+    for name in TOOL_SOURCES:
+        try:
+            collection = chroma_client.get_collection(name=name)
+        except Exception:
+            logger.warning(f"Collection '{name}' not found in {vector_store_path}; skipping.")
+            continue
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        if vectors.ndim != 2:
+            vectors = vectors.reshape(len(data["ids"]), -1)
+        entry = {
+            "vectors": f"{name}.npy",
+            "norms": f"{name}.norms.npy",
+            "records": f"{name}.json",
+            "count": int(vectors.shape[0]),
+            "dimensions": int(vectors.shape[1]) if vectors.size else 0,
+            "quantized": export_quantized(vectors, out_dir, name),
+        }
+        np.save(os.path.join(out_dir, entry["vectors"]), vectors)
+        np.save(os.path.join(out_dir, entry["norms"]), (vectors * vectors).sum(axis=1))
+        with open(os.path.join(out_dir, entry["records"]), "w") as f:
+            json.dump({"ids": data["ids"], "documents": data["documents"], "metadatas": data["metadatas"]}, f)
+        manifest["collections"][name] = entry
+        logger.info(f"Exported {entry['count']} vectors for '{name}'.")
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def finalize_staging(version: str, index_root: str = VECTOR_INDEX_PATH) -> str:
+    """Moves a complete staging directory into versions/; returns its final path."""
+    final_path = version_path(version, index_root)
+    os.rename(os.path.join(index_root, VERSIONS_DIR, STAGING_PREFIX + version), final_path)
+    return final_path
+
+
+def publish_version(version: str, index_root: str = VECTOR_INDEX_PATH) -> None:
+    """Makes a completed version live by atomically replacing the `current` symlink."""
+    if not os.path.isfile(os.path.join(version_path(version, index_root), MANIFEST)):
+        raise ValueError(f"Unknown or incomplete index version: {version}")
+    tmp_link = os.path.join(index_root, f".{CURRENT}-{secrets.token_hex(4)}")
+    os.symlink(os.path.join(VERSIONS_DIR, version), tmp_link)
+    os.replace(tmp_link, os.path.join(index_root, CURRENT))
+    logger.info(f"Published vector index version {version}")
+    prune_versions(index_root)
+
+
+def prune_versions(index_root: str = VECTOR_INDEX_PATH, keep: int = INDEX_KEEP_VERSIONS) -> List[str]:
+    """Deletes old versions beyond the newest `keep`; the live version is always kept."""
+    live = current_version(index_root)
+    versions = list_versions(index_root)
+    removed = [v for v in versions[:-max(keep, 1)] if v != live]
+    for version in removed:
+        # Workers still mapping these files keep reading them until they swap
+        shutil.rmtree(version_path(version, index_root), ignore_errors=True)
+    return removed
+
+
+def rollback(to: Optional[str] = None, index_root: str = VECTOR_INDEX_PATH) -> str:
+    """
+    Republishes an earlier version.
+
+    Args:
+        to: The version to go back to; by default the newest one older than the live version.
+
+    Returns:
+        The version now live.
+    """
+    if to is None:
+        live = current_version(index_root)
+        older = [v for v in list_versions(index_root) if live is None or v < live]
+        if not older:
+            raise ValueError("No earlier index version to roll back to")
+        to = older[-1]
+    publish_version(to, index_root)
+    return to
+
+
+def import_store(vector_store_path: str = VECTOR_STORE_PATH, index_root: str = VECTOR_INDEX_PATH, publish: bool = True) -> str:
+    """Stages an existing Chroma store (e.g. the legacy backend/vector_store) as a new version."""
+    version, staging = create_staging(index_root)
+    chroma_path = os.path.join(staging, CHROMA_DIR)
+    shutil.copytree(vector_store_path, chroma_path)
+    export_collections(chroma_path, staging, version)
+    finalize_staging(version, index_root)
+    if publish:
+        publish_version(version, index_root)
+    return version
+
+
+class IndexRegistry:
+    """The loaded indexes of the live version, hot-swapped by a watcher thread."""
+
+    def __init__(self, index_root: str = VECTOR_INDEX_PATH, reload_interval: float = INDEX_RELOAD_INTERVAL):
+        self.index_root = index_root
+        self.reload_interval = reload_interval
+        # (version, manifest, indexes), replaced as a whole so readers never see a mix
+        self._state: Tuple[Optional[str], Optional[Dict], Dict[str, VectorIndex]] = (None, None, {})
+        self._watcher_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._loaders: List[Callable[[str, VectorIndex], None]] = []
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._state[0]
+
+    @property
+    def manifest(self) -> Optional[Dict]:
+        return self._state[1]
+
+    def _load(self, version: str):
+        manifest = read_manifest(version, self.index_root)
+        if manifest is None:
+            raise FileNotFoundError(f"Index version {version} has no manifest")
+        path = version_path(version, self.index_root)
+        indexes = {}
+        for name, entry in manifest["collections"].items():
+            index = VectorIndex.load(path, entry, version)
+            index.warm()
+            for loader in self._loaders:
+                loader(name, index)
+            indexes[name] = index
+        return version, manifest, indexes
+
+    def add_loader(self, loader: Callable[[str, VectorIndex], None]) -> None:
+        """
+        Registers a callback that prepares each collection's index before it is swapped in.
+
+        It also runs right away for the indexes already loaded.
+        """
+        self._loaders.append(loader)
+        for name, index in list(self._state[2].items()):
+            loader(name, index)
+
+    def refresh(self) -> bool:
+        """Swaps to the published version if it changed; returns whether it did."""
+        version = current_version(self.index_root)
+        if version == self._state[0]:
+            return False
+        try:
+            state = self._load(version) if version else (None, None, {})
+        except Exception as e:
+            logger.error(f"Could not load vector index version {version}; keeping {self._state[0]}: {e}")
+            return False
+        logger.info(f"Vector index swapped: {self._state[0]} -> {version}")
+        self._state = state
+        return True
+
+    def _ensure_watcher(self) -> None:
+        # Threads do not survive fork, so every worker process starts its own
+        if self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self.refresh()
+            threading.Thread(target=self._watch, name="vector-index-watcher", daemon=True).start()
+            self._watcher_pid = os.getpid()
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Vector index watcher failed: {e}")
+
+    def get(self, collection_name: str) -> Optional[VectorIndex]:
+        """The live index for a collection, or None when none is published for it."""
+        self._ensure_watcher()
+        return self._state[2].get(collection_name)
+
+    def warm_up(self) -> List[str]:
+        """Loads the live version now; returns its collection names."""
+        self._ensure_watcher()
+        return list(self._state[2])
+
+
+_registry = IndexRegistry()
+
+
+def get_vector_index(collection_name: str) -> Optional[VectorIndex]:
+    """The published index for a collection in this process, or None."""
+    return _registry.get(collection_name)
+
+
+def warm_up_vector_indexes() -> List[str]:
+    return _registry.warm_up()
+
+
+def add_index_loader(loader: Callable[[str, VectorIndex], None]) -> None:
+    """Runs loader on every collection index this process loads, before it goes live."""
+    _registry.add_loader(loader)
+
+
+def index_status(index_root: str = VECTOR_INDEX_PATH) -> Dict:
+    """What is live: the published version, the version this process serves, and rollback targets."""
+    _registry._ensure_watcher()
+    manifest = _registry.manifest
+    return {
+        "published_version": current_version(index_root),
+        "loaded_version": _registry.version,
+        "created_at": manifest["created_at"] if manifest else None,
+        "collections": {name: entry["count"] for name, entry in manifest["collections"].items()} if manifest else {},
+        "available_versions": list_versions(index_root),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the versioned vector index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List index versions and show which is live")
+    publish = sub.add_parser("publish", help="Make a version live")
+    publish.add_argument("version")
+    back = sub.add_parser("rollback", help="Republish an earlier version")
+    back.add_argument("--to", help="Version to roll back to (default: the one before the live version)")
+    store = sub.add_parser("import-store", help="Stage and publish an existing Chroma store as a new version")
+    store.add_argument("--vector-store", default=VECTOR_STORE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        live = current_version()
+        versions = list_versions()
+        if not versions:
+            print(f"No index versions in {VECTOR_INDEX_PATH}")
+        for version in versions:
+            manifest = read_manifest(version) or {"collections": {}}
+            counts = ", ".join(f"{name}: {entry['count']}" for name, entry in manifest["collections"].items())
+            print(f"{'*' if version == live else ' '} {version}  {counts}")
+    elif args.command == "publish":
+        publish_version(args.version)
+        print(f"Published {args.version}")
+    elif args.command == "rollback":
+        print(f"Rolled back to {rollback(args.to)}")
+    else:
+        print(f"Published {import_store(args.vector_store)} from {args.vector_store}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,29 @@
+import hashlib
+import json
+import os
+
 import streamlit as st
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from ui.ui import load_css, ui_topbar, ui_sidebar, ui_flow_tabs, landing_page
 
+BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000").rstrip("/")
+# Seconds between job polls
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "1"))
+# (connect, read) timeouts of a backend request; jobs return at once, so these stay short
+REQUEST_TIMEOUT = (3.05, 10)
+# Rendered flowcharts kept by st.cache_data, shared by all browser sessions
+SVG_CACHE_ENTRIES = int(os.getenv("SVG_CACHE_ENTRIES", "256"))
+
+STAGE_LABELS = {
+    None: "Queued…",
+    "structuring": "Structuring your requirements…",
+    "mapping": "Mapping steps to actions…",
+    "mermaid_validation": "Drawing the flowchart…",
+    "finalizing": "Finalizing the flowchart…",
+}
+
 st.set_page_config(
     page_title="FlowPilot",
     page_icon="🚀",
@@ -10,6 +31,154 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+
+@st.cache_resource
+def get_http_session():
+    """One pooled session shared by every browser session of this Streamlit server."""
+    session = requests.Session()
+    # Only polls are retried; resubmitting a job on a dropped POST would run the crew twice
+    retries = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def ensure_session(tool_choice):
+    """The backend session refined by this chat; switching tools starts a new one."""
+    if st.session_state.get("session_id") and st.session_state.get("session_tool") == tool_choice:
+        return st.session_state.session_id
+    response = get_http_session().post(f"{BACKEND_URL}/sessions", json={"tool_choice": tool_choice}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    st.session_state.session_id = response.json()["id"]
+    st.session_state.session_tool = tool_choice
+    st.session_state.flow = None
+    st.session_state.flow_hash = None
+    return st.session_state.session_id
+
+
+def submit_job(query, tool_choice):
+    """Starts a pipeline run on the backend and returns its job id."""
+    response = get_http_session().post(
+        f"{BACKEND_URL}/jobs",
+        # Follow-up turns come back as a patch against the flow this chat already holds
+        json={"query": query, "tool_choice": tool_choice, "session_id": ensure_session(tool_choice), "diagram_format": "patch"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code == 503:
+        retry_after = response.headers.get("Retry-After", "a few")
+        raise RuntimeError(f"The backend is busy; try again in {retry_after} seconds.")
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def patched_flow(flow, patch):
+    """The flow a diagram patch describes, built from the flow it was computed against."""
+    removed = set(patch["removed"])
+    replaced = {node["id"]: node for node in patch["relabeled"]}
+    moved = {item["id"]: item["position"] for item in patch["moved"]}
+    nodes = []
+    for node in flow["nodes"]:
+        if node["id"] in removed:
+            continue
+        node = replaced.get(node["id"], node)
+        if node["id"] in moved:
+            node = dict(node, position=moved[node["id"]])
+        nodes.append(node)
+    dropped = {(e["source"], e["target"], e.get("label") or "") for e in patch["edges_removed"]}
+    edges = [e for e in flow["edges"] if (e["source"], e["target"], e.get("label") or "") not in dropped]
+    return {"nodes": nodes + patch["added"], "edges": edges + patch["edges_added"]}
+
+
+def resolve_flow(result):
+    """Completes a session result with its full flow and remembers that flow as the base of the next patch."""
+    patch = result.get("diagram_patch")
+    if patch is None:
+        flow = result.get("flow_diagram_json") or None
+    elif st.session_state.get("flow_hash") == patch["base"]:
+        flow = patched_flow(st.session_state.flow, patch)
+    else:
+        # This chat does not hold the patch's base (e.g. a turn was lost); fetch the flow whole
+        response = get_http_session().get(f"{BACKEND_URL}/sessions/{result['session_id']}", timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        flow = response.json()["flow"]
+    st.session_state.flow = flow
+    st.session_state.flow_hash = result.get("diagram_hash")
+    result["flow_diagram_json"] = flow
+    return result
+
+
+@st.cache_data(max_entries=SVG_CACHE_ENTRIES, show_spinner=False)
+def fetch_svg(diagram_key, _flow):
+    """The backend's SVG rendering of a flow; keyed by diagram_key only (the flow itself is not hashed)."""
+    response = get_http_session().post(f"{BACKEND_URL}/render/svg", json=_flow, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.text
+
+
+def flow_svg(result):
+    """The flowchart of a result as SVG, or None to fall back to client-side Mermaid rendering."""
+    flow_json = result.get("flow_diagram_json")
+    if not flow_json:
+        return None
+    try:
+        flow = json.loads(flow_json) if isinstance(flow_json, str) else flow_json
+        if not flow.get("nodes"):
+            return None
+        diagram_key = hashlib.sha256(json.dumps(flow, sort_keys=True).encode("utf-8")).hexdigest()
+        return fetch_svg(diagram_key, flow)
+    except (ValueError, AttributeError, requests.exceptions.RequestException):
+        # Failures are not cached, so the next rerun tries the backend again
+        return None
+
+
+def render_result(index, result, latest):
+    """Draws a result; older results only draw their flowchart once expanded."""
+    if latest or st.toggle("Show flowchart", key=f"show_flow_{index}"):
+        ui_flow_tabs(result.get("mermaid_syntax"), result.get("structured_requirements"), flow_svg(result))
+    else:
+        with st.expander("Steps"):
+            st.markdown(result.get("structured_requirements"))
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def job_progress():
+    """Polls the running job, showing partial results until it finishes; only this fragment reruns."""
+    job_id = st.session_state.get("job_id")
+    if not job_id:
+        return
+    try:
+        response = get_http_session().get(f"{BACKEND_URL}/jobs/{job_id}", timeout=REQUEST_TIMEOUT)
+        if response.status_code == 404:
+            job = {"status": "failed", "error": "The backend no longer knows this run; please submit it again."}
+        else:
+            response.raise_for_status()
+            job = response.json()
+    except requests.exceptions.RequestException as e:
+        st.warning(f"Waiting for the backend: {e}")
+        return
+
+    if job["status"] in ("succeeded", "failed"):
+        st.session_state.job_id = None
+        if job["status"] == "succeeded":
+            try:
+                st.session_state.messages.append({"role": "assistant", "content": resolve_flow(job["result"])})
+            except requests.exceptions.RequestException as e:
+                st.session_state.job_error = f"Could not load the refined flowchart: {e}"
+        else:
+            st.session_state.job_error = job.get("error") or "The run failed."
+        # Redraw the whole page: the chat history gains the result and the input is enabled again
+        st.rerun()
+
+    with st.chat_message("assistant"):
+        st.caption(STAGE_LABELS.get(job.get("stage"), "Working…"))
+        steps = job.get("partial", {}).get("structured_requirements")
+        if steps:
+            st.markdown(steps)
+        else:
+            st.markdown("…")
+
+
 load_css()
 ui_topbar()
 ui_sidebar()
@@ -17,6 +186,8 @@ ui_sidebar()
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
 
 # Show landing page if no messages
 if not st.session_state.messages:
@@ -27,54 +198,41 @@ tool_options = ["-- Please select a tool --", "Power Automate", "Automation Anyw
 tool_choice_friendly = st.selectbox("Choose an RPA Tool", tool_options, key="tool_selection")
 
 # Display chat history
-for message in st.session_state.messages:
+latest_result = max((i for i, m in enumerate(st.session_state.messages) if isinstance(m["content"], dict)), default=None)
+for i, message in enumerate(st.session_state.messages):
     with st.chat_message(message["role"]):
         if isinstance(message["content"], dict):
-            ui_flow_tabs(
-                message["content"].get("mermaid_syntax"),
-                message["content"].get("structured_requirements")
-            )
+            render_result(i, message["content"], i == latest_result)
         else:
             st.markdown(message["content"])
 
-# Handle prompt from chat input
-if prompt := st.chat_input("Describe what you’d like to automate…"):
+if error := st.session_state.pop("job_error", None):
+    st.error(f"The backend could not process the request: {error}")
+
+# Handle prompt from chat input; disabled while a run is in progress
+if prompt := st.chat_input("Describe what you’d like to automate…", disabled=bool(st.session_state.job_id)):
     # Validate tool selection
     if tool_choice_friendly == "-- Please select a tool --":
         st.error("Please select an RPA tool from the dropdown before proceeding.")
         st.stop() # Stop execution to prevent further processing
 
-    st.session_state.prompt = prompt
+    # Map friendly name to collection name
+    tool_choice_map = {
+        "Power Automate": "power_automate",
+        "Automation Anywhere": "automation_anywhere"
+    }
 
-if "prompt" in st.session_state and st.session_state.prompt:
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": st.session_state.prompt})
-
-    # Display user message in chat message container
+    # Add user message to chat history and display it
+    st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
-        st.markdown(st.session_state.prompt)
+        st.markdown(prompt)
 
-    # Display assistant response in chat message container
-    with st.spinner("Thinking..."):
-            try:
-                # Map friendly name to collection name
-                tool_choice_map = {
-                    "Power Automate": "power_automate",
-                    "Automation Anywhere": "automation_anywhere"
-                }
-                tool_choice = tool_choice_map[tool_choice_friendly]
-
-                response = requests.get(f"http://127.0.0.1:8000/process-query?query={st.session_state.prompt}&tool_choice={tool_choice}")
-                response.raise_for_status()
-                results = response.json()
-
-                st.session_state.messages.append({"role": "assistant", "content": results})
-
-            except requests.exceptions.RequestException as e:
-                st.error(f"Error connecting to the backend: {e}")
-            except Exception as e:
-                st.error(f"An unexpected error occurred: {e}")
+    try:
+        st.session_state.job_id = submit_job(prompt, tool_choice_map[tool_choice_friendly])
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error connecting to the backend: {e}")
+    except Exception as e:
+        st.error(f"An unexpected error occurred: {e}")
 
-    # Clear the prompt and rerun
-    st.session_state.prompt = None
-    st.rerun()
\ No newline at end of file
+if st.session_state.job_id:
+    job_progress()
@@ -1,4 +1,5 @@
 import streamlit as st
+import base64
 import json
 
 def load_css():
@@ -24,10 +25,14 @@ def ui_sidebar():
         st.text_input("API Key", type="password", placeholder="Enter your API key")
 
 
-def ui_flow_tabs(mermaid_syntax, steps):
+def ui_flow_tabs(mermaid_syntax, steps, svg=None):
     tab1, tab2 = st.tabs(["Flowchart", "Steps"])
     with tab1:
-        if mermaid_syntax:
+        if svg:
+            # Pre-rendered by the backend: a static image, no Mermaid script to download or run
+            encoded = base64.b64encode(svg.encode("utf-8")).decode("ascii")
+            st.markdown(f'<img src="data:image/svg+xml;base64,{encoded}" style="width: 100%;" alt="Flowchart">', unsafe_allow_html=True)
+        elif mermaid_syntax:
             html_mermaid = f"""
             <div class="mermaid" style="height: 500px;">
                 {mermaid_syntax}
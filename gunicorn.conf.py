@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the multi-worker API deployment.
+
+    gunicorn -c gunicorn.conf.py backend.main:app
+
+The app is preloaded in the master and its read-only indexes (memory-mapped
+vector index, action catalogs) are warmed before workers fork, so all workers
+share those pages. Each worker runs its own event loop via UvicornWorker and
+picks up newly published vector index versions by itself. `kill -HUP` on the
+master also does a graceful rolling reload of all workers.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Crews can run for minutes; don't let the arbiter kill busy workers
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported and before any worker forks
+    from backend.main import warm_up
+
+    collections = warm_up()
+    server.log.info(f"Warmed vector indexes: {', '.join(collections) or 'none published'}")
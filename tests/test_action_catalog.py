@@ -0,0 +1,48 @@
+import json
+import os
+
+import pytest
+
+from backend.action_catalog import DATA_DIR, TOOL_SOURCES, Catalog, _normalize_actions, build_catalog, compile_catalog
+
+
+@pytest.mark.parametrize("tool", sorted(TOOL_SOURCES))
+def test_catalog_round_trips_the_json_source(tool, tmp_path):
+    source, tool_name = TOOL_SOURCES[tool]
+    with open(os.path.join(DATA_DIR, source), "r") as f:
+        actions = _normalize_actions(json.load(f), tool_name)
+    catalog = Catalog(build_catalog(tool, str(tmp_path / "catalog.fpcat")))
+
+    for action in actions:
+        assert catalog.get(action["action"], action.get("category")).to_dict() == action
+    assert len(catalog) == len({(a.get("category"), a["action"]) for a in actions})
+
+
+def test_get_without_category_and_get_all(tmp_path):
+    actions = [
+        {"tool": "T", "category": "Excel", "action": "Close", "description": "Close a workbook"},
+        {"tool": "T", "category": "Browser", "action": "Close", "description": "Close a tab"},
+        {"tool": "T", "category": "Excel", "action": "Open", "description": "Open a workbook",
+         "Input parameters": [{"Argument": "Path", "Type": "Text", "Description": "Workbook path"}]},
+    ]
+    path = str(tmp_path / "catalog.fpcat")
+    assert compile_catalog(actions, path) == 3
+    catalog = Catalog(path)
+    assert catalog.ids() == ["Close", "Close", "Open"]
+    assert catalog.get("Close").description == "Close a workbook"
+    assert [record.category for record in catalog.get_all("Close")] == ["Excel", "Browser"]
+    assert catalog.get("Close", "Browser").description == "Close a tab"
+    assert catalog.get("Open", "Browser") is None and "Missing" not in catalog
+    assert catalog.get("Open").to_dict()["Input parameters"] == actions[2]["Input parameters"]
+
+
+def test_repeated_actions(tmp_path):
+    action = {"tool": "T", "category": "Excel", "action": "Open", "description": "Open a workbook"}
+    path = str(tmp_path / "catalog.fpcat")
+    # The source repeats some packages word for word
+    assert compile_catalog([action, dict(action)], path) == 1
+    with pytest.raises(ValueError):
+        compile_catalog([action, dict(action, description="Something else")], path)
+    # A failed build leaves the previous catalog and no temp files
+    assert len(Catalog(path)) == 1
+    assert os.listdir(tmp_path) == ["catalog.fpcat"]
@@ -0,0 +1,99 @@
+import copy
+import random
+
+import pytest
+
+from backend.benchmarks.bench_layout import synthetic_flow
+from backend.diagram_diff import apply_patch, diagram_patch, flow_hash, stabilize_ids, update_flow
+
+
+def _relabel(flow, node_id, label):
+    edited = copy.deepcopy(flow)
+    for node in edited["nodes"]:
+        node.pop("position", None)
+        if node["id"] == node_id:
+            node["data"]["label"] = label
+    return edited
+
+
+@pytest.fixture
+def base():
+    flow = synthetic_flow(60, random.Random(3))
+    laid_out, patch, _ = update_flow(None, flow)
+    assert patch is None
+    return flow, laid_out
+
+
+def test_patch_round_trip(base):
+    flow, laid_out = base
+    edited = _relabel(flow, "30", "Send email through Outlook")
+    edited["nodes"].append({"id": "60", "data": {"label": "Archive the report"}, "shape": "rectangle"})
+    edited["edges"].append({"source": "59", "target": "60"})
+    new_flow, patch, _ = update_flow(laid_out, edited)
+    rebuilt = apply_patch(laid_out, patch)
+    assert flow_hash(rebuilt) == patch["hash"] == flow_hash(new_flow)
+    assert [node["id"] for node in patch["added"]] == ["60"]
+    assert [node["id"] for node in patch["relabeled"]] == ["30"]
+
+
+def test_untouched_ranks_are_not_moved(base):
+    flow, laid_out = base
+    # The last node sits alone in the last rank; relabeling it leaves every other rank clean
+    new_flow, patch, stats = update_flow(laid_out, _relabel(flow, "59", "A much longer label for the final step"))
+    assert stats["relaid_ranks"] == 1
+    assert patch["moved"] == []
+    old = {node["id"]: node["position"] for node in laid_out["nodes"]}
+    assert all(node["position"] == old[node["id"]] for node in new_flow["nodes"] if node["id"] != "59")
+
+
+def test_unchanged_flow_gives_an_empty_patch(base):
+    flow, laid_out = base
+    new_flow, patch, _ = update_flow(laid_out, flow)
+    assert patch["base"] == patch["hash"]
+    assert not any(patch[key] for key in ("added", "removed", "relabeled", "moved", "edges_added", "edges_removed"))
+
+
+def test_patch_applies_only_to_its_base(base):
+    flow, laid_out = base
+    _, patch, _ = update_flow(laid_out, _relabel(flow, "10", "Changed"))
+    other = copy.deepcopy(laid_out)
+    other["nodes"][0]["data"]["label"] = "Something else"
+    with pytest.raises(ValueError):
+        apply_patch(other, patch)
+
+
+def test_renumbered_nodes_keep_their_ids():
+    old = {
+        "nodes": [{"id": "1", "data": {"label": "Launch Excel"}}, {"id": "2", "data": {"label": "Read cell"}},
+                  {"id": "3", "data": {"label": "Close Excel"}}],
+        "edges": [{"source": "1", "target": "2"}, {"source": "2", "target": "3"}],
+    }
+    new = {
+        "nodes": [{"id": "1", "data": {"label": "Log in"}}, {"id": "2", "data": {"label": "Launch Excel"}},
+                  {"id": "3", "data": {"label": "Read cell"}}, {"id": "4", "data": {"label": "Close Excel"}}],
+        "edges": [{"source": "1", "target": "2"}, {"source": "2", "target": "3"}, {"source": "3", "target": "4"}],
+    }
+    stabilized, renamed = stabilize_ids(old, new)
+    assert renamed["2"] == "1" and renamed["3"] == "2" and renamed["4"] == "3"
+    assert renamed["1"] not in {"1", "2", "3"}
+    assert {(e["source"], e["target"]) for e in stabilized["edges"]} == {(renamed["1"], "1"), ("1", "2"), ("2", "3")}
+
+
+def test_patch_of_hand_built_flows():
+    old = {"nodes": [{"id": "a", "data": {"label": "A"}, "shape": "rectangle", "position": {"x": 0.0, "y": 0.0, "width": 1.0, "height": 1.0}}],
+           "edges": []}
+    new = {"nodes": [{"id": "a", "data": {"label": "A"}, "shape": "rectangle", "position": {"x": 5.0, "y": 0.0, "width": 1.0, "height": 1.0}},
+                     {"id": "b", "data": {"label": "B"}, "shape": "rectangle", "position": {"x": 0.0, "y": 2.0, "width": 1.0, "height": 1.0}}],
+           "edges": [{"source": "a", "target": "b"}]}
+    patch = diagram_patch(old, new)
+    assert patch["moved"] == [{"id": "a", "position": new["nodes"][0]["position"]}]
+    assert patch["edges_added"] == [{"source": "a", "target": "b"}]
+    assert flow_hash(apply_patch(old, patch)) == flow_hash(new)
+
+
+def test_stabilized_nodes_keep_their_data():
+    old = {"nodes": [{"id": "1", "data": {"label": "Launch Excel"}}], "edges": []}
+    new = {"nodes": [{"id": "7", "data": {"label": "Launch Excel", "original_label": "Open Excel"}, "shape": "rectangle"}],
+           "edges": []}
+    stabilized, _ = stabilize_ids(old, new)
+    assert stabilized["nodes"] == [{"id": "1", "data": {"label": "Launch Excel", "original_label": "Open Excel"}, "shape": "rectangle"}]
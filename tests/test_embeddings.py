@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import backend.embeddings
+from backend.embeddings import EmbeddingQueueFull, EmbeddingScheduler
+
+
+class FakeEmbeddings:
+    """Stands in for aembed_texts; each text embeds to [len(text)]."""
+
+    def __init__(self, error=None):
+        self.requests = []
+        self.error = error
+        # Requests wait here until the test lets them finish
+        self.release = threading.Event()
+        self.release.set()
+
+    async def __call__(self, texts):
+        self.requests.append(list(texts))
+        while not self.release.is_set():
+            await asyncio.sleep(0.001)
+        if self.error:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(backend.embeddings, "aembed_texts", fake)
+    return fake
+
+
+async def _gather(scheduler, texts):
+    return await asyncio.gather(*(scheduler.aembed(text) for text in texts), return_exceptions=True)
+
+
+def test_concurrent_calls_share_one_request(fake):
+    scheduler = EmbeddingScheduler(window_ms=50)
+    texts = ["open", "read cell", "open", "send email"]
+    assert asyncio.run(_gather(scheduler, texts)) == [[4.0], [9.0], [4.0], [10.0]]
+    # Identical texts in a batch are sent once
+    assert fake.requests == [["open", "read cell", "send email"]]
+    stats = scheduler.stats()
+    assert (stats["texts"], stats["batches"], stats["upstream_inputs"]) == (4, 1, 3)
+
+
+def test_a_failed_request_fails_every_caller(fake):
+    fake.error = RuntimeError("upstream unavailable")
+    scheduler = EmbeddingScheduler(window_ms=50)
+    results = asyncio.run(_gather(scheduler, ["a", "b", "c"]))
+    assert len(fake.requests) == 1
+    assert all(result is fake.error for result in results)
+    assert scheduler.stats()["failed_batches"] == 1
+
+
+def test_thread_callers_are_batched_too(fake):
+    scheduler = EmbeddingScheduler(window_ms=50)
+    futures = [scheduler.submit(text) for text in ("a", "bb")]
+    assert [future.result(timeout=5) for future in futures] == [[1.0], [2.0]]
+    assert fake.requests == [["a", "bb"]]
+
+
+def test_full_queue_rejects(fake):
+    fake.release.clear()
+    scheduler = EmbeddingScheduler(window_ms=0, max_batch=1, max_inflight=1, max_queue=1, queue_timeout=0.05)
+    sending = scheduler.submit("sent")
+    while not fake.requests:
+        time.sleep(0.001)
+    # The only sender is busy, so the next text fills the queue
+    queued = scheduler.submit("queued")
+    with pytest.raises(EmbeddingQueueFull):
+        scheduler.submit("rejected")
+    with pytest.raises(EmbeddingQueueFull):
+        asyncio.run(scheduler.aembed("rejected"))
+    assert scheduler.stats()["rejected"] == 2
+    fake.release.set()
+    assert sending.result(timeout=5) == [4.0] and queued.result(timeout=5) == [6.0]
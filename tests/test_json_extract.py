@@ -0,0 +1,109 @@
+import pytest
+
+from backend.json_extract import (
+    JsonObjectStream,
+    MalformedOutput,
+    extract_json_object,
+    parse_flow,
+    stream_flow,
+    validate_flow,
+)
+
+
+def test_bare_object():
+    assert extract_json_object('{"a": 1}') == {"a": 1}
+
+
+def test_object_wrapped_in_prose_and_fences():
+    text = 'Here is the flow:\n```json\n{"nodes": [], "edges": []}\n```\nLet me know if it needs changes.'
+    assert extract_json_object(text) == {"nodes": [], "edges": []}
+
+
+def test_braces_and_escaped_quotes_inside_strings():
+    text = 'Result: {"label": "Use {x} and \\"}\\" here", "nested": {"list": [1, {"b": 2}]}} done'
+    assert extract_json_object(text) == {"label": 'Use {x} and "}" here', "nested": {"list": [1, {"b": 2}]}}
+
+
+def test_first_balanced_object_wins():
+    assert extract_json_object('{"first": 1} and then {"second": 2}') == {"first": 1}
+
+
+def test_prose_braces_are_skipped():
+    assert extract_json_object('Replace {label} with the action: {"label": "Launch Excel"}') == {"label": "Launch Excel"}
+
+
+def test_trailing_commas_are_repaired():
+    stream = JsonObjectStream()
+    stream.feed('{"nodes": [{"id": "1",}, {"id": "2"},], "edges": [],}')
+    assert stream.close() == {"nodes": [{"id": "1"}, {"id": "2"}], "edges": []}
+    assert stream.repaired
+
+
+def test_commas_inside_strings_are_kept():
+    assert extract_json_object('{"label": "a, }", "b": [1,],}') == {"label": "a, }", "b": [1]}
+
+
+def test_no_object():
+    with pytest.raises(MalformedOutput):
+        extract_json_object("I could not map these steps.")
+
+
+def test_truncated_object():
+    stream = JsonObjectStream()
+    stream.feed('{"nodes": [{"id": "1"')
+    with pytest.raises(MalformedOutput, match="Truncated"):
+        stream.close()
+
+
+def test_stream_returns_once_the_object_closes():
+    stream = JsonObjectStream()
+    assert stream.feed('Sure. {"a": "x\\') is None
+    assert stream.feed('"y"') is None
+    assert stream.feed('} trailing prose') == {"a": 'x"y'}
+
+
+def test_stream_gives_up_after_max_prose():
+    stream = JsonObjectStream(max_prose=10)
+    with pytest.raises(MalformedOutput):
+        stream.feed("no object in this rather long answer")
+
+
+def test_stream_flow_stops_reading_at_the_end_of_the_object():
+    read = []
+
+    def chunks():
+        for chunk in ('{"nodes": [{"id": 1, "label": "Start"}],', ' "edges": []}', "never read"):
+            read.append(chunk)
+            yield chunk
+
+    assert stream_flow(chunks()) == {"nodes": [{"id": "1", "data": {"label": "Start"}, "shape": "rectangle"}], "edges": []}
+    assert "never read" not in read
+
+
+def test_validate_flow_normalizes_ids_and_labels():
+    flow = validate_flow({
+        "nodes": [{"id": 1, "label": "Launch Excel"}, {"id": "2", "data": {"label": "Close Excel"}, "shape": "rectangle"}],
+        "edges": [{"source": 1, "target": 2}],
+    })
+    assert flow == {
+        "nodes": [
+            {"id": "1", "data": {"label": "Launch Excel"}, "shape": "rectangle"},
+            {"id": "2", "data": {"label": "Close Excel"}, "shape": "rectangle"},
+        ],
+        "edges": [{"source": "1", "target": "2"}],
+    }
+
+
+@pytest.mark.parametrize("flow, message", [
+    ({"edges": []}, "schema"),
+    ({"nodes": [{"label": "No id"}]}, "schema"),
+    ({"nodes": [{"id": "1", "label": "A"}, {"id": "1", "label": "B"}]}, "Repeated node ids"),
+    ({"nodes": [{"id": "1", "label": "A"}], "edges": [{"source": "1", "target": "9"}]}, "unknown nodes"),
+])
+def test_validate_flow_rejects(flow, message):
+    with pytest.raises(MalformedOutput, match=message):
+        validate_flow(flow)
+
+
+def test_parse_flow():
+    assert parse_flow('```json\n{"nodes": [{"id": "1", "label": "A"},], "edges": []}\n```')["nodes"][0]["data"] == {"label": "A"}
@@ -0,0 +1,51 @@
+import pytest
+
+from backend.benchmarks.bench_layout import straight_line_crossings
+from backend.layered_layout import isotonic_positions, layered_layout, rank_nodes
+
+SIZE = (120.0, 40.0)
+
+
+def _crossings(positions, edges):
+    nodes = [{"id": node, "position": {"x": x, "y": y, "width": SIZE[0], "height": SIZE[1]}}
+             for node, (x, y) in positions.items()]
+    return straight_line_crossings(nodes, [{"source": u, "target": v} for u, v in edges])
+
+
+@pytest.mark.parametrize("ordering", ["median", "barycenter"])
+def test_known_crossing_is_removed(ordering):
+    # In flow order, b -> f crosses c -> e; swapping b and c removes it
+    ids = ["a", "b", "c", "d", "e", "f"]
+    edges = [("a", "e"), ("b", "f"), ("c", "e"), ("d", "f")]
+    positions, stats = layered_layout(ids, {node: SIZE for node in ids}, edges, ordering=ordering)
+    assert (stats["initial_crossings"], stats["crossings"]) == (1, 0)
+    assert _crossings(positions, edges) == 0
+    top = sorted("abcd", key=lambda node: positions[node][0])
+    assert {frozenset(top[:2]), frozenset(top[2:])} == {frozenset("ac"), frozenset("bd")}
+    # Each merge sits between its two inputs
+    for merge, inputs in (("e", "ac"), ("f", "bd")):
+        left, right = sorted(positions[node][0] for node in inputs)
+        assert left <= positions[merge][0] <= right
+
+
+def test_ranks_spacing_and_long_edges():
+    ids = ["start", "check", "yes", "no", "end"]
+    edges = [("start", "check"), ("check", "yes"), ("check", "no"), ("yes", "end"), ("no", "end"), ("start", "end")]
+    positions, stats = layered_layout(ids, {node: SIZE for node in ids}, edges, x_spacing=80, y_spacing=150)
+    assert [positions[node][1] for node in ids] == [0.0, 190.0, 380.0, 380.0, 570.0]
+    assert abs(positions["yes"][0] - positions["no"][0]) >= SIZE[0] + 80
+    # start -> end passes two ranks through dummy nodes
+    assert (stats["ranks"], stats["dummies"], stats["crossings"]) == (4, 2, 0)
+
+
+def test_cycles_keep_the_start_on_top():
+    ranks = rank_nodes(["open", "read", "retry"], [("open", "read"), ("read", "retry"), ("retry", "read")])
+    assert ranks == {"open": 0, "read": 1, "retry": 2}
+    _, stats = layered_layout(["open", "read", "retry"], {n: SIZE for n in ("open", "read", "retry")},
+                              [("open", "read"), ("read", "retry"), ("retry", "read")])
+    assert stats["reversed_edges"] == 1
+
+
+def test_isotonic_positions_keep_order_and_gaps():
+    assert isotonic_positions([0.0, 0.0, 0.0], [10.0, 10.0]) == [-10.0, 0.0, 10.0]
+    assert isotonic_positions([0.0, 50.0], [10.0]) == [0.0, 50.0]
@@ -0,0 +1,109 @@
+import copy
+
+from backend.refinement import apply_flow_edits, apply_step_edits
+
+STEPS = ["Open the report", "Read the totals", "Email the totals"]
+
+
+def test_replace_insert_and_delete():
+    steps, changes = apply_step_edits(STEPS, [
+        {"op": "replace", "step": 2, "text": "Read the totals and dates"},
+        {"op": "insert", "after": 0, "text": "Log in"},
+        {"op": "insert", "after": 3, "text": "Archive the report"},
+        {"op": "delete", "step": 1},
+    ])
+    assert steps == ["Log in", "Read the totals and dates", "Email the totals", "Archive the report"]
+    assert changes == [
+        {"op": "insert", "text": "Log in"},
+        {"op": "delete", "was": "Open the report"},
+        {"op": "replace", "was": "Read the totals", "text": "Read the totals and dates"},
+        {"op": "insert", "text": "Archive the report"},
+    ]
+
+
+def test_edits_are_numbered_against_the_current_steps():
+    steps, _ = apply_step_edits(STEPS, [{"op": "delete", "step": 1}, {"op": "replace", "step": 3, "text": "Text the totals"}])
+    assert steps == ["Read the totals", "Text the totals"]
+
+
+def test_invalid_step_edits_are_skipped():
+    steps, changes = apply_step_edits(STEPS, [
+        {"op": "replace", "step": 7, "text": "Out of range"},
+        {"op": "delete", "step": "two"},
+        {"op": "insert", "after": 1, "text": "  "},
+        {"op": "rename"},
+        {"op": "replace", "step": 1, "text": "Open the report"},
+    ])
+    assert steps == STEPS
+    assert changes == []
+
+
+FLOW = {
+    "nodes": [
+        {"id": "1", "data": {"label": "Launch Excel"}, "shape": "rectangle", "position": {"x": 0, "y": 0, "width": 1, "height": 1}},
+        {"id": "2", "data": {"label": "If totals exist"}, "shape": "diamond"},
+        {"id": "3", "data": {"label": "Send email"}, "shape": "rectangle"},
+    ],
+    "edges": [{"source": "1", "target": "2"}, {"source": "2", "target": "3", "label": "True"}],
+}
+
+
+def test_flow_edits():
+    flow = apply_flow_edits(FLOW, {
+        "update_nodes": [{"id": "3", "data": {"label": "Send email through Outlook"}}],
+        "add_nodes": [{"id": "4", "data": {"label": "Close Excel"}}],
+        "add_edges": [{"source": "2", "target": "4", "label": "False"}, {"source": "3", "target": "4"}],
+    })
+    assert flow["nodes"] == [
+        {"id": "1", "data": {"label": "Launch Excel"}, "shape": "rectangle"},
+        {"id": "2", "data": {"label": "If totals exist"}, "shape": "diamond"},
+        {"id": "3", "data": {"label": "Send email through Outlook"}, "shape": "rectangle"},
+        {"id": "4", "data": {"label": "Close Excel"}, "shape": "rectangle"},
+    ]
+    assert flow["edges"][2:] == [{"source": "2", "target": "4", "label": "False"}, {"source": "3", "target": "4"}]
+
+
+def test_removed_nodes_take_their_edges():
+    flow = apply_flow_edits(FLOW, {"remove_nodes": [2]})
+    assert [node["id"] for node in flow["nodes"]] == ["1", "3"]
+    assert flow["edges"] == []
+
+
+def test_added_node_with_a_taken_id_is_renamed():
+    flow = apply_flow_edits(FLOW, {
+        "add_nodes": [{"id": "3", "data": {"label": "Log the result"}}],
+        "add_edges": [{"source": "3", "target": "1"}],
+    })
+    assert flow["nodes"][-1] == {"id": "3_1", "data": {"label": "Log the result"}, "shape": "rectangle"}
+    # Edges to the added node follow its new id
+    assert flow["edges"][-1] == {"source": "3_1", "target": "1"}
+
+
+def test_removed_then_re_added_id_is_not_renamed():
+    flow = apply_flow_edits(FLOW, {"remove_nodes": ["3"], "add_nodes": [{"id": "3", "data": {"label": "Send SMS"}}],
+                                   "add_edges": [{"source": "2", "target": "3", "label": "True"}]})
+    assert flow["nodes"][-1]["id"] == "3"
+    assert flow["edges"] == [{"source": "1", "target": "2"}, {"source": "2", "target": "3", "label": "True"}]
+
+
+def test_edges_to_unknown_nodes_and_duplicates_are_dropped():
+    flow = apply_flow_edits(FLOW, {
+        "add_edges": [{"source": "1", "target": "9"}, {"source": "1", "target": "2"}],
+        "remove_edges": [{"source": "2", "target": "3"}],
+        "update_nodes": [{"id": "9", "data": {"label": "Unknown"}}],
+    })
+    assert flow["edges"] == [{"source": "1", "target": "2"}]
+    assert len(flow["nodes"]) == 3
+
+
+def test_validation_provenance_is_kept_until_the_label_changes():
+    flow = copy.deepcopy(FLOW)
+    flow["nodes"][0]["data"]["original_label"] = "Open Excel"
+    flow["nodes"][2]["data"]["original_label"] = "Email it"
+    edited = apply_flow_edits(flow, {
+        "update_nodes": [{"id": "1", "shape": "rectangle"}, {"id": "3", "data": {"label": "Send SMS"}}],
+        "add_nodes": [{"id": "4", "data": {"label": "Close Excel", "original_label": "Quit Excel"}}],
+    })
+    assert edited["nodes"][0]["data"] == {"label": "Launch Excel", "original_label": "Open Excel"}
+    assert edited["nodes"][2]["data"] == {"label": "Send SMS"}
+    assert edited["nodes"][3]["data"] == {"label": "Close Excel", "original_label": "Quit Excel"}
@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from backend.vector_index import (
+    MANIFEST,
+    IndexRegistry,
+    current_version,
+    list_versions,
+    publish_version,
+    rollback,
+    version_path,
+)
+
+
+def _write_version(root, version, ids):
+    """A completed version with one power_automate collection holding ids."""
+    path = version_path(version, str(root))
+    os.makedirs(path)
+    vectors = np.eye(len(ids), dtype=np.float32)
+    np.save(os.path.join(path, "power_automate.npy"), vectors)
+    np.save(os.path.join(path, "power_automate.norms.npy"), (vectors * vectors).sum(axis=1))
+    with open(os.path.join(path, "power_automate.json"), "w") as f:
+        json.dump({"ids": ids, "documents": ids, "metadatas": [{} for _ in ids]}, f)
+    entry = {"vectors": "power_automate.npy", "norms": "power_automate.norms.npy", "records": "power_automate.json",
+             "count": len(ids), "dimensions": len(ids), "quantized": {}}
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump({"version": version, "created_at": 0.0, "collections": {"power_automate": entry}}, f)
+
+
+@pytest.fixture
+def root(tmp_path):
+    _write_version(tmp_path, "20240101-000000-aaaaaa", ["Launch Excel", "Close Excel"])
+    _write_version(tmp_path, "20240102-000000-bbbbbb", ["Launch Excel", "Close Excel", "Send email"])
+    return tmp_path
+
+
+def test_publish_and_rollback(root):
+    old, new = list_versions(str(root))
+    assert current_version(str(root)) is None
+    publish_version(old, str(root))
+    publish_version(new, str(root))
+    assert current_version(str(root)) == new
+    assert rollback(index_root=str(root)) == old
+    assert current_version(str(root)) == old
+    # Nothing is older than the first version
+    with pytest.raises(ValueError):
+        rollback(index_root=str(root))
+    assert rollback(to=new, index_root=str(root)) == new
+
+
+def test_incomplete_versions_are_not_published(root):
+    os.makedirs(version_path("20240103-000000-cccccc", str(root)))
+    with pytest.raises(ValueError):
+        publish_version("20240103-000000-cccccc", str(root))
+    assert current_version(str(root)) is None
+
+
+def test_registry_swaps_to_the_published_version(root):
+    old, new = list_versions(str(root))
+    # The watcher that get() starts stays asleep; the test swaps versions with refresh()
+    registry = IndexRegistry(str(root), reload_interval=3600)
+    assert not registry.refresh() and registry.version is None
+
+    publish_version(old, str(root))
+    assert registry.refresh()
+    before = registry.get("power_automate")
+    assert len(before) == 2
+
+    publish_version(new, str(root))
+    assert registry.refresh() and not registry.refresh()
+    after = registry.get("power_automate")
+    assert (registry.version, after.version, len(after)) == (new, new, 3)
+    assert after.query([0.0, 0.0, 1.0], n_results=1)["ids"] == [["Send email"]]
+    # Queries holding the previous index still read its version
+    assert before.query([1.0, 0.0], n_results=1)["ids"] == [["Launch Excel"]]
+
+
+def test_registry_keeps_serving_when_a_version_fails_to_load(root):
+    old, new = list_versions(str(root))
+    registry = IndexRegistry(str(root), reload_interval=3600)
+    publish_version(old, str(root))
+    registry.refresh()
+    os.remove(os.path.join(version_path(new, str(root)), "power_automate.npy"))
+    publish_version(new, str(root))
+    assert not registry.refresh()
+    assert registry.version == old